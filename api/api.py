@@ -1,5 +1,6 @@
 print('Inicializando a estrutura da API...\nImportando as bibliotecas...')
 import uuid
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Query, Request
 from fastapi.responses import FileResponse, HTMLResponse, StreamingResponse
 from sentence_transformers import SentenceTransformer
@@ -7,16 +8,28 @@ from starlette.middleware.cors import CORSMiddleware
 
 from api.configuracoes.config_gerais import configuracoes
 from api.gerador_de_respostas import GeradorDeRespostas
-from api.utils.interface_banco_vetores import FuncaoEmbeddings, InterfaceChroma
+from api.utils.indice_bm25 import IndiceBM25
+from api.utils.interface_banco_vetores import FuncaoEmbeddings, InterfaceChroma, InterfaceHibrida, InterfaceMatrizVetorial
 from api.utils.interface_llm import DadosChat, InterfaceOllama
 from api.dados.persistencia import GerenciadorPersistenciaSQL, GerenciadorPersistenciaSQLite
+from api.dados.escritor_persistencia import EscritorPersistencia
 from api.utils.reclassificador import ReclassificadorBert
+from api.utils.roteador_documentos import RoteadorDocumentos
 from api.utils.classificador_de_intencao import ClassificadorIntencaoEmbeddings
-
-classificador_de_intencao = ClassificadorIntencaoEmbeddings()
+from api.utils.cache import CacheLRU, CacheRespostas, CacheSQLite
+from api.utils.texto import normalizar_string
+from api.utils.seletor_contexto import SeletorContexto, criar_contador_tokens
+
+@asynccontextmanager
+async def ciclo_de_vida(app: FastAPI):
+    # inicialização da aplicação
+    await gerador_de_respostas.iniciar()
+    yield
+    # encerramento da aplicação
+    await gerador_de_respostas.encerrar()
 
 print('Instanciando a api (FastAPI)...')
-controller = FastAPI()
+controller = FastAPI(lifespan=ciclo_de_vida)
 controller.add_middleware(
     CORSMiddleware,
     allow_origins=['*'],  # Allow all origins
@@ -29,26 +42,83 @@ fazer_log = True
 
 print(f'Criando GeradorDeRespostas (usando {configuracoes.modelo_funcao_de_embeddings} - device={configuracoes.device})...')
 print(f'--- criando a função de embeddings do ChromaDB com {configuracoes.modelo_funcao_de_embeddings} (device={configuracoes.device})...')
+caches = {}
+if configuracoes.usar_cache_embeddings:
+    # perguntas repetidas (mesmo texto, após normalização de acentos, caixa e espaços) não passam novamente pelo modelo
+    caches['embeddings_perguntas'] = CacheLRU(
+        capacidade=configuracoes.cache_embeddings_capacidade,
+        ttl=configuracoes.cache_embeddings_ttl,
+        funcao_chave=normalizar_string)
+cache_respostas = None
+if configuracoes.usar_cache_respostas:
+    # respostas do fluxo RAG reaproveitadas para perguntas semanticamente equivalentes
+    cache_respostas = CacheRespostas(
+        capacidade=configuracoes.cache_respostas_capacidade,
+        limiar_similaridade=configuracoes.cache_respostas_limiar_similaridade,
+        ttl=configuracoes.cache_respostas_ttl)
+    caches['respostas'] = cache_respostas
 funcao_de_embeddings = FuncaoEmbeddings(
     nome_modelo=configuracoes.modelo_funcao_de_embeddings,
     tipo_modelo=SentenceTransformer,
-    device=configuracoes.device)
-
-interface_banco_vetorial = InterfaceChroma(
-    url_banco_vetores=configuracoes.url_banco_vetores,
-    colecao_de_documentos=configuracoes.nome_colecao_de_documentos,
-    funcao_de_embeddings=funcao_de_embeddings,
-    fazer_log=fazer_log)
-
-reclassificador_bert = ReclassificadorBert(device=configuracoes.device, fazer_log=fazer_log)
+    device=configuracoes.device,
+    cache=caches.get('embeddings_perguntas'))
+
+# O classificador de intenção foi treinado com embeddings do bge-m3. Se a função de embeddings do banco vetorial
+# utiliza o mesmo modelo, a instância é compartilhada e a pergunta é convertida em embeddings uma só vez
+compartilhar_embeddings = configuracoes.modelo_funcao_de_embeddings == configuracoes.embedding_bge_m3
+classificador_de_intencao = ClassificadorIntencaoEmbeddings(embedder=funcao_de_embeddings if compartilhar_embeddings else None)
+
+if configuracoes.tipo_banco_vetorial == 'matriz':
+    interface_banco_vetorial = InterfaceMatrizVetorial(
+        url_matriz_vetorial=configuracoes.url_matriz_vetorial,
+        funcao_de_embeddings=funcao_de_embeddings,
+        fazer_log=fazer_log)
+else:
+    interface_banco_vetorial = InterfaceChroma(
+        url_banco_vetores=configuracoes.url_banco_vetores,
+        colecao_de_documentos=configuracoes.nome_colecao_de_documentos,
+        funcao_de_embeddings=funcao_de_embeddings,
+        fazer_log=fazer_log)
+
+if configuracoes.usar_busca_hibrida:
+    if fazer_log: print(f'--- carregando índice BM25 para a busca híbrida (usando "{configuracoes.url_indice_bm25}")...')
+    interface_banco_vetorial = InterfaceHibrida(
+        interface_densa=interface_banco_vetorial,
+        indice_lexico=IndiceBM25.carregar(configuracoes.url_indice_bm25),
+        funcao_de_embeddings=funcao_de_embeddings)
+
+cache_reclassificacao = None
+cache_disco_reclassificacao = None
+if configuracoes.usar_cache_reclassificacao:
+    cache_reclassificacao = CacheLRU(capacidade=configuracoes.cache_reclassificacao_capacidade)
+    caches['reclassificacao'] = cache_reclassificacao
+    if configuracoes.url_cache_reclassificacao:
+        cache_disco_reclassificacao = CacheSQLite(url_arquivo=configuracoes.url_cache_reclassificacao)
+        caches['reclassificacao_disco'] = cache_disco_reclassificacao
+reclassificador_bert = ReclassificadorBert(
+    device=configuracoes.device,
+    fazer_log=fazer_log,
+    cache=cache_reclassificacao,
+    cache_disco=cache_disco_reclassificacao)
 
 if fazer_log: print(f'--- preparando o Ollama (usando {configuracoes.modelo_llm})...')
 interface_llm = InterfaceOllama(url_ollama=configuracoes.url_llm, nome_modelo=configuracoes.modelo_llm)
 
+seletor_contexto = None
+if configuracoes.usar_selecao_contexto:
+    if fazer_log: print(f'--- preparando o seletor de contexto (tokenizador: {configuracoes.tokenizador_llm or "estimativa"})...')
+    seletor_contexto = SeletorContexto(contador_tokens=criar_contador_tokens(configuracoes.tokenizador_llm))
+
+roteador_documentos = None
+if configuracoes.usar_roteador_documentos:
+    if fazer_log: print('--- preparando o roteador de documentos por palavras-chave...')
+    roteador_documentos = RoteadorDocumentos(indice_documentos=configuracoes.documentos)
+
 tipo_persistencia = configuracoes.configuracoes_ambiente()['tipo_persistencia']
 if fazer_log: print(f'--- configurando persistência de dados de interação (usando {tipo_persistencia})...')
 if tipo_persistencia == 'sqlite': gerenciador_persistencia = GerenciadorPersistenciaSQLite()
 elif tipo_persistencia == 'mssql': gerenciador_persistencia = GerenciadorPersistenciaSQL()
+escritor_persistencia = EscritorPersistencia(gerenciador_persistencia) if configuracoes.usar_escritor_persistencia else None
 
 gerador_de_respostas = GeradorDeRespostas(
     interface_banco_vetorial=interface_banco_vetorial,
@@ -56,7 +126,13 @@ gerador_de_respostas = GeradorDeRespostas(
     interface_llm=interface_llm,
     gerenciador_persistencia=gerenciador_persistencia,
     device=configuracoes.device,
-    fazer_log=fazer_log)
+    fazer_log=fazer_log,
+    funcao_de_embeddings=funcao_de_embeddings,
+    caches=caches,
+    cache_respostas=cache_respostas,
+    seletor_contexto=seletor_contexto,
+    escritor_persistencia=escritor_persistencia,
+    roteador_documentos=roteador_documentos)
 
 print('Definindo as rotas')
 
@@ -79,7 +155,7 @@ def recuperar_pagina_chat(request: Request, url_redirec: str = Query(None)):
 
 @controller.get('/chat/health')
 async def chat_health():
-    return gerador_de_respostas.health()
+    return await gerador_de_respostas.health()
 
 @controller.get('/')
 async def raiz(request: Request, url_redirec: str = Query(None)):
@@ -91,9 +167,13 @@ async def pagina_chat(request: Request, url_redirec: str = Query(None)):
 
 @controller.post('/chat/enviar-pergunta/')
 async def gerar_resposta(dadosRecebidos: DadosChat):
-    dadosRecebidos.intencao = classificador_de_intencao.classificar_intencao(dadosRecebidos.pergunta)
+    embeddings_pergunta = await gerador_de_respostas.gerar_embeddings_pergunta(dadosRecebidos.pergunta)
+    dadosRecebidos.intencao = await gerador_de_respostas.classificar_intencao(
+        classificador_de_intencao,
+        dadosRecebidos.pergunta,
+        embeddings_pergunta=embeddings_pergunta if compartilhar_embeddings else None)
     return StreamingResponse(
-        gerador_de_respostas.gerar_resposta(dadosRecebidos),
+        gerador_de_respostas.gerar_resposta(dadosRecebidos, embeddings_pergunta=embeddings_pergunta),
         media_type='text/plain'
     )
 
@@ -15,6 +15,14 @@ class ConfiguracoesAplicacao:
             mensagens = json.load(arq)
             
         self.threadpool_max_workers=configs['threadpool_max_workers']
+        # quantidade máxima de execuções simultâneas de cada etapa bloqueante do pipeline
+        self.limites_concorrencia_etapas=configs.get('limites_concorrencia_etapas', {
+            'embeddings': 4,
+            'classificacao_intencao': 4,
+            'consulta': 4,
+            'reclassificacao': 2,
+            'persistencia': 4
+        })
         
         self.url_pasta_documentos = os.path.normpath(configs['url_pasta_documentos'])
         self.url_pasta_bancos_vetores = os.path.normpath(configs['url_pasta_bancos_vetores'])
@@ -22,6 +30,28 @@ class ConfiguracoesAplicacao:
         self.nome_colecao_de_documentos = configs['nome_colecao_de_documentos']
         self.num_maximo_palavras_por_fragmento = configs['num_maximo_palavras_por_fragmento']
         self.hnsw_space = configs['hnsw_space'] # métrica a ser utilizada pelo banco vetorial para medir similaridade de vetores
+        # implementação do banco vetorial usada pela API: 'chroma' ou 'matriz' (matriz de embeddings em memória, exportada
+        # da coleção com api.dados.exportar_matriz_vetorial, consultada por busca exata sem o ChromaDB)
+        self.tipo_banco_vetorial = configs.get('tipo_banco_vetorial', 'chroma')
+        self.url_matriz_vetorial = os.path.normpath(configs.get('url_matriz_vetorial', None) or os.path.join(self.url_banco_vetores, f'matriz_{self.nome_colecao_de_documentos}'))
+        self.tipo_dados_matriz_vetorial = configs.get('tipo_dados_matriz_vetorial', 'float32')
+        # quantização da matriz vetorial ('int8', 'binario' ou null): seleciona num_documentos_retornados * fator_candidatos
+        # candidatos pela matriz quantizada, reclassificados com os embeddings completos
+        self.quantizacao_matriz_vetorial = configs.get('quantizacao_matriz_vetorial', None)
+        self.fator_candidatos_quantizacao = configs.get('fator_candidatos_quantizacao', 10)
+        # busca híbrida: resultados da busca densa e do índice BM25 (gerado junto com a coleção) fundidos por RRF
+        self.usar_busca_hibrida = configs.get('usar_busca_hibrida', False)
+        self.url_indice_bm25 = os.path.normpath(configs.get('url_indice_bm25', None) or os.path.join(self.url_banco_vetores, f'bm25_{self.nome_colecao_de_documentos}.npz'))
+        self.busca_hibrida_num_candidatos = configs.get('busca_hibrida_num_candidatos', 20)
+        self.busca_hibrida_k_rrf = configs.get('busca_hibrida_k_rrf', 60)
+        # roteamento por palavras-chave: perguntas que citam um documento (chave 'palavras_chave' do índice de documentos)
+        # são consultadas apenas nos fragmentos desse documento (filtro pelo 'titulo' dos metadados)
+        self.usar_roteador_documentos = configs.get('usar_roteador_documentos', False)
+        # geração de bancos vetoriais: fragmentos por lote de embeddings e por inserção na coleção
+        self.tamanho_lote_embeddings_ingestao = configs.get('tamanho_lote_embeddings_ingestao', 64)
+        self.tamanho_lote_insercao_colecao = configs.get('tamanho_lote_insercao_colecao', 1000)
+        # quantidade de processos para a extração de fragmentos dos documentos (1: extração sequencial)
+        self.num_processos_extracao = configs.get('num_processos_extracao', 1)
         self.embedding_instructor = configs['embedding_instructor']
         self.embedding_squad_portuguese = configs['embedding_squad_portuguese']
         self.embedding_alibaba_gte = configs['embedding_alibaba_gte']
@@ -36,9 +66,61 @@ class ConfiguracoesAplicacao:
         os.environ['TRANSFORMERS_CACHE'] = self.url_cache_modelos
 
         self.num_documentos_retornados = configs['num_documentos_retornados']
+        self.tamanho_lote_reclassificacao = configs.get('tamanho_lote_reclassificacao', 16)
+        # aplica o reclassificador em paralelo à geração da resposta pelo LLM (a lista reclassificada é enviada ao final)
+        self.reclassificacao_paralela_llm = configs.get('reclassificacao_paralela_llm', False)
+        # seleção dos documentos incluídos no prompt (scores mínimos e orçamento de tokens; null desativa cada critério)
+        self.usar_selecao_contexto = configs.get('usar_selecao_contexto', False)
+        self.selecao_contexto_score_minimo_bert = configs.get('selecao_contexto_score_minimo_bert', None)
+        self.selecao_contexto_score_minimo_distancia = configs.get('selecao_contexto_score_minimo_distancia', None)
+        self.selecao_contexto_orcamento_tokens = configs.get('selecao_contexto_orcamento_tokens', 2048)
+        # tokenizador (Hugging Face) equivalente ao LLM, para contagem de tokens. Se null, a contagem é estimada
+        self.tokenizador_llm = configs.get('tokenizador_llm', None)
+        # cache de embeddings das perguntas (chave: texto normalizado; ttl em segundos, null para não expirar)
+        self.usar_cache_embeddings = configs.get('usar_cache_embeddings', True)
+        self.cache_embeddings_capacidade = configs.get('cache_embeddings_capacidade', 2048)
+        self.cache_embeddings_ttl = configs.get('cache_embeddings_ttl', 86400)
+        # cache semântico de respostas do fluxo RAG (limiar: similaridade do cosseno mínima entre as perguntas)
+        self.usar_cache_respostas = configs.get('usar_cache_respostas', False)
+        self.cache_respostas_capacidade = configs.get('cache_respostas_capacidade', 512)
+        self.cache_respostas_ttl = configs.get('cache_respostas_ttl', 3600)
+        self.cache_respostas_limiar_similaridade = configs.get('cache_respostas_limiar_similaridade', 0.97)
+        self.cache_respostas_apenas_sem_historico = configs.get('cache_respostas_apenas_sem_historico', True)
+        # cache dos resultados do reclassificador (url_cache_reclassificacao: arquivo SQLite opcional, para persistir entre execuções)
+        self.usar_cache_reclassificacao = configs.get('usar_cache_reclassificacao', True)
+        self.cache_reclassificacao_capacidade = configs.get('cache_reclassificacao_capacidade', 4096)
+        self.url_cache_reclassificacao = configs.get('url_cache_reclassificacao', None)
         
         self.url_script_geracao_banco_sqlite=os.path.normpath(configs['url_script_geracao_banco_sqlite'])
         self.url_script_geracao_banco_sql=os.path.normpath(configs['url_script_geracao_banco_sql'])
+        # quantidade de linhas por comando nas inserções em lote (ex.: documentos dos bancos vetoriais)
+        self.tamanho_lote_insercao = configs.get('tamanho_lote_insercao', 500)
+        # reaproveitamento de conexões com o banco de persistência: pool (SQL Server) ou uma conexão por thread (SQLite)
+        self.usar_pool_conexoes = configs.get('usar_pool_conexoes', True)
+        self.pool_conexoes_tamanho_minimo = configs.get('pool_conexoes_tamanho_minimo', 1)
+        self.pool_conexoes_tamanho_maximo = configs.get('pool_conexoes_tamanho_maximo', 10)
+        self.pool_conexoes_intervalo_verificacao = configs.get('pool_conexoes_intervalo_verificacao', 30)
+        self.pool_conexoes_timeout = configs.get('pool_conexoes_timeout', 10)
+        # armazenamento compacto das interações: JSON_Interacao apenas com ids e scores dos documentos, template de system
+        # armazenado uma única vez (tabela Template_System) e, opcionalmente, JSON comprimido com zlib
+        self.armazenamento_interacao_compacto = configs.get('armazenamento_interacao_compacto', False)
+        self.comprimir_json_interacao = configs.get('comprimir_json_interacao', False)
+        # PRAGMAs aplicados a cada conexão SQLite aberta (WAL: leituras não bloqueiam a escrita das interações)
+        self.sqlite_pragmas = configs.get('sqlite_pragmas', {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'mmap_size': 268435456,
+            'cache_size': -65536,
+            'busy_timeout': 5000
+        })
+        # gravação das interações em segundo plano, em lotes (intervalo e timeout em segundos)
+        self.usar_escritor_persistencia = configs.get('usar_escritor_persistencia', True)
+        self.escritor_persistencia_capacidade_fila = configs.get('escritor_persistencia_capacidade_fila', 1000)
+        self.escritor_persistencia_tamanho_lote = configs.get('escritor_persistencia_tamanho_lote', 50)
+        self.escritor_persistencia_intervalo_gravacao = configs.get('escritor_persistencia_intervalo_gravacao', 1.0)
+        self.escritor_persistencia_timeout_enfileirar = configs.get('escritor_persistencia_timeout_enfileirar', 5.0)
+        # tempo máximo, em segundos, que uma avaliação aguarda a gravação da interação avaliada
+        self.escritor_persistencia_timeout_descarregar = configs.get('escritor_persistencia_timeout_descarregar', 5.0)
 
         self.modelo_funcao_de_embeddings = configs['modelo_funcao_de_embeddings']
         
@@ -48,6 +130,12 @@ class ConfiguracoesAplicacao:
         self.top_k =configs['top_k']
         self.top_p = configs['top_p']
         self.usar_raciocinio = configs['usar_raciocinio']
+        # pool de conexões HTTP com a API do Ollama (tempos em segundos)
+        self.ollama_max_conexoes = configs.get('ollama_max_conexoes', 20)
+        self.ollama_max_conexoes_keepalive = configs.get('ollama_max_conexoes_keepalive', 10)
+        self.ollama_tempo_keepalive = configs.get('ollama_tempo_keepalive', 30)
+        self.ollama_timeout_conexao = configs.get('ollama_timeout_conexao', 5)
+        self.ollama_timeout_leitura = configs.get('ollama_timeout_leitura', 120)
 
         self.papel_llm = mensagens['papel_llm']
         # self.diretrizes_llm = mensagens['diretrizes_llm']
@@ -68,7 +156,9 @@ class ConfiguracoesAplicacao:
             'nome_colecao_de_documentos': self.nome_colecao_de_documentos,
             'num_documentos_retornados': self.num_documentos_retornados,
             'modelo_funcao_de_embeddings': self.modelo_funcao_de_embeddings,
-            'hnsw_space': self.hnsw_space
+            'hnsw_space': self.hnsw_space,
+            'tipo_banco_vetorial': self.tipo_banco_vetorial,
+            'url_matriz_vetorial': self.url_matriz_vetorial
         }
         
     def configuracoes_llm(self):
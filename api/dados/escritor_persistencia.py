@@ -0,0 +1,193 @@
+import asyncio
+import threading
+from queue import Empty, Full, Queue
+from time import monotonic
+
+from api.configuracoes.config_gerais import configuracoes
+from api.dados.persistencia import GerenciadorPersistencia
+
+
+class EscritorPersistencia:
+    '''
+    Persiste interações em segundo plano: as interações são colocadas em uma fila limitada e gravadas por uma
+    thread dedicada, em lotes (várias interações por transação). Assim, a resposta ao usuário não aguarda a
+    confirmação da escrita no banco. O uuid da interação e os comandos de inserção são gerados no momento em que ela é
+    enfileirada; a thread de gravação apenas os executa.
+
+    Quando a fila está cheia, enfileirar() aguarda até que haja espaço (contrapressão). Se a espera exceder
+    `timeout_enfileirar`, a interação é gravada de forma síncrona, para que não seja perdida.
+
+    Atributos:
+        gerenciador_persistencia (GerenciadorPersistencia): gerenciador usado para gravar as interações
+        tamanho_lote (int): quantidade máxima de interações gravadas em uma transação
+        intervalo_gravacao (float): tempo máximo, em segundos, que uma interação aguarda na fila pela formação do lote
+        timeout_enfileirar (float): tempo máximo, em segundos, de espera por espaço na fila
+        pendentes (Dict[str, threading.Event]): uuid -> evento sinalizado quando a gravação da interação é concluída
+    '''
+
+    FIM = object()
+    # intervalo, em segundos, entre as verificações de descarregar()
+    INTERVALO_VERIFICACAO = 0.02
+
+    def __init__(self,
+                 gerenciador_persistencia: GerenciadorPersistencia,
+                 capacidade_fila: int=configuracoes.escritor_persistencia_capacidade_fila,
+                 tamanho_lote: int=configuracoes.escritor_persistencia_tamanho_lote,
+                 intervalo_gravacao: float=configuracoes.escritor_persistencia_intervalo_gravacao,
+                 timeout_enfileirar: float=configuracoes.escritor_persistencia_timeout_enfileirar):
+        self.gerenciador_persistencia = gerenciador_persistencia
+        self.tamanho_lote = tamanho_lote
+        self.intervalo_gravacao = intervalo_gravacao
+        self.timeout_enfileirar = timeout_enfileirar
+        self.fila = Queue(maxsize=capacidade_fila)
+        self.trava = threading.Lock()
+        self.pendentes = {}
+        self.interacoes_gravadas = 0
+        self.lotes_gravados = 0
+        self.falhas = 0
+        self.gravacoes_sincronas = 0
+        self.encerrado = False
+        self.thread = threading.Thread(target=self.__executar, name='escritor-persistencia', daemon=True)
+        self.thread.start()
+
+    def enfileirar(self, dados_interacao: dict) -> str:
+        '''
+        Coloca a interação na fila de gravação
+
+        Parâmetros:
+            dados_interacao (dict): dados da interação, no formato de GerenciadorPersistencia.persistir_interacao
+
+        Retorna:
+            (str): uuid da interação
+        '''
+
+        if self.encerrado:
+            return self.gerenciador_persistencia.persistir_interacao(dados_interacao=dados_interacao)
+
+        # gera o uuid (e valida os dados, montando os comandos de inserção) agora: o uuid é devolvido imediatamente ao usuário,
+        # e a thread de gravação executa os comandos já montados
+        queries, dados = self.gerenciador_persistencia.preparar_interacao(dados_interacao)
+        uuid_interacao = dados_interacao['uuid_interacao']
+        with self.trava:
+            self.pendentes[uuid_interacao] = threading.Event()
+        try:
+            self.fila.put((uuid_interacao, queries, dados), timeout=self.timeout_enfileirar)
+        except Full:
+            print(f'AVISO: fila de persistência cheia. Gravando interação {uuid_interacao} de forma síncrona')
+            with self.trava:
+                self.gravacoes_sincronas += 1
+            try:
+                self.gerenciador_persistencia.executar_comandos_interacoes([(queries, dados)])
+            finally:
+                self.__concluir([uuid_interacao])
+        return uuid_interacao
+
+    async def descarregar(self, uuid_interacao: str, timeout: float=configuracoes.escritor_persistencia_timeout_descarregar) -> bool:
+        '''
+        Aguarda a gravação de uma interação enfileirada (as demais interações da fila não são aguardadas). A espera é
+        feita no event loop, verificando periodicamente o evento da interação, sem ocupar uma thread do pool
+
+        Parâmetros:
+            uuid_interacao (str): uuid da interação
+            timeout (float): tempo máximo de espera, em segundos
+
+        Retorna:
+            (bool): False se a interação ainda não foi gravada ao final do tempo de espera
+        '''
+        with self.trava:
+            evento = self.pendentes.get(uuid_interacao)
+        if evento is None:
+            return True
+        limite = monotonic() + timeout
+        while not evento.is_set():
+            tempo_restante = limite - monotonic()
+            if tempo_restante <= 0:
+                return False
+            await asyncio.sleep(min(self.INTERVALO_VERIFICACAO, tempo_restante))
+        return True
+
+    def encerrar(self):
+        '''Grava as interações pendentes e encerra a thread de gravação'''
+        if self.encerrado:
+            return
+        self.encerrado = True
+        self.fila.put(self.FIM)
+        self.thread.join()
+
+    def estatisticas(self) -> dict:
+        with self.trava:
+            return {
+                'interacoes_pendentes': self.fila.qsize(),
+                'interacoes_gravadas': self.interacoes_gravadas,
+                'lotes_gravados': self.lotes_gravados,
+                'falhas': self.falhas,
+                'gravacoes_sincronas': self.gravacoes_sincronas
+            }
+
+    def __executar(self):
+        finalizar = False
+        while not finalizar:
+            item = self.fila.get()
+            if item is self.FIM:
+                self.fila.task_done()
+                break
+
+            # forma o lote: aguarda novas interações até atingir o tamanho do lote ou o intervalo de gravação
+            lote = [item]
+            limite = monotonic() + self.intervalo_gravacao
+            while len(lote) < self.tamanho_lote:
+                tempo_restante = limite - monotonic()
+                try:
+                    item = self.fila.get(timeout=tempo_restante) if tempo_restante > 0 else self.fila.get_nowait()
+                except Empty:
+                    break
+                if item is self.FIM:
+                    self.fila.task_done()
+                    finalizar = True
+                    break
+                lote.append(item)
+
+            self.__gravar_lote(lote)
+            for _ in lote:
+                self.fila.task_done()
+
+    def __gravar_lote(self, lote: list):
+        try:
+            self.__gravar_itens(lote)
+        finally:
+            # as interações com falha também são concluídas: uma avaliação não aguarda uma gravação que não ocorrerá
+            self.__concluir([uuid_interacao for uuid_interacao, _, _ in lote])
+
+    def __gravar_itens(self, lote: list):
+        try:
+            self.gerenciador_persistencia.executar_comandos_interacoes([(queries, dados) for _, queries, dados in lote])
+            with self.trava:
+                self.interacoes_gravadas += len(lote)
+                self.lotes_gravados += 1
+            return
+        except Exception as excecao:
+            if len(lote) == 1:
+                self.__registrar_falha(lote[0][0], excecao)
+                return
+
+        # falha no lote: grava as interações individualmente, para que uma interação inválida não descarte as demais
+        for uuid_interacao, queries, dados in lote:
+            try:
+                self.gerenciador_persistencia.executar_comandos_interacoes([(queries, dados)])
+                with self.trava:
+                    self.interacoes_gravadas += 1
+                    self.lotes_gravados += 1
+            except Exception as excecao:
+                self.__registrar_falha(uuid_interacao, excecao)
+
+    def __concluir(self, uuids_interacoes: list):
+        with self.trava:
+            eventos = [self.pendentes.pop(uuid_interacao, None) for uuid_interacao in uuids_interacoes]
+        for evento in eventos:
+            if evento is not None:
+                evento.set()
+
+    def __registrar_falha(self, uuid_interacao: str, excecao: Exception):
+        with self.trava:
+            self.falhas += 1
+        print(f'ERRO: falha na gravação da interação {uuid_interacao} ({excecao.__class__.__name__}: {excecao})')
@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+from time import perf_counter
+from typing import List
+
+import numpy as np
+from chromadb import chromadb
+
+from api.configuracoes.config_gerais import configuracoes
+from api.utils.interface_banco_vetores import NOME_ARQUIVO_MATRIZ, NOME_ARQUIVO_METADADOS_MATRIZ, InterfaceMatrizVetorial
+from api.utils.quantizacao_vetores import QUANTIZADORES
+
+
+def exportar_matriz_vetorial(url_banco_vetores: str, nome_colecao: str, url_matriz_vetorial: str, tipo_dados: str='float32', quantizacoes: List[str]=(), tamanho_lote: int=1000) -> dict:
+    '''
+    Exporta uma coleção do ChromaDB para o formato de InterfaceMatrizVetorial: os embeddings, normalizados, em um
+    arquivo .npy, e ids, conteúdos e metadados dos documentos em um arquivo JSON. Os arquivos são gravados com nomes
+    temporários e renomeados ao final, de modo que uma matriz em uso não fica incompleta
+
+    Parâmetros:
+        url_banco_vetores (str): caminho do banco de vetores
+        nome_colecao (str): nome da coleção a ser exportada
+        url_matriz_vetorial (str): pasta em que a matriz será gravada
+        tipo_dados (str): tipo dos valores da matriz ('float32' ou 'float16')
+        quantizacoes (List[str]): versões quantizadas da matriz também exportadas ('int8', 'binario')
+        tamanho_lote (int): quantidade de documentos lidos da coleção por vez
+
+    Retorna:
+        (dict): informações da matriz exportada
+    '''
+
+    if tipo_dados not in ('float32', 'float16'):
+        raise ValueError(f'Tipo de dados {tipo_dados} não suportado para a matriz vetorial (float32 ou float16)')
+    for quantizacao in quantizacoes:
+        if quantizacao not in QUANTIZADORES:
+            raise ValueError(f'Quantização {quantizacao} não suportada ({", ".join(QUANTIZADORES)})')
+
+    cliente_chroma = chromadb.PersistentClient(path=url_banco_vetores)
+    colecao = cliente_chroma.get_collection(name=nome_colecao, embedding_function=None)
+    num_documentos = colecao.count()
+
+    ids, documentos, metadados, lotes_embeddings = [], [], [], []
+    for inicio in range(0, num_documentos, tamanho_lote):
+        lote = colecao.get(include=['embeddings', 'documents', 'metadatas'], limit=tamanho_lote, offset=inicio)
+        ids += lote['ids']
+        documentos += lote['documents']
+        metadados += lote['metadatas']
+        lotes_embeddings.append(np.asarray(lote['embeddings'], dtype=np.float32))
+    espaco = (colecao.metadata or {}).get('hnsw:space')
+
+    matriz = np.concatenate(lotes_embeddings) if lotes_embeddings else np.zeros((0, 0), dtype=np.float32)
+    # linhas agrupadas por título (mantida a ordem da coleção dentro de cada documento): a partição de cada documento,
+    # usada nas consultas filtradas, é um intervalo contínuo da matriz
+    ordem = sorted(range(len(ids)), key=lambda idx: (metadados[idx] or {}).get('titulo') or '')
+    ids = [ids[idx] for idx in ordem]
+    documentos = [documentos[idx] for idx in ordem]
+    metadados = [metadados[idx] for idx in ordem]
+    matriz = matriz[ordem]
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    normas[normas == 0] = 1
+    matriz_float32 = matriz / normas
+    matriz = matriz_float32.astype(tipo_dados)
+
+    info_matriz = {
+        'colecao': nome_colecao,
+        'url_banco_vetores': url_banco_vetores,
+        'hnsw:space': espaco,
+        'tipo_dados': tipo_dados,
+        'num_documentos': int(matriz.shape[0]),
+        'num_dimensoes': int(matriz.shape[1]) if matriz.ndim == 2 else 0
+    }
+
+    os.makedirs(url_matriz_vetorial, exist_ok=True)
+    url_arquivo_matriz = os.path.join(url_matriz_vetorial, NOME_ARQUIVO_MATRIZ)
+    url_arquivo_metadados = os.path.join(url_matriz_vetorial, NOME_ARQUIVO_METADADOS_MATRIZ)
+    with open(url_arquivo_matriz + '.tmp', 'wb') as arq:
+        np.save(arq, matriz)
+    with open(url_arquivo_metadados + '.tmp', 'w', encoding='utf-8') as arq:
+        # sem indentação: o arquivo é lido apenas na inicialização da interface
+        json.dump({**info_matriz, 'ids': ids, 'documentos': documentos, 'metadados': metadados}, arq, ensure_ascii=False, separators=(',', ':'))
+    # a quantização é calibrada com os embeddings em float32, antes da conversão para o tipo armazenado
+    arquivos = [NOME_ARQUIVO_MATRIZ, NOME_ARQUIVO_METADADOS_MATRIZ]
+    for quantizacao in quantizacoes:
+        QUANTIZADORES[quantizacao].calibrar(matriz_float32).salvar(url_matriz_vetorial, sufixo='.tmp')
+        arquivos += QUANTIZADORES[quantizacao].ARQUIVOS
+    for nome_arquivo in arquivos:
+        os.replace(os.path.join(url_matriz_vetorial, nome_arquivo + '.tmp'), os.path.join(url_matriz_vetorial, nome_arquivo))
+    # quantizações de uma exportação anterior não correspondem mais à matriz
+    for quantizacao, quantizador in QUANTIZADORES.items():
+        if quantizacao not in quantizacoes:
+            for nome_arquivo in quantizador.ARQUIVOS:
+                if os.path.exists(os.path.join(url_matriz_vetorial, nome_arquivo)):
+                    os.remove(os.path.join(url_matriz_vetorial, nome_arquivo))
+    info_matriz['quantizacoes'] = list(quantizacoes)
+
+    return info_matriz
+
+def verificar_matriz_vetorial(url_banco_vetores: str, nome_colecao: str, url_matriz_vetorial: str, num_consultas: int=100, num_resultados: int=configuracoes.num_documentos_retornados) -> dict:
+    '''
+    Compara as consultas à matriz exportada com as consultas à coleção de origem, usando como consultas os próprios
+    embeddings de `num_consultas` documentos da coleção
+
+    Retorna:
+        (dict): proporção de documentos em comum entre os resultados e tempo médio de consulta (ms) de cada interface
+    '''
+
+    interface_matriz = InterfaceMatrizVetorial(url_matriz_vetorial=url_matriz_vetorial, quantizacao=None, fazer_log=False)
+    cliente_chroma = chromadb.PersistentClient(path=url_banco_vetores)
+    colecao = cliente_chroma.get_collection(name=nome_colecao, embedding_function=None)
+    consultas = colecao.get(include=['embeddings'], limit=num_consultas)['embeddings']
+
+    tempo_chroma = tempo_matriz = 0
+    num_em_comum = 0
+    for embeddings_consulta in consultas:
+        marcador_tempo_inicio = perf_counter()
+        resultado_chroma = colecao.query(query_embeddings=[embeddings_consulta], n_results=num_resultados)
+        tempo_chroma += perf_counter() - marcador_tempo_inicio
+
+        marcador_tempo_inicio = perf_counter()
+        resultado_matriz = interface_matriz.consultar_documentos(None, num_resultados, embeddings_consulta=embeddings_consulta)
+        tempo_matriz += perf_counter() - marcador_tempo_inicio
+
+        num_em_comum += len(set(resultado_chroma['ids'][0]) & set(resultado_matriz['ids'][0]))
+
+    num_consultas = len(consultas)
+    return {
+        'consultas': num_consultas,
+        'documentos_em_comum': num_em_comum / (num_consultas * num_resultados) if num_consultas else 0,
+        'tempo_medio_chroma_ms': 1000 * tempo_chroma / num_consultas if num_consultas else 0,
+        'tempo_medio_matriz_ms': 1000 * tempo_matriz / num_consultas if num_consultas else 0
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Exporta uma coleção do ChromaDB para a matriz vetorial consultada por InterfaceMatrizVetorial (tipo_banco_vetorial = 'matriz')")
+    parser.add_argument('--nome_banco_vetores', type=str, help="nome do banco de vetores (padrão: url_banco_vetores da configuração)")
+    parser.add_argument('--nome_colecao', type=str, help="nome da coleção (padrão: nome_colecao_de_documentos da configuração)")
+    parser.add_argument('--url_matriz_vetorial', type=str, help="pasta de destino (padrão: url_matriz_vetorial da configuração)")
+    parser.add_argument('--tipo_dados', type=str, choices=['float32', 'float16'], help="tipo dos valores da matriz (padrão: tipo_dados_matriz_vetorial da configuração)")
+    parser.add_argument('--quantizacao', type=str, nargs='*', choices=list(QUANTIZADORES), help="versões quantizadas da matriz a exportar (padrão: quantizacao_matriz_vetorial da configuração)")
+    parser.add_argument('--num_consultas_verificacao', type=int, default=0, help="quantidade de consultas comparando a matriz exportada com a coleção (0: não verifica)")
+    args = parser.parse_args()
+
+    url_banco_vetores = os.path.join(configuracoes.url_pasta_bancos_vetores, args.nome_banco_vetores) if args.nome_banco_vetores else configuracoes.url_banco_vetores
+    nome_colecao = args.nome_colecao if args.nome_colecao else configuracoes.nome_colecao_de_documentos
+    if args.url_matriz_vetorial:
+        url_matriz_vetorial = args.url_matriz_vetorial
+    elif args.nome_banco_vetores or args.nome_colecao:
+        url_matriz_vetorial = os.path.join(url_banco_vetores, f'matriz_{nome_colecao}')
+    else:
+        url_matriz_vetorial = configuracoes.url_matriz_vetorial
+    tipo_dados = args.tipo_dados if args.tipo_dados else configuracoes.tipo_dados_matriz_vetorial
+    if args.quantizacao is not None:
+        quantizacoes = args.quantizacao
+    else:
+        quantizacoes = [configuracoes.quantizacao_matriz_vetorial] if configuracoes.quantizacao_matriz_vetorial else []
+
+    print(f'Exportando a coleção {nome_colecao} ({url_banco_vetores}) para {url_matriz_vetorial} ({tipo_dados})')
+    info_matriz = exportar_matriz_vetorial(url_banco_vetores, nome_colecao, url_matriz_vetorial, tipo_dados=tipo_dados, quantizacoes=quantizacoes)
+    print(json.dumps(info_matriz, ensure_ascii=False, indent=4))
+    if info_matriz['hnsw:space'] not in (None, 'cosine'):
+        print(f"AVISO: a coleção usa 'hnsw:space' = {info_matriz['hnsw:space']}; a matriz vetorial é consultada pela similaridade do cosseno")
+
+    if args.num_consultas_verificacao:
+        print(json.dumps(verificar_matriz_vetorial(url_banco_vetores, nome_colecao, url_matriz_vetorial, num_consultas=args.num_consultas_verificacao), indent=4))
+
+# Modelo de execução
+# python -m api.dados.exportar_matriz_vetorial --num_consultas_verificacao 100
+# python -m api.dados.exportar_matriz_vetorial --nome_banco_vetores banco_assistente --nome_colecao documentos_rh_bge_m3 --tipo_dados float16
+# python -m api.dados.exportar_matriz_vetorial --quantizacao int8 binario
@@ -0,0 +1,78 @@
+import base64
+import hashlib
+import json
+import zlib
+
+# identifica o conteúdo de JSON_Interacao comprimido (zlib + base64, para manter a coluna como texto)
+PREFIXO_COMPRIMIDO = 'zlib:'
+FORMATO_COMPACTO = 'compacto'
+
+
+def calcular_hash_template(template: str) -> str:
+    '''Hash (sha256) do template de system, usado como chave na tabela Template_System'''
+    return hashlib.sha256(template.encode('utf-8')).hexdigest()
+
+def compactar_interacao(dados_interacao: dict, hash_template: str=None) -> dict:
+    '''
+    Monta a versão compacta dos dados da interação para JSON_Interacao, sem o conteúdo que já é armazenado
+    em outras tabelas ou colunas:
+        - dos documentos, mantém apenas o id e os scores (o conteúdo está na tabela Documento);
+        - o template de system é substituído pelo seu hash (o conteúdo está na tabela Template_System);
+        - da resposta completa do LLM, remove o texto da mensagem (já armazenado em 'resposta').
+
+    Parâmetros:
+        dados_interacao (dict): dados da interação, no formato de GerenciadorPersistencia.persistir_interacao
+        hash_template (str): hash do template de system, conforme calcular_hash_template()
+
+    Retorna:
+        (dict): dados da interação em formato compacto
+    '''
+
+    if dados_interacao.get('formato_json_interacao') == FORMATO_COMPACTO:
+        return dados_interacao
+
+    dados_compactos = {
+        chave: valor for chave, valor in dados_interacao.items()
+        if chave not in ('documentos', 'template_system_llm', 'resposta_completa_llm')
+    }
+    dados_compactos['formato_json_interacao'] = FORMATO_COMPACTO
+    dados_compactos['documentos'] = [
+        {
+            chave: documento[chave]
+            for chave in ('id', 'score_distancia', 'score_bert', 'score_ponderado')
+            if chave in documento
+        }
+        for documento in dados_interacao.get('documentos', [])
+    ]
+    dados_compactos['hash_template_system_llm'] = hash_template
+
+    resposta_completa_llm = dados_interacao.get('resposta_completa_llm')
+    if resposta_completa_llm:
+        resposta_completa_llm = dict(resposta_completa_llm)
+        if isinstance(resposta_completa_llm.get('message'), dict):
+            resposta_completa_llm['message'] = {
+                chave: valor for chave, valor in resposta_completa_llm['message'].items() if chave != 'content'
+            }
+    dados_compactos['resposta_completa_llm'] = resposta_completa_llm
+    return dados_compactos
+
+def codificar_json_interacao(dados_interacao: dict, comprimir: bool=False) -> str:
+    '''
+    Serializa os dados da interação para a coluna JSON_Interacao, opcionalmente comprimindo-os (zlib)
+
+    Retorna:
+        (str): JSON, ou JSON comprimido em base64 precedido de PREFIXO_COMPRIMIDO
+    '''
+
+    conteudo = json.dumps(dados_interacao, ensure_ascii=False)
+    if not comprimir:
+        return conteudo
+    return PREFIXO_COMPRIMIDO + base64.b64encode(zlib.compress(conteudo.encode('utf-8'), level=9)).decode('ascii')
+
+def decodificar_json_interacao(valor: str) -> dict:
+    '''Lê o conteúdo da coluna JSON_Interacao, comprimido ou não, em qualquer um dos formatos'''
+    if valor is None:
+        return None
+    if valor.startswith(PREFIXO_COMPRIMIDO):
+        valor = zlib.decompress(base64.b64decode(valor[len(PREFIXO_COMPRIMIDO):])).decode('utf-8')
+    return json.loads(valor)
@@ -1,36 +1,149 @@
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import argparse
 import ast
+import hashlib
+from itertools import chain, islice
 import json
 import os
 import re
-from typing import List
-import unicodedata
+from typing import Iterable, Iterator, List
 import uuid
+from time import perf_counter
 from api.configuracoes.config_gerais import configuracoes
+from api.utils.indice_bm25 import IndiceBM25, obter_url_indice_bm25
 from api.utils.interface_banco_vetores import FuncaoEmbeddings, FuncaoEmbeddingsOllama
+from api.utils.texto import normalizar_string
 from torch import cuda
 import chromadb.utils.embedding_functions as embedding_functions
 from sentence_transformers import SentenceTransformer
 from chromadb import chromadb
 from pypdf import PdfReader
-from bs4 import BeautifulSoup
+from lxml import etree
 
 DEVICE='cuda' if cuda.is_available() else 'cpu'
 
+# sequências de espaços reduzidas a um único espaço em uma única passada (em vez de substituições repetidas)
+RE_ESPACOS_REPETIDOS = re.compile(' {2,}')
+RE_ORDINAL_DISPOSITIVO = re.compile(r'(Art\.|art\.|§) ([1-9])º')
+
+
+def calcular_hash_conteudo(texto: str) -> str:
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+def calcular_hash_arquivo(url_arquivo: str) -> str:
+    hash_arquivo = hashlib.sha256()
+    with open(url_arquivo, 'rb') as arq:
+        for bloco in iter(lambda: arq.read(1 << 20), b''):
+            hash_arquivo.update(bloco)
+    return hash_arquivo.hexdigest()
+
+def gerar_id_fragmento(uuid_colecao: str, documento: str, hash_conteudo: str, ocorrencia: int) -> str:
+    '''
+    Gera o id determinístico (uuid5) de um fragmento, derivado da coleção, do documento de origem e do conteúdo,
+    de modo que fragmentos inalterados mantêm o id entre gerações do banco vetorial. `ocorrencia` diferencia
+    fragmentos de mesmo conteúdo em um mesmo documento
+    '''
+    try:
+        namespace = uuid.UUID(str(uuid_colecao))
+    except ValueError:
+        namespace = uuid.uuid5(uuid.NAMESPACE_URL, str(uuid_colecao))
+    return str(uuid.uuid5(namespace, f'{documento}|{hash_conteudo}|{ocorrencia}'))
+
+class ColetorTextoHtml:
+    '''
+    Alvo (target) do parser de HTML do lxml: recebe os eventos do parser na ordem do documento, sem que a árvore
+    seja construída, e acumula cada nó de texto uma única vez. O conteúdo de scripts e estilos é descartado, e
+    tags de bloco (parágrafos, títulos, células etc.) são separadas por quebras de linha; tags inline (ex.: <strong>)
+    não separam o texto, de modo que 'Art. <b>1º</b>' permanece 'Art. 1º'
+    '''
+
+    TAGS_IGNORADAS = {'script', 'style', 'noscript', 'template'}
+    TAGS_BLOCO = {
+        'address', 'article', 'aside', 'blockquote', 'body', 'br', 'caption', 'dd', 'div', 'dl', 'dt', 'fieldset',
+        'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main',
+        'nav', 'ol', 'p', 'pre', 'section', 'table', 'td', 'th', 'title', 'tr', 'ul'
+    }
+
+    def __init__(self):
+        self.partes = []
+        self.profund_ignorada = 0
+
+    def start(self, tag, attrib):
+        if tag in self.TAGS_IGNORADAS:
+            self.profund_ignorada += 1
+        elif tag in self.TAGS_BLOCO:
+            self.partes.append('\n')
+
+    def end(self, tag):
+        if tag in self.TAGS_IGNORADAS:
+            self.profund_ignorada -= 1
+        elif tag in self.TAGS_BLOCO:
+            self.partes.append('\n')
+
+    def data(self, texto):
+        if not self.profund_ignorada:
+            self.partes.append(texto)
+
+    def close(self):
+        return None
+
+    def descarregar(self) -> List[str]:
+        partes, self.partes = self.partes, []
+        return partes
+
+def iterar_textos_html(url_arquivo: str, tamanho_bloco: int=1 << 16) -> Iterator[str]:
+    '''
+    Lê um arquivo HTML em blocos de `tamanho_bloco` bytes e produz os trechos de texto à medida que são lidos
+    (ver ColetorTextoHtml), sem carregar o arquivo nem a árvore do documento em memória
+    '''
+    coletor = ColetorTextoHtml()
+    parser = etree.HTMLParser(target=coletor, encoding='utf-8', remove_comments=True)
+    with open(url_arquivo, 'rb') as arq:
+        for bloco in iter(lambda: arq.read(tamanho_bloco), b''):
+            parser.feed(bloco)
+            yield from coletor.descarregar()
+    parser.close()
+    yield from coletor.descarregar()
+
+def normalizar_trechos(trechos: Iterable[str]) -> Iterator[str]:
+    '''
+    Normaliza os espaços de uma sequência de trechos como se fossem um único texto: quebras de linha e tabulações
+    viram espaços, e espaços repetidos (inclusive entre o fim de um trecho e o início do seguinte) são reduzidos a um
+    '''
+    termina_com_espaco = False
+    for trecho in trechos:
+        trecho = RE_ESPACOS_REPETIDOS.sub(' ', trecho.replace('\n', ' ').replace('\t', ' '))
+        if termina_com_espaco and trecho.startswith(' '):
+            trecho = trecho[1:]
+        if trecho:
+            termina_com_espaco = trecho.endswith(' ')
+            yield trecho
+
+def dividir_linhas(trechos: Iterable[str], separador: str, substituto: str) -> Iterator[str]:
+    '''
+    Produz as linhas não vazias de texto.replace(separador, substituto).split('\n') à medida que os trechos do texto
+    (normalizados com normalizar_trechos) são lidos; somente a linha em formação fica em memória. O substituto troca
+    um espaço do separador por uma quebra de linha (ex.: '. ' -> '.\n', ' Art. ' -> '\nArt. ')
+    '''
+    posicao_quebra = substituto.index('\n')
+    pendente = ''
+    for trecho in trechos:
+        # o separador pode ter começado no fim do trecho anterior
+        inicio_busca = max(0, len(pendente) - len(separador) + 1)
+        pendente += trecho
+        idx = pendente.rfind(separador, inicio_busca)
+        if idx >= 0:
+            # as linhas até o último separador estão completas
+            corte = idx + posicao_quebra
+            concluido, pendente = pendente[:corte], pendente[corte + 1:]
+            yield from (linha for linha in concluido.replace(separador, substituto).split('\n') if linha)
+    yield from (linha for linha in pendente.replace(separador, substituto).split('\n') if linha)
+
 class GerenciadorBancoVetores:
 
     def normalizar_string(self, s):
-        # Normaliza e remove os acentos (diacríticos)
-        s = unicodedata.normalize('NFD', s)
-        s = ''.join(c for c in s if unicodedata.category(c) != 'Mn')    
-        # Converte para letras minúsculas
-        s = s.lower()    
-        # Substitui caracteres não alfanuméricos por underscores (_)
-        s = re.sub(r'[^a-z0-9]+', '_', s)    
-        # Remove underscores duplicados e também os do início e do fim
-        s = re.sub(r'_+', '_', s).strip('_')    
-        return s
+        return normalizar_string(s)
 
     def fragmentar_texto_markdown(self, texto: str, comprimento_max_fragmento: int) -> List[str]:
         """
@@ -46,53 +159,62 @@ class GerenciadorBancoVetores:
         linhas = [linha for linha in texto.splitlines() if linha.strip()]
         
         fragmentos = []
-        fragmento = ''
+        # o fragmento é mantido como lista de linhas, com a contagem de palavras atualizada a cada linha incluída
+        linhas_fragmento = []
+        num_separadores_fragmento = 0
         titulos = []
         nivel_titulo_base = 1
+        cabecalho, num_separadores_cabecalho = self.__montar_cabecalho(titulos)
 
         for linha in linhas:
             elementos = linha.split(' ')
             if elementos[0].startswith('#'):
-                if fragmento:
-                    cabecalho = '\n'.join(titulos) + '\n'
-                    fragmentos.append({'titulos': titulos.copy(), 'conteudo': cabecalho + fragmento})
-                    fragmento = ''
+                if linhas_fragmento:
+                    fragmentos.append({'titulos': titulos.copy(), 'conteudo': cabecalho + ''.join(linhas_fragmento)})
+                    linhas_fragmento = []
+                    num_separadores_fragmento = 0
                 nivel_titulo = len(elementos[0])
                 if nivel_titulo_base >= nivel_titulo:
                     titulos = titulos[:nivel_titulo - 1]            
                 nivel_titulo_base = nivel_titulo
                 titulos.append(' '.join(elementos[1:]))
+                cabecalho, num_separadores_cabecalho = self.__montar_cabecalho(titulos)
             else:
                 # Não é título
-                cabecalho = '\n'.join(titulos) + '\n'
-                texto_possivel_fragmento = cabecalho + fragmento + f'{linha}\n'
-                if len(texto_possivel_fragmento.replace('\n', ' ').split(' ')) <= comprimento_max_fragmento:
+                # palavras = separadores (espaços e quebras de linha) + 1; a linha é incluída com uma quebra de linha ao final
+                num_separadores_linha = linha.count(' ') + 1
+                if num_separadores_cabecalho + num_separadores_fragmento + num_separadores_linha + 1 <= comprimento_max_fragmento:
                     # Não extrapola tamanho máximo
-                    fragmento += f'{linha}\n'
+                    linhas_fragmento.append(f'{linha}\n')
+                    num_separadores_fragmento += num_separadores_linha
                 else:
                     # Extrapola tamanho máximo
-                    fragmentos.append({'titulos': titulos.copy(), 'conteudo': cabecalho + fragmento})
-                    fragmento = f'{linha}\n'
+                    fragmentos.append({'titulos': titulos.copy(), 'conteudo': cabecalho + ''.join(linhas_fragmento)})
+                    linhas_fragmento = [f'{linha}\n']
+                    num_separadores_fragmento = num_separadores_linha
 
-        if fragmento:
-            cabecalho = '\n'.join(titulos) + '\n'
-            fragmentos.append({'titulos': titulos.copy(), 'conteudo': cabecalho + fragmento})
+        if linhas_fragmento:
+            fragmentos.append({'titulos': titulos.copy(), 'conteudo': cabecalho + ''.join(linhas_fragmento)})
         
         return fragmentos
+
+    def __montar_cabecalho(self, titulos: List[str]):
+        cabecalho = '\n'.join(titulos) + '\n'
+        return cabecalho, cabecalho.count(' ') + cabecalho.count('\n')
     
     def processar_texto_markdown(self, texto: str, info: dict, comprimento_max_fragmento: int, profund_maxima: int=3) -> List[str]:
         fragmentos_titulos = self.fragmentar_texto_markdown(texto=texto, comprimento_max_fragmento=comprimento_max_fragmento)
 
         fragmentos = []
-        titulos = []
+        ocorrencias_titulos = {}
         for frag_titulo in fragmentos_titulos:
             tit = frag_titulo['titulos'][:profund_maxima][-1]
-            titulos.append(tit)
+            ocorrencias_titulos[tit] = ocorrencias_titulos.get(tit, 0) + 1
             fragmento = {
                 'page_content': frag_titulo['conteudo'],
                 'metadata': {
                     'titulo': f'{info["titulo"]}',
-                    'subtitulo': f'{tit} - {titulos.count(tit)}',
+                    'subtitulo': f'{tit} - {ocorrencias_titulos[tit]}',
                     'autor': f'{info["autor"]}',
                     'fonte': f'{info["fonte"]}#{self.normalizar_string(tit)}'
                 },
@@ -103,114 +225,117 @@ class GerenciadorBancoVetores:
     
     def processar_texto_articulado(self, texto, info, comprimento_max_fragmento):
         '''Processa textos legais, divididos em artigos. Mantém o Caput dos artigos em cada um dos fragmentos.'''
-        
-        texto = texto.replace('\n', ' ')
-        while '  ' in texto: texto = texto.replace('  ', ' ')
-        texto = texto.replace(' Art. ', '\nArt. ')
-        
-        for num in range(1, 10):
-                texto = texto.replace(f'Art. {num}º', f'Art. {num}.')
-                texto = texto.replace(f'art. {num}º', f'art. {num}.')
-                texto = texto.replace(f'§ {num}º', f'§ {num}.')
-                
-        texto = texto.split('\n')
-        while '' in texto: texto.remove('')
-        
-        artigos = []
-        for art in texto:
-            item = art.split(' ')
-            qtd_palavras = len(item)
-            if qtd_palavras > comprimento_max_fragmento:
-                item = (
-                        art.replace('. §', '.\n§')
-                        .replace('; §', ';\n§')
-                        .replace(': §', ':\n§')
-                        .replace(';', '\n')
-                        .replace(':', '\n')
-                        .replace('\n ', '\n')
-                        .replace(' \n', '\n')
-                        .split('\n')
-                    )
-                caput = item[0]
-                fragmento_artigo = '' + caput
-                # AFAZER: considerar casos em que, mesmo após divisão das
-                # partes do artigo, haja alguma com mais palavras que o compr. máximo
-                for i in range(1, len(item)):
-                    if len(fragmento_artigo.split(' ')) + len(item[i].split(' ')) <= comprimento_max_fragmento:
-                        fragmento_artigo = fragmento_artigo + ' ' + item[i]
-                    else:
-                        artigos.append(fragmento_artigo)
-                        fragmento_artigo = '' + caput + ' ' + item[i]
-                artigos.append(fragmento_artigo)
-            else:
-                artigos.append(art)
-        
-        fragmentos = []
-        titulos = []
-        for artigo in artigos:
-            tit = artigo.split('. ')[1]
-            titulos.append(tit)
-            fragmento = {
-                'page_content': artigo,
-                'metadata': {
-                    'titulo': f'{info["titulo"]}',
-                    'subtitulo': f'Art. {tit} - {titulos.count(tit)}',
-                    'autor': f'{info["autor"]}',
-                    'fonte': f'{info["fonte"]}#Art_{tit}'
-                },
-            }
-            fragmentos.append(fragmento)
-        return fragmentos
-    
-    def processar_texto(self, texto, info, comprimento_max_fragmento, pagina=None):
-        texto = texto.replace('\n', ' ').replace('\t', ' ')
-        while '  ' in texto: texto = texto.replace('  ', ' ')
-        
-        if info['texto_articulado']:
-            return self.processar_texto_articulado(texto, info, comprimento_max_fragmento)
-        
-        if len(texto.split(' ')) <= comprimento_max_fragmento:
-            fragmento = {
-                'page_content': texto,
-                'metadata': {
-                    'titulo': f'{info["titulo"]}',
-                    'subtitulo':
-                        f'Página {pagina} - Fragmento 1' if pagina
-                        else f'Fragmento 1',
-                    'autor': f'{info["autor"]}',
-                    'fonte': f'{info["fonte"]}',
-                },
-            }
-            if pagina: fragmento['pagina']=pagina
-            return [fragmento]
-            
-        linhas = texto.replace('. ', '.\n')
-        linhas = linhas.split('\n')
-        while '' in linhas: linhas.remove('')
-        
-        fragmentos = []
-        texto_fragmento = ''
-        for idx in range(len(linhas)):
-            if len(texto_fragmento.split(' ')) + len(linhas[idx].split(' ')) < comprimento_max_fragmento:
-                texto_fragmento += ' ' + linhas[idx]
-            else:
-                fragmento = {
-                    'page_content': texto_fragmento,
+        return list(self.iterar_fragmentos_articulados([texto], info, comprimento_max_fragmento))
+
+    def iterar_fragmentos_articulados(self, trechos: Iterable[str], info: dict, comprimento_max_fragmento: int) -> Iterator[dict]:
+        '''Produz os fragmentos de um texto articulado (ver processar_texto_articulado) artigo a artigo, à medida que os trechos do texto são lidos'''
+        ocorrencias_titulos = {}
+        for art in dividir_linhas(normalizar_trechos(trechos), ' Art. ', '\nArt. '):
+            # 'Art. 1º' -> 'Art. 1.', 'art. 1º' -> 'art. 1.', '§ 1º' -> '§ 1.' (de 1 a 9)
+            art = RE_ORDINAL_DISPOSITIVO.sub(r'\1 \2.', art)
+            for artigo in self.__dividir_artigo(art, comprimento_max_fragmento):
+                tit = artigo.split('. ', 2)[1]
+                ocorrencias_titulos[tit] = ocorrencias_titulos.get(tit, 0) + 1
+                yield {
+                    'page_content': artigo,
                     'metadata': {
                         'titulo': f'{info["titulo"]}',
-                        'subtitulo':
-                            f'Página {pagina} - Fragmento {len(fragmentos)+1}' if pagina
-                            else f'Fragmento {len(fragmentos)+1}',
+                        'subtitulo': f'Art. {tit} - {ocorrencias_titulos[tit]}',
                         'autor': f'{info["autor"]}',
-                        'fonte': f'{info["fonte"]}',
+                        'fonte': f'{info["fonte"]}#Art_{tit}'
                     },
                 }
-                if pagina: fragmento['pagina'] = pagina
-                fragmentos.append(fragmento)
-                texto_fragmento = ''
-            
-        return fragmentos       
-    
+
+    def __dividir_artigo(self, art: str, comprimento_max_fragmento: int) -> List[str]:
+        qtd_palavras = art.count(' ') + 1
+        if qtd_palavras <= comprimento_max_fragmento:
+            return [art]
+
+        item = (
+                art.replace('. §', '.\n§')
+                .replace('; §', ';\n§')
+                .replace(': §', ':\n§')
+                .replace(';', '\n')
+                .replace(':', '\n')
+                .replace('\n ', '\n')
+                .replace(' \n', '\n')
+                .split('\n')
+            )
+        caput = item[0]
+        qtd_palavras_caput = caput.count(' ') + 1
+        partes_fragmento = [caput]
+        qtd_palavras_fragmento = qtd_palavras_caput
+        artigos = []
+        # AFAZER: considerar casos em que, mesmo após divisão das
+        # partes do artigo, haja alguma com mais palavras que o compr. máximo
+        for i in range(1, len(item)):
+            qtd_palavras_item = item[i].count(' ') + 1
+            if qtd_palavras_fragmento + qtd_palavras_item <= comprimento_max_fragmento:
+                partes_fragmento.append(item[i])
+                qtd_palavras_fragmento += qtd_palavras_item
+            else:
+                artigos.append(' '.join(partes_fragmento))
+                partes_fragmento = [caput, item[i]]
+                qtd_palavras_fragmento = qtd_palavras_caput + qtd_palavras_item
+        artigos.append(' '.join(partes_fragmento))
+        return artigos
+
+    def processar_texto(self, texto, info, comprimento_max_fragmento, pagina=None):
+        return list(self.iterar_fragmentos_texto([texto], info, comprimento_max_fragmento, pagina=pagina))
+
+    def iterar_fragmentos_texto(self, trechos: Iterable[str], info: dict, comprimento_max_fragmento: int, pagina: int=None) -> Iterator[dict]:
+        '''
+        Produz os fragmentos de um texto (ver processar_texto) à medida que os trechos do texto são lidos: somente o
+        fragmento em formação e a frase em curso ficam em memória
+        '''
+        if info['texto_articulado']:
+            yield from self.iterar_fragmentos_articulados(trechos, info, comprimento_max_fragmento)
+            return
+
+        # um texto com até comprimento_max_fragmento palavras forma um único fragmento: os trechos são acumulados até
+        # que o texto termine ou exceda esse limite
+        trechos = normalizar_trechos(trechos)
+        trechos_iniciais = []
+        num_espacos = 0
+        for trecho in trechos:
+            trechos_iniciais.append(trecho)
+            num_espacos += trecho.count(' ')
+            if num_espacos + 1 > comprimento_max_fragmento:
+                break
+        else:
+            yield self.__montar_fragmento(''.join(trechos_iniciais), info, 1, pagina)
+            return
+
+        num_fragmentos = 0
+        # o fragmento é mantido como lista de partes, com a contagem de palavras (len(texto.split(' '))) atualizada a cada linha
+        partes_fragmento = ['']
+        qtd_palavras_fragmento = 1
+        for linha in dividir_linhas(chain(trechos_iniciais, trechos), '. ', '.\n'):
+            qtd_palavras_linha = linha.count(' ') + 1
+            if qtd_palavras_fragmento + qtd_palavras_linha < comprimento_max_fragmento:
+                partes_fragmento.append(linha)
+                qtd_palavras_fragmento += qtd_palavras_linha
+            else:
+                num_fragmentos += 1
+                yield self.__montar_fragmento(' '.join(partes_fragmento), info, num_fragmentos, pagina)
+                partes_fragmento = ['']
+                qtd_palavras_fragmento = 1
+
+    def __montar_fragmento(self, texto: str, info: dict, numero: int, pagina: int=None) -> dict:
+        fragmento = {
+            'page_content': texto,
+            'metadata': {
+                'titulo': f'{info["titulo"]}',
+                'subtitulo':
+                    f'Página {pagina} - Fragmento {numero}' if pagina
+                    else f'Fragmento {numero}',
+                'autor': f'{info["autor"]}',
+                'fonte': f'{info["fonte"]}',
+            },
+        }
+        if pagina: fragmento['pagina'] = pagina
+        return fragmento
+
     def extrair_fragmentos_txt(self, rotulo, info, comprimento_max_fragmento):
         with open(os.path.join(configuracoes.url_pasta_documentos,info['url']), 'r', encoding='utf-8') as arq:
             texto = arq.read()
@@ -222,26 +347,26 @@ class GerenciadorBancoVetores:
         return fragmentos
     
     def extrair_fragmentos_pdf(self, rotulo, info, comprimento_max_fragmento):
-        fragmentos = []
+        '''Produz os fragmentos página a página: as páginas são lidas e processadas à medida que os fragmentos são consumidos'''
         arquivo = PdfReader(os.path.join(configuracoes.url_pasta_documentos,info['url']))
+        num_fragmentos = 0
         for idx in range(len(arquivo.pages)):
-            pagina = arquivo.pages[idx]
-            texto = pagina.extract_text()
-            fragmentos += self.processar_texto(texto, info, comprimento_max_fragmento, pagina=idx+1)
-        for idx in range(len(fragmentos)): fragmentos[idx]['id'] = f'{rotulo}:{idx+1}'
-        return fragmentos
+            texto = arquivo.pages[idx].extract_text()
+            for fragmento in self.processar_texto(texto, info, comprimento_max_fragmento, pagina=idx+1):
+                num_fragmentos += 1
+                fragmento['metadata']['tag_fragmento'] = f'{rotulo}:{num_fragmentos}'
+                yield fragmento
         
     def extrair_fragmentos_html(self, rotulo, info, comprimento_max_fragmento):
-        with open(os.path.join(configuracoes.url_pasta_documentos,info['url']), 'r', encoding='utf-8') as arq:
-            conteudo_html = arq.read()
-            
-        pagina_html = BeautifulSoup(conteudo_html, 'html.parser')
-        tags = pagina_html.find_all()
-        texto = '\n'.join([tag.get_text() for tag in tags])
-        
-        fragmentos = self.processar_texto(texto, info, comprimento_max_fragmento)
-        for idx in range(len(fragmentos)): fragmentos[idx]['id'] = f'{rotulo}:{idx+1}'
-        return fragmentos
+        '''
+        Extrai o texto do HTML em uma única passada pelos nós de texto (ver iterar_textos_html), sem montar a árvore
+        do documento, e produz os fragmentos à medida que são consumidos: os trechos de texto são repassados ao
+        fragmentador conforme o arquivo é lido, sem que o texto completo seja montado
+        '''
+        trechos = iterar_textos_html(os.path.join(configuracoes.url_pasta_documentos,info['url']))
+        for idx, fragmento in enumerate(self.iterar_fragmentos_texto(trechos, info, comprimento_max_fragmento)):
+            fragmento['metadata']['tag_fragmento'] = f'{rotulo}:{idx+1}'
+            yield fragmento
     
     def extrair_fragmentos_markdown(self, rotulo, info, comprimento_max_fragmento):
         with open(os.path.join(configuracoes.url_pasta_documentos,info['url']), 'r', encoding='utf-8') as arq:
@@ -260,38 +385,93 @@ class GerenciadorBancoVetores:
         'md':   extrair_fragmentos_markdown
     }    
     
+    def iterar_fragmentos_documento(self, rotulo, info, comprimento_max_fragmento) -> Iterator[dict]:
+        '''
+        Produz os fragmentos de um documento à medida que são extraídos. Os metadados de cada fragmento identificam o
+        documento de origem, o hash do arquivo, o comprimento máximo de fragmento utilizado e o hash do conteúdo
+        (usados na sincronização incremental)
+        '''
+        tipo = info['url'].split('.')[-1]
+        hash_arquivo = calcular_hash_arquivo(os.path.join(configuracoes.url_pasta_documentos, info['url']))
+        for frag in self.extrair_fragmento_por_tipo[tipo](self, rotulo=rotulo, info=info, comprimento_max_fragmento=comprimento_max_fragmento):
+            frag['metadata']['documento'] = rotulo
+            frag['metadata']['hash_arquivo'] = hash_arquivo
+            frag['metadata']['comprimento_max_fragmento'] = comprimento_max_fragmento
+            frag['metadata']['hash_conteudo'] = calcular_hash_conteudo(frag['page_content'])
+            yield frag
+
+    def extrair_fragmentos_documento(self, rotulo, info, comprimento_max_fragmento) -> List[dict]:
+        '''Extrai os fragmentos de um documento (ver iterar_fragmentos_documento)'''
+        return list(self.iterar_fragmentos_documento(rotulo=rotulo, info=info, comprimento_max_fragmento=comprimento_max_fragmento))
+
+    def iterar_fragmentos(self,
+        indice_documentos=None,
+        comprimento_max_fragmento=configuracoes.num_maximo_palavras_por_fragmento) -> Iterator[dict]:
+        '''
+        Produz os fragmentos de todos os documentos do índice à medida que são extraídos, para que sejam incluídos na
+        coleção sem que todos os fragmentos sejam mantidos em memória (ver incluir_fragmentos_colecao)
+        '''
+
+        if not indice_documentos: indice_documentos = configuracoes.documentos
+
+        for rotulo, info in indice_documentos.items():
+            print(f'\nProcessando {rotulo}')
+            yield from self.iterar_fragmentos_documento(rotulo=rotulo, info=info, comprimento_max_fragmento=comprimento_max_fragmento)
+
     def extrair_fragmentos(self,
         indice_documentos=None,
-        comprimento_max_fragmento=configuracoes.num_maximo_palavras_por_fragmento):
+        comprimento_max_fragmento=configuracoes.num_maximo_palavras_por_fragmento,
+        num_processos=configuracoes.num_processos_extracao):
+        '''
+        Extrai os fragmentos de todos os documentos do índice. Com num_processos > 1, os documentos são processados
+        em paralelo, por um pool de processos; os fragmentos são reunidos na ordem do índice, de modo que o resultado
+        (inclusive 'tag_fragmento') é o mesmo da extração sequencial.
+        '''
 
         if not indice_documentos: indice_documentos = configuracoes.documentos
 
         fragmentos = []
-        for rotulo, info in indice_documentos.items():
-            print(f'Processando {rotulo}')
-            url = info['url']
-            tipo = url.split('.')[-1]
-            fragmentos += self.extrair_fragmento_por_tipo[tipo](self, rotulo=rotulo, info=info, comprimento_max_fragmento=comprimento_max_fragmento)
-        
+        if not num_processos or num_processos <= 1 or len(indice_documentos) <= 1:
+            for rotulo, info in indice_documentos.items():
+                print(f'Processando {rotulo}')
+                fragmentos += self.extrair_fragmentos_documento(rotulo=rotulo, info=info, comprimento_max_fragmento=comprimento_max_fragmento)
+            return fragmentos
+
+        rotulos = list(indice_documentos.keys())
+        print(f'Processando {len(rotulos)} documentos com {num_processos} processos')
+        with ProcessPoolExecutor(max_workers=min(num_processos, len(rotulos))) as executor:
+            # map() devolve os resultados na ordem dos documentos, independentemente da ordem de conclusão
+            resultados = executor.map(
+                extrair_fragmentos_documento,
+                rotulos,
+                [indice_documentos[rotulo] for rotulo in rotulos],
+                [comprimento_max_fragmento] * len(rotulos))
+            for rotulo, fragmentos_documento in zip(rotulos, resultados):
+                print(f'Processado {rotulo} ({len(fragmentos_documento)} fragmentos)')
+                fragmentos += fragmentos_documento
+
         return fragmentos
 
-    def obter_funcao_embeddings(self, nome_modelo: str=configuracoes.embedding_instructor, instrucao: str=None):
+    def obter_funcao_embeddings(self, nome_modelo: str=configuracoes.embedding_instructor, instrucao: str=None, tamanho_lote: int=configuracoes.tamanho_lote_embeddings_ingestao):
         if nome_modelo == configuracoes.embedding_instructor:
             funcao = FuncaoEmbeddings(
                 nome_modelo=configuracoes.embedding_instructor,
                 tipo_modelo=SentenceTransformer,
                 device=DEVICE,
-                instrucao=instrucao)
+                instrucao=instrucao,
+                tamanho_lote=tamanho_lote)
         elif nome_modelo == configuracoes.embedding_alibaba_gte:
             funcao = FuncaoEmbeddings(
                 nome_modelo=configuracoes.embedding_alibaba_gte,
                 tipo_modelo=SentenceTransformer,
-                device=DEVICE)
+                device=DEVICE,
+                tamanho_lote=tamanho_lote)
         elif nome_modelo == configuracoes.embedding_bge_m3:
             funcao = FuncaoEmbeddings(
                 nome_modelo=configuracoes.embedding_bge_m3,
                 tipo_modelo=SentenceTransformer,
-                device=DEVICE)
+                device=DEVICE,
+                tamanho_lote=tamanho_lote)
         elif nome_modelo == configuracoes.embedding_openai:
             funcao = embedding_functions.OpenAIEmbeddingFunction(
                 api_key = os.environ.get("OPENAI_API_KEY", None),
@@ -308,13 +488,97 @@ class GerenciadorBancoVetores:
             funcao = FuncaoEmbeddings(
                 nome_modelo=configuracoes.embedding_squad_portuguese,
                 tipo_modelo=SentenceTransformer,
-                device=DEVICE
+                device=DEVICE,
+                tamanho_lote=tamanho_lote
             )
         else:
             raise NameError(f'O tipo {nome_modelo} ainda não tem suporte para geração de função de embeddings implementado')
         
         return funcao
-        
+
+    def iterar_ids_fragmentos(self, fragmentos: Iterable[dict], uuid_colecao: str) -> Iterator[dict]:
+        '''
+        Atribui aos fragmentos, à medida que são consumidos, ids determinísticos na coleção (ver gerar_id_fragmento),
+        em 'id' e em metadata['id']
+        '''
+
+        ocorrencias = {}
+        for frag in fragmentos:
+            hash_conteudo = frag['metadata'].setdefault('hash_conteudo', calcular_hash_conteudo(frag['page_content']))
+            chave = (frag['metadata'].get('documento'), hash_conteudo)
+            ocorrencias[chave] = ocorrencias.get(chave, 0) + 1
+            id_frag = gerar_id_fragmento(uuid_colecao, chave[0], hash_conteudo, ocorrencias[chave])
+            frag['id'] = id_frag
+            frag['metadata']['id'] = id_frag
+            yield frag
+
+    def atribuir_ids_fragmentos(self, fragmentos: List[dict], uuid_colecao: str) -> List[str]:
+        '''
+        Atribui aos fragmentos ids determinísticos na coleção (ver iterar_ids_fragmentos)
+
+        Retorna:
+            (List[str]): ids dos fragmentos
+        '''
+        return [frag['id'] for frag in self.iterar_ids_fragmentos(fragmentos, uuid_colecao)]
+
+    def incluir_fragmentos_colecao(self,
+            colecao,
+            funcao_embeddings,
+            fragmentos: Iterable[dict],
+            tamanho_lote_embeddings: int=configuracoes.tamanho_lote_embeddings_ingestao,
+            tamanho_lote_colecao: int=configuracoes.tamanho_lote_insercao_colecao) -> List[str]:
+        '''
+        Inclui fragmentos em uma coleção, gerando os embeddings em lotes. A cada `tamanho_lote_colecao` fragmentos,
+        os textos são ordenados por comprimento antes de serem divididos nos lotes de embeddings (textos de tamanho
+        semelhante em um mesmo lote reduzem o preenchimento/padding), e o conjunto é incluído na coleção em uma única
+        chamada. A ordem de inclusão na coleção é a ordem original dos fragmentos.
+
+        Parâmetros:
+            colecao (chromadb.Collection): coleção em que os fragmentos serão incluídos
+            funcao_embeddings (EmbeddingFunction): função de embeddings da coleção
+            fragmentos (Iterable[dict]): fragmentos, com 'id' (ver atribuir_ids_fragmentos), 'page_content' e 'metadata'.
+                                         Pode ser um gerador (ex.: iterar_fragmentos): apenas `tamanho_lote_colecao`
+                                         fragmentos são mantidos em memória por vez
+            tamanho_lote_embeddings (int): quantidade de fragmentos por chamada à função de embeddings
+            tamanho_lote_colecao (int): quantidade de fragmentos por inclusão na coleção
+
+        Retorna:
+            (List[str]): ids dos fragmentos incluídos
+        '''
+
+        # com um gerador, a quantidade total de fragmentos não é conhecida de antemão
+        total = f' de {len(fragmentos)}' if isinstance(fragmentos, list) else ''
+        iterador_fragmentos = iter(fragmentos)
+        ids_incluidos = []
+        num_processados = 0
+        marcador_tempo_inicio = perf_counter()
+        while True:
+            lote = list(islice(iterador_fragmentos, tamanho_lote_colecao))
+            if not lote:
+                break
+            ordem = sorted(range(len(lote)), key=lambda idx: len(lote[idx]['page_content']))
+            embeddings = [None] * len(lote)
+            for inicio_embeddings in range(0, len(ordem), tamanho_lote_embeddings):
+                indices = ordem[inicio_embeddings:inicio_embeddings + tamanho_lote_embeddings]
+                novos_embeddings = funcao_embeddings([lote[idx]['page_content'] for idx in indices])
+                for idx, embedding in zip(indices, novos_embeddings):
+                    embeddings[idx] = embedding
+
+                num_processados += len(indices)
+                tempo = perf_counter() - marcador_tempo_inicio
+                print(f'\r>>> Incluindo fragmento {num_processados}{total} ({num_processados / tempo if tempo else 0:.1f} fragmentos/s)', end='')
+
+            colecao.add(
+                documents=[frag['page_content'] for frag in lote],
+                ids=[frag['id'] for frag in lote],
+                metadatas=[frag['metadata'] for frag in lote],
+                embeddings=embeddings
+            )
+            ids_incluidos += [frag['id'] for frag in lote]
+
+        tempo = perf_counter() - marcador_tempo_inicio
+        print(f'\n-- {num_processados} fragmentos incluídos em {tempo:.1f}s')
+        return ids_incluidos
     
     def gerar_banco(self,
             documentos,
@@ -335,131 +599,331 @@ class GerenciadorBancoVetores:
                 instrucao=lista_instrucoes[idx]
             ) for idx in range(len(nomes_modelos_embeddings))]
         
+        # um gerador de fragmentos só pode ser percorrido uma vez: com mais de uma coleção, os fragmentos são mantidos em memória
+        if not isinstance(documentos, list) and len(nomes_colecoes) > 1:
+            documentos = list(documentos)
+
         hnsw_space = configuracoes.hnsw_space
         for idx in range(len(nomes_colecoes)):
             colecao = cliente_chroma.create_collection(name=nomes_colecoes[idx], embedding_function=funcoes_embeddings[idx], metadata={'hnsw:space': hnsw_space, 'uuid': uuids_colecoes[idx]})
         
             print(f'>>> Gerando Banco {url_banco_vetores} - Coleção {nomes_colecoes[idx]} - Embeddings {nomes_modelos_embeddings[idx]} - Instrução: {lista_instrucoes[idx]}')
-            qtd_docs = len(documentos)
-            for idx in range(qtd_docs):
-                print(f'\r>>> Incluindo documento {idx+1} de {qtd_docs}', end='')
-                doc = documentos[idx]
-                
-                uuid_doc = str(uuid.uuid4())
-                doc['id'] = uuid_doc
-                doc['metadata']['id'] = uuid_doc
-
-                colecao.add(
-                    documents=[doc['page_content']],
-                    ids=[str(doc['id'])],
-                    metadatas=[doc['metadata']],
-                )
-            print('\n-- Coleção concluída')
+            self.incluir_fragmentos_colecao(
+                colecao=colecao,
+                funcao_embeddings=funcoes_embeddings[idx],
+                fragmentos=self.iterar_ids_fragmentos(documentos, uuids_colecoes[idx]),
+                tamanho_lote_colecao=min(configuracoes.tamanho_lote_insercao_colecao, cliente_chroma.get_max_batch_size()))
+            self.gerar_indice_bm25(colecao=colecao, url_banco_vetores=url_banco_vetores, nome_colecao=nomes_colecoes[idx])
+            print('-- Coleção concluída')
 
         cliente_chroma._system.stop()
 
-    def adicionar_documento_colecao(self,
-            rotulo_documento,
-            comprimento_max_fragmento=configuracoes.num_maximo_palavras_por_fragmento,
-            url_indice_documentos=None,
+    def gerar_indice_bm25(self, colecao, url_banco_vetores: str, nome_colecao: str, tamanho_lote: int=configuracoes.tamanho_lote_insercao_colecao) -> str:
+        '''
+        Gera o índice léxico (BM25) dos fragmentos da coleção, usado na busca híbrida (ver InterfaceHibrida), e o grava
+        na pasta do banco de vetores
+
+        Retorna:
+            (str): caminho do arquivo do índice
+        '''
+        ids, textos = [], []
+        for inicio in range(0, colecao.count(), tamanho_lote):
+            lote = colecao.get(include=['documents'], limit=tamanho_lote, offset=inicio)
+            ids += lote['ids']
+            textos += lote['documents']
+
+        url_indice = obter_url_indice_bm25(url_banco_vetores, nome_colecao)
+        IndiceBM25.construir(ids, textos).salvar(url_indice)
+        print(f'-- Índice BM25 gerado ({len(ids)} fragmentos): {url_indice}')
+        return url_indice
+
+    def sincronizar_colecao(self,
+            indice_documentos=None,
             url_banco_vetores=configuracoes.url_banco_vetores,
             nome_colecao=configuracoes.nome_colecao_de_documentos,
-            nome_modelo_embeddings=configuracoes.embedding_bge_m3):
-        
-        if url_indice_documentos:
-            with open(url_indice_documentos, 'r', encoding='utf-8') as arq:
-                info_documento = json.load(arq)[rotulo_documento]
-        else:
-            info_documento = configuracoes.documentos[rotulo_documento]
-            
-        tipo = info_documento["url"].split('.')[-1]
-        
-        fragmentos = self.extrair_fragmento_por_tipo[tipo](self, rotulo=rotulo_documento, info=info_documento, comprimento_max_fragmento=comprimento_max_fragmento)
+            nome_modelo_embeddings=configuracoes.embedding_bge_m3,
+            instrucao=None,
+            comprimento_max_fragmento=configuracoes.num_maximo_palavras_por_fragmento,
+            remover_ausentes=True,
+            atualizar_banco_relacional=True,
+            num_processos=configuracoes.num_processos_extracao) -> dict:
+        '''
+        Atualiza incrementalmente uma coleção existente a partir do índice de documentos:
+            1. documentos cujo arquivo (hash) e comprimento máximo de fragmento não mudaram não são reprocessados;
+            2. os demais são fragmentados e comparados, pelos ids determinísticos, aos fragmentos armazenados: somente
+               os fragmentos novos são incluídos (gerando embeddings), os que deixaram de existir são removidos e os
+               que mudaram apenas nos metadados (ex.: posição no documento) são atualizados;
+            3. fragmentos a incluir com o mesmo conteúdo de fragmentos removidos (ex.: ids gerados antes dos ids
+               determinísticos) reaproveitam os embeddings armazenados;
+            4. a tabela Documento do banco relacional é atualizada da mesma forma. Documentos referenciados por
+               interações (Documento_em_Interacao) não são removidos da tabela, para preservar o histórico.
+
+        Parâmetros:
+            indice_documentos (dict): índice de documentos (rótulo -> informações). Se não informado, o da configuração
+            url_banco_vetores (str): caminho do banco de vetores
+            nome_colecao (str): nome da coleção a ser atualizada
+            nome_modelo_embeddings (str): modelo da função de embeddings da coleção
+            instrucao (str): instrução da função de embeddings (modelos do tipo instructor)
+            comprimento_max_fragmento (int): quantidade máxima de palavras por fragmento
+            remover_ausentes (bool): remove os fragmentos de documentos que não constam do índice
+            atualizar_banco_relacional (bool): atualiza a tabela Documento do banco relacional
+            num_processos (int): quantidade de processos para a extração de fragmentos
+
+        Retorna:
+            (dict): resumo da sincronização
+        '''
+
+        if not indice_documentos: indice_documentos = configuracoes.documentos
+
         cliente_chroma = chromadb.PersistentClient(path=url_banco_vetores)
-        funcao_embeddings = self.obter_funcao_embeddings(nome_modelo=nome_modelo_embeddings)
-        colecao = cliente_chroma.get_collection(name=nome_colecao, embedding_function=funcao_embeddings)
+        # os embeddings são sempre informados na inclusão: a função de embeddings só é carregada se houver conteúdo novo
+        colecao = cliente_chroma.get_collection(name=nome_colecao, embedding_function=None)
+        uuid_colecao = (colecao.metadata or {}).get('uuid', nome_colecao)
+        tamanho_lote_colecao = min(configuracoes.tamanho_lote_insercao_colecao, cliente_chroma.get_max_batch_size())
+
+        print(f'>>> Sincronizando Banco {url_banco_vetores} - Coleção {nome_colecao} - Embeddings {nome_modelo_embeddings}')
+        resumo = {
+            'documentos_inalterados': 0,
+            'documentos_atualizados': 0,
+            'documentos_novos': 0,
+            'documentos_removidos': 0,
+            'fragmentos_incluidos': 0,
+            'fragmentos_embeddings_reaproveitados': 0,
+            'fragmentos_atualizados': 0,
+            'fragmentos_removidos': 0
+        }
 
-        print(f'>>> Atualizando Banco {url_banco_vetores} - Coleção {nome_colecao} - Embeddings {nome_modelo_embeddings}')
+        armazenados = colecao.get(include=['metadatas'])
+        metadados_armazenados = dict(zip(armazenados['ids'], armazenados['metadatas']))
+        documentos_por_fonte = {info['fonte']: rotulo for rotulo, info in indice_documentos.items()}
+        ids_por_documento = {}
+        for id_frag, metadados in metadados_armazenados.items():
+            ids_por_documento.setdefault(self.__identificar_documento(metadados, documentos_por_fonte), []).append(id_frag)
 
-        uuids_fragmentos_incluidos = []
-        qtd_fragmentos = len(fragmentos)
-        for idx in range(qtd_fragmentos):
-            print(f'\r>>> Incluindo fragmento {idx+1} de {qtd_fragmentos}', end='')
-            frag = fragmentos[idx]
-            
-            uuid_frag = str(uuid.uuid4())
-            frag['id'] = uuid_frag
-            frag['metadata']['id'] = uuid_frag
+        rotulos_processar = []
+        for rotulo, info in indice_documentos.items():
+            ids_documento = ids_por_documento.get(rotulo, [])
+            hash_arquivo = calcular_hash_arquivo(os.path.join(configuracoes.url_pasta_documentos, info['url']))
+            inalterado = ids_documento and all(
+                metadados_armazenados[id_frag].get('hash_arquivo') == hash_arquivo and
+                metadados_armazenados[id_frag].get('comprimento_max_fragmento') == comprimento_max_fragmento
+                for id_frag in ids_documento)
+            if inalterado:
+                resumo['documentos_inalterados'] += 1
+            else:
+                rotulos_processar.append(rotulo)
+                resumo['documentos_atualizados' if ids_documento else 'documentos_novos'] += 1
+
+        fragmentos = []
+        if rotulos_processar:
+            fragmentos = self.extrair_fragmentos(
+                indice_documentos={rotulo: indice_documentos[rotulo] for rotulo in rotulos_processar},
+                comprimento_max_fragmento=comprimento_max_fragmento,
+                num_processos=num_processos)
+        self.atribuir_ids_fragmentos(fragmentos, uuid_colecao)
+        fragmentos_por_id = {frag['id']: frag for frag in fragmentos}
+
+        ids_remover = [
+            id_frag for rotulo in rotulos_processar for id_frag in ids_por_documento.get(rotulo, [])
+            if id_frag not in fragmentos_por_id
+        ]
+        if remover_ausentes:
+            for rotulo, ids_documento in ids_por_documento.items():
+                if rotulo not in indice_documentos:
+                    ids_remover += ids_documento
+                    if rotulo is not None: resumo['documentos_removidos'] += 1
+        ids_incluir = [id_frag for id_frag in fragmentos_por_id if id_frag not in metadados_armazenados]
+        ids_atualizar = [
+            id_frag for id_frag in fragmentos_por_id
+            if id_frag in metadados_armazenados and metadados_armazenados[id_frag] != fragmentos_por_id[id_frag]['metadata']
+        ]
+
+        embeddings_reaproveitaveis = {}
+        if ids_incluir:
+            for inicio in range(0, len(ids_remover), tamanho_lote_colecao):
+                removidos = colecao.get(ids=ids_remover[inicio:inicio + tamanho_lote_colecao], include=['documents', 'embeddings'])
+                for conteudo, embedding in zip(removidos['documents'], removidos['embeddings']):
+                    embeddings_reaproveitaveis[calcular_hash_conteudo(conteudo)] = embedding
 
+        # inclusões antes das remoções: uma falha no meio da sincronização não deixa o documento sem fragmentos
+        fragmentos_incluir = [fragmentos_por_id[id_frag] for id_frag in ids_incluir]
+        fragmentos_reaproveitados = [frag for frag in fragmentos_incluir if frag['metadata']['hash_conteudo'] in embeddings_reaproveitaveis]
+        fragmentos_novos = [frag for frag in fragmentos_incluir if frag['metadata']['hash_conteudo'] not in embeddings_reaproveitaveis]
+        for inicio in range(0, len(fragmentos_reaproveitados), tamanho_lote_colecao):
+            lote = fragmentos_reaproveitados[inicio:inicio + tamanho_lote_colecao]
             colecao.add(
-                documents=[frag['page_content']],
-                ids=[str(frag['id'])],
-                metadatas=[frag['metadata']],
+                documents=[frag['page_content'] for frag in lote],
+                ids=[frag['id'] for frag in lote],
+                metadatas=[frag['metadata'] for frag in lote],
+                embeddings=[embeddings_reaproveitaveis[frag['metadata']['hash_conteudo']] for frag in lote]
             )
-            uuids_fragmentos_incluidos.append(uuid_frag)
-        print('\n-- Coleção atualizada com novo documento')
+        if fragmentos_novos:
+            funcao_embeddings = self.obter_funcao_embeddings(nome_modelo=nome_modelo_embeddings, instrucao=instrucao)
+            self.incluir_fragmentos_colecao(
+                colecao=colecao,
+                funcao_embeddings=funcao_embeddings,
+                fragmentos=fragmentos_novos,
+                tamanho_lote_colecao=tamanho_lote_colecao)
+        for inicio in range(0, len(ids_atualizar), tamanho_lote_colecao):
+            lote = ids_atualizar[inicio:inicio + tamanho_lote_colecao]
+            colecao.update(ids=lote, metadatas=[fragmentos_por_id[id_frag]['metadata'] for id_frag in lote])
+        for inicio in range(0, len(ids_remover), tamanho_lote_colecao):
+            colecao.delete(ids=ids_remover[inicio:inicio + tamanho_lote_colecao])
 
+        resumo['fragmentos_incluidos'] = len(ids_incluir)
+        resumo['fragmentos_embeddings_reaproveitados'] = len(fragmentos_reaproveitados)
+        resumo['fragmentos_atualizados'] = len(ids_atualizar)
+        resumo['fragmentos_removidos'] = len(ids_remover)
+        print(f'-- Coleção sincronizada: {resumo}')
+
+        self.gerar_indice_bm25(colecao=colecao, url_banco_vetores=url_banco_vetores, nome_colecao=nome_colecao)
+
+        if atualizar_banco_relacional:
+            ids_atuais = (set(metadados_armazenados) - set(ids_remover)) | set(ids_incluir)
+            resumo.update(self.__sincronizar_tabela_documentos(
+                colecao=colecao,
+                nome_colecao=nome_colecao,
+                ids_atuais=ids_atuais,
+                ids_removidos=set(ids_remover),
+                ids_atualizados=set(ids_atualizar),
+                fragmentos_por_id=fragmentos_por_id,
+                remover_ausentes=remover_ausentes))
+
+        cliente_chroma._system.stop()
+        return resumo
+
+    def __identificar_documento(self, metadados: dict, documentos_por_fonte: dict):
+        if metadados.get('documento'):
+            return metadados['documento']
+        # fragmentos incluídos antes da sincronização incremental: rótulo em 'tag_fragmento' ('rotulo:n') ou fonte do documento
+        if metadados.get('tag_fragmento'):
+            return metadados['tag_fragmento'].rsplit(':', 1)[0]
+        return documentos_por_fonte.get(metadados.get('fonte', '').split('#')[0])
+
+    def __sincronizar_tabela_documentos(self, colecao, nome_colecao, ids_atuais, ids_removidos, ids_atualizados, fragmentos_por_id, remover_ausentes) -> dict:
         print('Atualizando tabelas SQL...')
         from api.dados.persistencia import GerenciadorPersistenciaSQL, GerenciadorPersistenciaSQLite
         if configuracoes.tipo_persistencia == 'mssql':
             gp = GerenciadorPersistenciaSQL()
         elif configuracoes.tipo_persistencia == 'sqlite':
             gp = GerenciadorPersistenciaSQLite()
-            
-        banco_dados = gp.obter_conexao_banco()
 
+        banco_dados = gp.obter_conexao_banco()
         colecoes_uuids = {
             resultado[1]: str(resultado[0])
             for resultado in banco_dados.executar_query_select(tabela='colecao', colunas=['uuid_colecao', 'nome'])
         }
+        if nome_colecao not in colecoes_uuids:
+            print(f'AVISO: coleção {nome_colecao} não encontrada na tabela Colecao. Tabela Documento não atualizada')
+            gp.encerrar()
+            return {}
+        uuid_colecao = colecoes_uuids[nome_colecao]
+
+        ids_banco = {
+            str(resultado[0])
+            for resultado in banco_dados.executar_query_select(query='SELECT UUID_Documento FROM Documento WHERE UUID_Colecao = ?;', dados=(uuid_colecao,))
+        }
+        ids_inserir = [id_frag for id_frag in ids_atuais if id_frag not in ids_banco]
+        ids_atualizar = [id_frag for id_frag in ids_atualizados if id_frag in ids_banco]
+        ids_remover = list(ids_banco - ids_atuais) if remover_ausentes else list(ids_banco & ids_removidos)
+
+        # conteúdo e metadados dos fragmentos a inserir que não foram processados nesta sincronização
+        fragmentos_inserir = {id_frag: fragmentos_por_id[id_frag] for id_frag in ids_inserir if id_frag in fragmentos_por_id}
+        ids_buscar = [id_frag for id_frag in ids_inserir if id_frag not in fragmentos_inserir]
+        tamanho_lote = configuracoes.tamanho_lote_insercao
+        for inicio in range(0, len(ids_buscar), tamanho_lote):
+            armazenados = colecao.get(ids=ids_buscar[inicio:inicio + tamanho_lote], include=['documents', 'metadatas'])
+            for id_frag, conteudo, metadados in zip(armazenados['ids'], armazenados['documents'], armazenados['metadatas']):
+                fragmentos_inserir[id_frag] = {'page_content': conteudo, 'metadata': metadados}
 
         query_inserir_doc = 'INSERT INTO Documento ' + \
                             '(UUID_Documento, Tag_Fragmento, Conteudo, Titulo, Subtitulo, Autor, Fonte, UUID_Colecao) ' + \
                             'VALUES (?,?,?,?,?,?,?,?);'
-        
-        fragmentos = colecao.get(ids=uuids_fragmentos_incluidos)
+        lista_dados = []
+        for id_frag, frag in fragmentos_inserir.items():
+            metadados = frag['metadata']
+            lista_dados.append((id_frag, metadados.get('tag_fragmento'), frag['page_content'], metadados['titulo'],
+                                metadados['subtitulo'], metadados['autor'], metadados['fonte'], uuid_colecao))
+        banco_dados.executar_query_insercao_em_lote(query=query_inserir_doc, lista_dados=lista_dados)
 
-        fragmentos = [
-                {
-                    'id': fragmentos['ids'][idx],
-                    'conteudo': fragmentos['documents'][idx],
-                    'metadados':  fragmentos['metadatas'][idx],
-                }
-                for idx in range(len(fragmentos['ids']))
-            ]
-        
-        for idx, frag in enumerate(fragmentos):
-            print(f'\r>>> Persistindo fragmento {idx+1} de {len(fragmentos)}', end='')
-            uuid_documento=frag['metadados']['id']
-            tag_fragmento=frag['metadados']['tag_fragmento']
-            conteudo=frag['conteudo']
-            titulo=frag['metadados']['titulo']
-            subtitulo=frag['metadados']['subtitulo']
-            autor=frag['metadados']['autor']
-            fonte=frag['metadados']['fonte']
-            uuid_colecao=colecoes_uuids[nome_colecao]
-            
-            dados = [uuid_documento, tag_fragmento, conteudo, titulo, subtitulo, autor, fonte, uuid_colecao]
-            id_doc_inserido = banco_dados.executar_query_insercao(query=query_inserir_doc, dados=dados)
+        query_atualizar_doc = 'UPDATE Documento SET Tag_Fragmento=?, Titulo=?, Subtitulo=?, Autor=?, Fonte=? WHERE UUID_Documento=?;'
+        dados_atualizar = []
+        for id_frag in ids_atualizar:
+            metadados = fragmentos_por_id[id_frag]['metadata']
+            dados_atualizar.append((metadados.get('tag_fragmento'), metadados['titulo'], metadados['subtitulo'], metadados['autor'], metadados['fonte'], id_frag))
+
+        # documentos referenciados por interações são mantidos
+        ids_referenciados = set()
+        for inicio in range(0, len(ids_remover), tamanho_lote):
+            lote = ids_remover[inicio:inicio + tamanho_lote]
+            query = f'''SELECT DISTINCT UUID_Documento FROM Documento_em_Interacao WHERE UUID_Documento IN ({','.join('?' * len(lote))});'''
+            ids_referenciados.update(str(resultado[0]) for resultado in banco_dados.executar_query_select(query=query, dados=tuple(lote)))
+        ids_excluir = [id_frag for id_frag in ids_remover if id_frag not in ids_referenciados]
+
+        multiplas_queries = [query_atualizar_doc] * len(dados_atualizar) + ['DELETE FROM Documento WHERE UUID_Documento=?;'] * len(ids_excluir)
+        multiplos_dados = dados_atualizar + [(id_frag,) for id_frag in ids_excluir]
+        if multiplas_queries:
+            banco_dados.executar_query_insercao_multipla(multiplas_queries=multiplas_queries, multiplos_dados=multiplos_dados)
+        gp.encerrar()
+
+        resumo = {
+            'documentos_sql_inseridos': len(lista_dados),
+            'documentos_sql_atualizados': len(dados_atualizar),
+            'documentos_sql_removidos': len(ids_excluir),
+            'documentos_sql_mantidos_por_referencia': len(ids_referenciados)
+        }
+        print(f'-- Tabelas SQL atualizadas: {resumo}')
+        return resumo
+
+    def adicionar_documento_colecao(self,
+            rotulo_documento,
+            comprimento_max_fragmento=configuracoes.num_maximo_palavras_por_fragmento,
+            url_indice_documentos=None,
+            url_banco_vetores=configuracoes.url_banco_vetores,
+            nome_colecao=configuracoes.nome_colecao_de_documentos,
+            nome_modelo_embeddings=configuracoes.embedding_bge_m3):
         
-        print('\n-- Tabelas SQL atualizadas!')
-        return None
+        if url_indice_documentos:
+            with open(url_indice_documentos, 'r', encoding='utf-8') as arq:
+                info_documento = json.load(arq)[rotulo_documento]
+        else:
+            info_documento = configuracoes.documentos[rotulo_documento]
+
+        # sincronização restrita ao documento: executada novamente, não duplica os fragmentos
+        return self.sincronizar_colecao(
+            indice_documentos={rotulo_documento: info_documento},
+            url_banco_vetores=url_banco_vetores,
+            nome_colecao=nome_colecao,
+            nome_modelo_embeddings=nome_modelo_embeddings,
+            comprimento_max_fragmento=comprimento_max_fragmento,
+            remover_ausentes=False,
+            num_processos=1)
 
         
+
     def executar(self,
             indice_documentos=None,
             url_banco_vetores=configuracoes.url_banco_vetores,
             nomes_colecoes=[configuracoes.nome_colecao_de_documentos],
             nomes_modelos_embeddings=[configuracoes.embedding_bge_m3],
             comprimento_max_fragmento=configuracoes.num_maximo_palavras_por_fragmento,
-            lista_instrucoes=None):
+            lista_instrucoes=None,
+            num_processos=configuracoes.num_processos_extracao):
         
         print(f"-- Geração de bancos vetoriais inicializada utilizando {DEVICE}...")
         
-        docs = self.extrair_fragmentos(
-            indice_documentos=indice_documentos,
-            comprimento_max_fragmento=comprimento_max_fragmento
-        )
+        if num_processos and num_processos > 1:
+            docs = self.extrair_fragmentos(
+                indice_documentos=indice_documentos,
+                comprimento_max_fragmento=comprimento_max_fragmento,
+                num_processos=num_processos
+            )
+        else:
+            # extração sequencial: os fragmentos são extraídos à medida que são incluídos na coleção
+            docs = self.iterar_fragmentos(
+                indice_documentos=indice_documentos,
+                comprimento_max_fragmento=comprimento_max_fragmento
+            )
         
         uuids_colecoes = [str(uuid.uuid4()) for colecao in nomes_colecoes]
         self.gerar_banco(
@@ -517,6 +981,12 @@ class GerenciadorBancoVetores:
             idx_artif.add_dir(url_banco_vetores)
             run.log_artifact(idx_artif)
             #run.use_artifact(configuracoes.wandb_uri_artefato_banco_vetorial, type='banco-vetorial').download(root='./api/dados/bancos_vetores/')
+
+
+
+def extrair_fragmentos_documento(rotulo, info, comprimento_max_fragmento):
+    '''Extrai os fragmentos de um documento. Função de módulo, para ser executada nos processos de extração paralela'''
+    return GerenciadorBancoVetores().extrair_fragmentos_documento(rotulo=rotulo, info=info, comprimento_max_fragmento=comprimento_max_fragmento)
         
         
 if __name__ == "__main__":
@@ -528,6 +998,7 @@ if __name__ == "__main__":
     parser.add_argument('--lista_nomes_modelos_embeddings', type=str, required=True, help='''uma lista com os tipos das funções de embeddings no formato "['openai', 'instructor']''')
     parser.add_argument('--comprimento_max_fragmento', type=int, required=True, help="número máximo de palavras por fragmento")
     parser.add_argument('--lista_instrucoes', type=str, help="lsita de instrucoes a serem utilizadas nas funções de embeddings de modelos")
+    parser.add_argument('--num_processos', type=int, help="quantidade de processos para a extração dos fragmentos dos documentos")
 
     args = parser.parse_args()
     url_indice_documentos = None if not args.url_indice_documentos else args.url_indice_documentos
@@ -555,7 +1026,8 @@ if __name__ == "__main__":
         nomes_colecoes=nomes_colecoes,
         nomes_modelos_embeddings=nomes_modelos_embeddings,
         comprimento_max_fragmento=comprimento_max_fragmento,
-        lista_instrucoes=lista_instrucoes)
+        lista_instrucoes=lista_instrucoes,
+        num_processos=configuracoes.num_processos_extracao if not args.num_processos else args.num_processos)
     
 ## Modelo de Execução
 # python -m api.dados.gerenciador_banco_vetores \
@@ -0,0 +1,114 @@
+import argparse
+
+from api.configuracoes.config_gerais import configuracoes
+from api.dados.formato_interacao import (PREFIXO_COMPRIMIDO, FORMATO_COMPACTO, calcular_hash_template,
+                                         codificar_json_interacao, compactar_interacao, decodificar_json_interacao)
+from api.dados.persistencia import GerenciadorPersistencia, GerenciadorPersistenciaSQL, GerenciadorPersistenciaSQLite
+
+# criação da tabela Template_System em bancos gerados antes do armazenamento compacto
+SCRIPTS_TABELA_TEMPLATES = {
+    'sqlite': '''CREATE TABLE IF NOT EXISTS Template_System (
+                     Hash_Template TEXT NOT NULL,
+                     Conteudo TEXT,
+                     Data_Criacao DATETIME DEFAULT (CURRENT_TIMESTAMP),
+                     PRIMARY KEY (Hash_Template));''',
+    'mssql': '''IF OBJECT_ID('Template_System', 'U') IS NULL
+                 CREATE TABLE Template_System (
+                     Hash_Template CHAR(64) NOT NULL,
+                     Conteudo VARCHAR(MAX),
+                     Data_Criacao DATETIME DEFAULT GETDATE(),
+                     CONSTRAINT Pk_Template_System PRIMARY KEY (Hash_Template))'''
+}
+
+
+def migrar_interacoes(gerenciador: GerenciadorPersistencia, comprimir: bool=False, tamanho_lote: int=200, simular: bool=False) -> dict:
+    '''
+    Converte as interações já armazenadas para o formato compacto: JSON_Interacao passa a conter apenas ids e scores
+    dos documentos (opcionalmente comprimido) e LLM_Template_System, o hash do template (armazenado em Template_System).
+    Interações já convertidas (com a mesma opção de compressão) não são alteradas, de modo que a migração pode ser
+    interrompida e executada novamente.
+
+    Parâmetros:
+        gerenciador (GerenciadorPersistencia): gerenciador do banco a ser migrado
+        comprimir (bool): comprime o JSON das interações com zlib
+        tamanho_lote (int): quantidade de interações lidas e atualizadas por transação
+        simular (bool): apenas calcula a redução de tamanho, sem alterar o banco
+
+    Retorna:
+        (dict): quantidade de interações analisadas e convertidas e tamanho total de JSON_Interacao antes e depois
+    '''
+
+    banco_dados = gerenciador.obter_conexao_banco()
+    if not simular:
+        banco_dados.executar_script(SCRIPTS_TABELA_TEMPLATES[gerenciador.info_banco['tipo_persistencia']])
+
+    # apenas os ids são carregados de uma vez; o conteúdo é lido e atualizado em lotes
+    ids_interacoes = [str(linha[0]) for linha in banco_dados.executar_query_select(tabela='Interacao', colunas=['UUID_Interacao'])]
+
+    query_atualizar = 'UPDATE Interacao SET LLM_Template_System=?, JSON_Interacao=? WHERE UUID_Interacao=?;'
+    resultado = {'interacoes': len(ids_interacoes), 'interacoes_convertidas': 0, 'tamanho_original': 0, 'tamanho_final': 0}
+    for inicio in range(0, len(ids_interacoes), tamanho_lote):
+        lote = ids_interacoes[inicio:inicio + tamanho_lote]
+        query_selecionar = f'''SELECT UUID_Interacao, LLM_Template_System, JSON_Interacao FROM Interacao WHERE UUID_Interacao IN ({','.join('?' * len(lote))});'''
+        linhas = banco_dados.executar_query_select(query=query_selecionar, dados=tuple(lote))
+
+        multiplas_queries = []
+        multiplos_dados = []
+        for uuid_interacao, template_system, json_interacao in linhas:
+            tamanho_original = len(json_interacao or '') + len(template_system or '')
+            resultado['tamanho_original'] += tamanho_original
+            dados_interacao = decodificar_json_interacao(json_interacao)
+            ja_convertida = dados_interacao is None or (
+                dados_interacao.get('formato_json_interacao') == FORMATO_COMPACTO and json_interacao.startswith(PREFIXO_COMPRIMIDO) == comprimir)
+            if ja_convertida:
+                resultado['tamanho_final'] += tamanho_original
+                continue
+
+            if dados_interacao.get('formato_json_interacao') == FORMATO_COMPACTO:
+                hash_template = dados_interacao.get('hash_template_system_llm')
+            else:
+                template_system = dados_interacao.get('template_system_llm') or template_system
+                hash_template = None
+                if template_system:
+                    hash_template = gerenciador.persistir_template(template_system) if not simular else calcular_hash_template(template_system)
+            novo_json_interacao = codificar_json_interacao(compactar_interacao(dados_interacao, hash_template=hash_template), comprimir=comprimir)
+
+            resultado['tamanho_final'] += len(novo_json_interacao) + len(hash_template or '')
+            resultado['interacoes_convertidas'] += 1
+            multiplas_queries.append(query_atualizar)
+            multiplos_dados.append((hash_template, novo_json_interacao, str(uuid_interacao)))
+
+        if multiplas_queries and not simular:
+            banco_dados.executar_query_insercao_multipla(multiplas_queries=multiplas_queries, multiplos_dados=multiplos_dados)
+        print(f'--- {min(inicio + tamanho_lote, len(ids_interacoes))}/{len(ids_interacoes)} interações analisadas')
+
+    return resultado
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Converte as interações armazenadas para o formato compacto (JSON_Interacao sem o conteúdo dos documentos e template de system em Template_System)")
+    parser.add_argument('--comprimir', action='store_true', help="comprime o JSON das interações com zlib")
+    parser.add_argument('--tamanho_lote', type=int, help="quantidade de interações atualizadas por transação")
+    parser.add_argument('--simular', action='store_true', help="apenas calcula a redução de tamanho, sem alterar o banco")
+    args = parser.parse_args()
+
+    tamanho_lote = 200 if not args.tamanho_lote else args.tamanho_lote
+
+    if configuracoes.tipo_persistencia == 'mssql':
+        gp = GerenciadorPersistenciaSQL()
+    elif configuracoes.tipo_persistencia == 'sqlite':
+        gp = GerenciadorPersistenciaSQLite()
+
+    print(f"Migrando interações de {gp.info_banco['nome_banco']} para o formato compacto{' (simulação)' if args.simular else ''}")
+    resultado = migrar_interacoes(gerenciador=gp, comprimir=args.comprimir, tamanho_lote=tamanho_lote, simular=args.simular)
+    gp.encerrar()
+
+    reducao = 1 - resultado['tamanho_final'] / resultado['tamanho_original'] if resultado['tamanho_original'] else 0
+    print(f"{resultado['interacoes_convertidas']} de {resultado['interacoes']} interações convertidas")
+    print(f"Tamanho de JSON_Interacao + LLM_Template_System: {resultado['tamanho_original']:,} -> {resultado['tamanho_final']:,} caracteres ({reducao:.1%} de redução)")
+    if configuracoes.tipo_persistencia == 'sqlite' and not args.simular:
+        print('Para liberar o espaço no arquivo do banco, execute VACUUM (ex.: sqlite3 <arquivo> "VACUUM;")')
+
+# Modelo de execução
+# python -m api.dados.migrar_interacoes --simular
+# python -m api.dados.migrar_interacoes --comprimir --tamanho_lote 200
@@ -1,17 +1,27 @@
 import os
-from typing import Tuple
+import threading
+from contextlib import contextmanager
+from typing import List, Tuple
 import uuid
 from chromadb import chromadb
 import json
 import sqlite3
 import pymssql
 from api.configuracoes.config_gerais import configuracoes
+from api.dados.formato_interacao import calcular_hash_template, codificar_json_interacao, compactar_interacao
+from api.dados.pool_conexoes import ConexoesPorThread, PoolConexoes
 
 
 class InterfacePersistencia:
     def __init__(self):
         pass
     
+    def conexao(self):
+        raise NotImplementedError('Método conexao() não foi implantado para esta classe')
+
+    def fechar(self):
+        pass
+
     def executar_script(self, script: str):
         raise NotImplementedError('Método executar_script() não foi implantado para esta classe')
         
@@ -20,6 +30,12 @@ class InterfacePersistencia:
     
     def __insert_multiplo(self, multiplas_queries: list, multiplos_dados: list):
         raise NotImplementedError('Método __insert_multiplo() não foi implantado para esta classe')
+
+    def executar_query_insercao_em_lote(self, query: str, lista_dados: List[tuple], tamanho_lote: int=configuracoes.tamanho_lote_insercao):
+        raise NotImplementedError('Método executar_query_insercao_em_lote() não foi implantado para esta classe')
+
+    def executar_upsert(self, tabela: str, colunas_chave: Tuple[str], colunas: Tuple[str], dados: tuple):
+        raise NotImplementedError('Método executar_upsert() não foi implantado para esta classe')
             
     def __update(self, query: str, dados: tuple):
         raise NotImplementedError('Método __update() não foi implantado para esta classe')
@@ -29,7 +45,7 @@ class InterfacePersistencia:
 
 
 class InterfacePersistenciaSQL(InterfacePersistencia):
-    def __init__(self, url_banco, encryption, porta, usuario, senha, database):
+    def __init__(self, url_banco, encryption, porta, usuario, senha, database, usar_pool: bool=configuracoes.usar_pool_conexoes):
         
         super().__init__()
         self.parametros = {
@@ -40,9 +56,35 @@ class InterfacePersistenciaSQL(InterfacePersistencia):
             'password': senha,
             'database': database
         }
+        self.pool = PoolConexoes(fabrica_conexao=self.abrir_conexao, verificar_conexao=self.verificar_conexao) if usar_pool else None
+
+    def abrir_conexao(self):
+        return pymssql.connect(**self.parametros)
+
+    def verificar_conexao(self, conexao):
+        cursor = conexao.cursor()
+        try:
+            cursor.execute('SELECT 1')
+            cursor.fetchall()
+        finally:
+            cursor.close()
+
+    @contextmanager
+    def conexao(self):
+        '''Fornece uma conexão do pool (ou uma nova conexão, fechada ao final, quando o pool não é utilizado)'''
+        if self.pool:
+            with self.pool.conexao() as conexao:
+                yield conexao
+        else:
+            with self.abrir_conexao() as conexao:
+                yield conexao
+
+    def fechar(self):
+        if self.pool:
+            self.pool.fechar()
     
     def executar_script(self, script: str):
-        with pymssql.connect(**self.parametros) as conexao:
+        with self.conexao() as conexao:
             try:
                 cursor = conexao.cursor()
                 for statement in script.split(';'):
@@ -61,7 +103,7 @@ class InterfacePersistenciaSQL(InterfacePersistencia):
                 cursor.close()
         
     def __insert(self, query: str, dados: tuple):
-        with pymssql.connect(**self.parametros) as conexao:
+        with self.conexao() as conexao:
             query = query.replace('?', '%s')
             try:
                 cursor = conexao.cursor()
@@ -77,7 +119,7 @@ class InterfacePersistenciaSQL(InterfacePersistencia):
     
     def __insert_multiplo(self, multiplas_queries: list, multiplos_dados: list):
         ids_insercoes = {}
-        with pymssql.connect(**self.parametros) as conexao:
+        with self.conexao() as conexao:
             try:
                 cursor = conexao.cursor()
                 parametros = list(zip(multiplas_queries, multiplos_dados))
@@ -97,9 +139,77 @@ class InterfacePersistenciaSQL(InterfacePersistencia):
         
     def executar_query_insercao_multipla(self, multiplas_queries: list, multiplos_dados: list):
         return self.__insert_multiplo(multiplas_queries, multiplos_dados)
+
+    def executar_query_insercao_em_lote(self, query: str, lista_dados: List[tuple], tamanho_lote: int=configuracoes.tamanho_lote_insercao):
+        '''
+        Insere várias linhas com a mesma query, em uma única transação. As linhas são agrupadas em comandos
+        INSERT com múltiplas tuplas em VALUES (o executemany do pymssql executa um comando por linha)
+
+        Parâmetros:
+            query (str): query de inserção de uma linha, no formato 'INSERT INTO Tabela (...) VALUES (?,...,?);'
+            lista_dados (List[tuple]): dados de cada linha
+            tamanho_lote (int): quantidade máxima de linhas por comando
+
+        Retorna:
+            (int): quantidade de linhas inseridas
+        '''
+
+        if not lista_dados:
+            return 0
+
+        inicio_query, valores = query.rsplit('VALUES', 1)
+        tupla_valores = valores.strip().rstrip(';').replace('?', '%s')
+        num_colunas = tupla_valores.count('%s')
+        # limites do SQL Server: 1000 tuplas por VALUES e 2100 parâmetros por comando
+        tamanho_lote = max(1, min(tamanho_lote, 1000, 2100 // num_colunas))
+
+        num_linhas = 0
+        with self.conexao() as conexao:
+            cursor = conexao.cursor()
+            try:
+                for inicio in range(0, len(lista_dados), tamanho_lote):
+                    lote = lista_dados[inicio:inicio + tamanho_lote]
+                    query_lote = f"{inicio_query}VALUES {','.join([tupla_valores] * len(lote))};"
+                    cursor.execute(query_lote, tuple(valor for dados in lote for valor in dados))
+                    num_linhas += cursor.rowcount
+                conexao.commit()
+                return num_linhas
+            finally:
+                cursor.close()
             
+    def executar_upsert(self, tabela: str, colunas_chave: Tuple[str], colunas: Tuple[str], dados: tuple):
+        '''
+        Insere a linha ou, caso já exista uma linha com a mesma chave, atualiza as demais colunas, em um único
+        comando (MERGE com HOLDLOCK, para que inserções concorrentes da mesma chave não gerem violação de chave primária)
+
+        Parâmetros:
+            tabela (str): nome da tabela
+            colunas_chave (Tuple[str]): colunas da chave primária
+            colunas (Tuple[str]): todas as colunas informadas (incluindo as da chave)
+            dados (tuple): valores das colunas, na ordem de `colunas`
+
+        Retorna:
+            (int): quantidade de linhas inseridas ou atualizadas
+        '''
+
+        colunas_atualizar = [coluna for coluna in colunas if coluna not in colunas_chave]
+        query = f'''MERGE INTO {tabela} WITH (HOLDLOCK) AS destino ''' + \
+                f'''USING (SELECT {', '.join(f'%s AS {coluna}' for coluna in colunas)}) AS origem ''' + \
+                f'''ON {' AND '.join(f'destino.{coluna} = origem.{coluna}' for coluna in colunas_chave)} ''' + \
+                f'''WHEN MATCHED THEN UPDATE SET {', '.join(f'{coluna} = origem.{coluna}' for coluna in colunas_atualizar)} ''' + \
+                f'''WHEN NOT MATCHED THEN INSERT ({', '.join(colunas)}) VALUES ({', '.join(f'origem.{coluna}' for coluna in colunas)});'''
+        with self.conexao() as conexao:
+            try:
+                cursor = conexao.cursor()
+                cursor.execute(query, dados)
+                num_linhas = cursor.rowcount
+                conexao.commit()
+                return num_linhas
+            finally:
+                cursor.close()
+
     def __update(self, query: str, dados: tuple):
-        with pymssql.connect(**self.parametros) as conexao:
+        with self.conexao() as conexao:
             try:
                 query = query.replace('?', '%s')
                 cursor = conexao.cursor()
@@ -115,20 +225,22 @@ class InterfacePersistenciaSQL(InterfacePersistencia):
             
     def __select(self, tabela: str, colunas: tuple):
         query = f'''SELECT {', '.join(colunas)} FROM {configuracoes.configuracoes_banco_sql()['schema']}.{tabela}'''
-        with pymssql.connect(**self.parametros) as conexao:
+        with self.conexao() as conexao:
             try:
                 cursor = conexao.cursor()
                 cursor.execute('SET TRANSACTION ISOLATION LEVEL READ UNCOMMITTED')
                 cursor.execute(query)
                 resultado = cursor.fetchall()
                 conexao.commit()
+                # a conexão é reaproveitada pelo pool: restaura o nível de isolamento padrão
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL READ COMMITTED')
                 return resultado
             finally:
                 cursor.close()
     
     def executar_query_select(self, tabela: str=None, colunas: Tuple[str]=None, query: str=None, dados: Tuple[str]=None):
         if query and dados:
-            with pymssql.connect(**self.parametros) as conexao:
+            with self.conexao() as conexao:
                 try:
                     query = query.replace('?', '%s')
                     cursor  = conexao.cursor()
@@ -145,12 +257,43 @@ class InterfacePersistenciaSQL(InterfacePersistencia):
 
 
 class InterfacePersistenciaSQLite(InterfacePersistencia):
-    def __init__(self, url_banco):
+    def __init__(self, url_banco, usar_pool: bool=configuracoes.usar_pool_conexoes, pragmas: dict=configuracoes.sqlite_pragmas):
         super().__init__()
         self.url_banco=url_banco
+        # ex.: journal_mode=WAL, synchronous=NORMAL, mmap_size, cache_size, busy_timeout
+        self.pragmas = pragmas if pragmas else {}
+        self.conexoes = ConexoesPorThread(fabrica_conexao=self.abrir_conexao) if usar_pool else None
+
+    def abrir_conexao(self):
+        # cada conexão é usada por uma única thread; check_same_thread=False permite fechá-las a partir de outra thread
+        conexao = sqlite3.connect(self.url_banco, check_same_thread=False)
+        conexao.execute("PRAGMA foreign_keys = ON;")
+        for nome, valor in self.pragmas.items():
+            conexao.execute(f'PRAGMA {nome} = {valor};')
+        return conexao
+
+    @contextmanager
+    def conexao(self):
+        '''Fornece a conexão da thread atual (ou uma nova conexão, fechada ao final, quando o cache não é utilizado)'''
+        if self.conexoes:
+            with self.conexoes.conexao() as conexao:
+                yield conexao
+        else:
+            conexao = self.abrir_conexao()
+            try:
+                yield conexao
+            except Exception:
+                conexao.rollback()
+                raise
+            finally:
+                conexao.close()
+
+    def fechar(self):
+        if self.conexoes:
+            self.conexoes.fechar()
     
     def executar_script(self, script: str):
-        with sqlite3.connect(self.url_banco) as conexao:
+        with self.conexao() as conexao:
             try:
                 conexao.executescript(script)
                 print(f'Dados persistidos em {self.url_banco}')
@@ -160,9 +303,8 @@ class InterfacePersistenciaSQLite(InterfacePersistencia):
                 raise
         
     def __insert(self, query: str, dados: tuple):
-        with sqlite3.connect(self.url_banco) as conexao:
+        with self.conexao() as conexao:
             try:
-                conexao.execute("PRAGMA foreign_keys = ON;")
                 cursor = conexao.execute(query, dados)
                 num_linhas = cursor.rowcount
                 conexao.commit()
@@ -175,8 +317,7 @@ class InterfacePersistenciaSQLite(InterfacePersistencia):
     
     def __insert_multiplo(self, multiplas_queries: list, multiplos_dados: list):
         ids_insercoes = {}
-        with sqlite3.connect(self.url_banco) as conexao:
-            conexao.execute("PRAGMA foreign_keys = ON;")
+        with self.conexao() as conexao:
             try:
                 cursor = conexao.cursor()
                 parametros = list(zip(multiplas_queries, multiplos_dados))
@@ -195,11 +336,60 @@ class InterfacePersistenciaSQLite(InterfacePersistencia):
         
     def executar_query_insercao_multipla(self, multiplas_queries: list, multiplos_dados: list):
         return self.__insert_multiplo(multiplas_queries, multiplos_dados)
+
+    def executar_query_insercao_em_lote(self, query: str, lista_dados: List[tuple], tamanho_lote: int=configuracoes.tamanho_lote_insercao):
+        '''
+        Insere várias linhas com a mesma query (executemany, em lotes de `tamanho_lote` linhas), em uma única transação
+
+        Retorna:
+            (int): quantidade de linhas inseridas
+        '''
+
+        if not lista_dados:
+            return 0
+
+        num_linhas = 0
+        with self.conexao() as conexao:
+            cursor = conexao.cursor()
+            try:
+                for inicio in range(0, len(lista_dados), tamanho_lote):
+                    cursor.executemany(query, lista_dados[inicio:inicio + tamanho_lote])
+                    num_linhas += cursor.rowcount
+                conexao.commit()
+                return num_linhas
+            finally:
+                cursor.close()
             
+    def executar_upsert(self, tabela: str, colunas_chave: Tuple[str], colunas: Tuple[str], dados: tuple):
+        '''
+        Insere a linha ou, caso já exista uma linha com a mesma chave, atualiza as demais colunas, em um único
+        comando (INSERT ... ON CONFLICT DO UPDATE)
+
+        Parâmetros:
+            tabela (str): nome da tabela
+            colunas_chave (Tuple[str]): colunas da chave primária
+            colunas (Tuple[str]): todas as colunas informadas (incluindo as da chave)
+            dados (tuple): valores das colunas, na ordem de `colunas`
+
+        Retorna:
+            (int): quantidade de linhas inseridas ou atualizadas
+        '''
+
+        colunas_atualizar = [coluna for coluna in colunas if coluna not in colunas_chave]
+        query = f'''INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({','.join('?' * len(colunas))}) ''' + \
+                f'''ON CONFLICT ({', '.join(colunas_chave)}) DO UPDATE SET {', '.join(f'{coluna} = excluded.{coluna}' for coluna in colunas_atualizar)};'''
+        with self.conexao() as conexao:
+            try:
+                cursor = conexao.execute(query, dados)
+                num_linhas = cursor.rowcount
+                conexao.commit()
+                return num_linhas
+            finally:
+                cursor.close()
+
     def __update(self, query: str, dados: tuple):
-        with sqlite3.connect(self.url_banco) as conexao:
+        with self.conexao() as conexao:
             try:
-                conexao.execute("PRAGMA foreign_keys = ON;")
                 cursor = conexao.execute(query, dados)
                 num_linhas = cursor.rowcount
                 conexao.commit()
@@ -212,7 +402,7 @@ class InterfacePersistenciaSQLite(InterfacePersistencia):
             
     def __select(self, tabela: str, colunas: tuple):
         query = f'''SELECT {','.join(colunas)} FROM {tabela}'''
-        with sqlite3.connect(self.url_banco) as conexao:
+        with self.conexao() as conexao:
             try:
                 cursor = conexao.cursor()
                 cursor.execute(query)
@@ -224,7 +414,7 @@ class InterfacePersistenciaSQLite(InterfacePersistencia):
     
     def executar_query_select(self, tabela: str=None, colunas: Tuple[str]=None, query: str=None, dados: Tuple[str]=None):
         if query and dados:
-            with sqlite3.connect(self.url_banco) as conexao:
+            with self.conexao() as conexao:
                 try:
                     cursor  = conexao.cursor()
                     cursor.execute(query, dados)
@@ -241,16 +431,34 @@ class InterfacePersistenciaSQLite(InterfacePersistencia):
 
 class GerenciadorPersistencia:
 
-    def __init__(self, info_banco: dict, classeInterface: type):
+    def __init__(self,
+                 info_banco: dict,
+                 classeInterface: type,
+                 armazenamento_compacto: bool=configuracoes.armazenamento_interacao_compacto,
+                 comprimir_json_interacao: bool=configuracoes.comprimir_json_interacao):
         self.info_banco = info_banco
         self.classeInterface = classeInterface
+        # uma única interface (e, portanto, um único pool de conexões) por gerenciador
+        self.banco_dados = None
+        # armazenamento compacto: JSON_Interacao sem conteúdo dos documentos e LLM_Template_System com o hash do template
+        self.armazenamento_compacto = armazenamento_compacto
+        self.comprimir_json_interacao = comprimir_json_interacao
+        self.hashes_templates_persistidos = set()
+        self.trava_templates = threading.Lock()
 
     def obter_conexao_banco(self):
-        return self.classeInterface(**self.info_banco['parametros'])
+        if self.banco_dados is None:
+            self.banco_dados = self.classeInterface(**self.info_banco['parametros'])
+        return self.banco_dados
+
+    def encerrar(self):
+        if self.banco_dados is not None:
+            self.banco_dados.fechar()
+            self.banco_dados = None
 
     def inicializar_banco(self, url_script_sql: str=configuracoes.url_script_geracao_banco_sqlite):
 
-        banco_dados = self.classeInterface(**self.info_banco['parametros'])
+        banco_dados = self.obter_conexao_banco()
 
         print(f"Inicializando banco ({self.info_banco['tipo_persistencia']}) {self.info_banco['nome_banco']} usando {url_script_sql}")
         with open(url_script_sql, 'r') as arq:
@@ -262,7 +470,7 @@ class GerenciadorPersistencia:
         with open(url_descritor_banco_vetorial, 'r', encoding='utf-8') as arq:
             desc_banco_vetorial = json.load(arq)
             
-        banco_dados = self.classeInterface(**self.info_banco['parametros'])
+        banco_dados = self.obter_conexao_banco()
         ids_colecoes_salvas={}
         for colecao in desc_banco_vetorial['colecoes']:
             uuid_colecao=colecao['uuid']
@@ -288,7 +496,7 @@ class GerenciadorPersistencia:
         with open(url_descritor_banco_vetorial, 'r', encoding='utf-8') as arq:
             desc_banco_vetorial = json.load(arq)
             
-        banco_dados = self.classeInterface(**self.info_banco['parametros'])
+        banco_dados = self.obter_conexao_banco()
         colecoes_uuids = {
             resultado[1]: resultado[0]
             for resultado in banco_dados.executar_query_select(tabela='colecao', colunas=['uuid_colecao', 'nome'])
@@ -301,6 +509,7 @@ class GerenciadorPersistencia:
         client = chromadb.PersistentClient(path=f'''api/dados/bancos_vetores/{desc_banco_vetorial['nome']}''')
         
         docs_inseridos={}
+        lista_dados = []
         for colecao in desc_banco_vetorial['colecoes']:
             collection = client.get_collection(name=colecao['nome'])
             documentos = collection.get()
@@ -323,21 +532,88 @@ class GerenciadorPersistencia:
                 fonte=doc['metadados']['fonte']
                 uuid_colecao=colecoes_uuids[colecao['nome']]
                 
-                dados = [uuid_documento, tag_fragmento, conteudo, titulo, subtitulo, autor, fonte, uuid_colecao]
-                
-                id_doc_inserido = banco_dados.executar_query_insercao(query=query_inserir_doc, dados=dados)
-                docs_inseridos[uuid_documento] = id_doc_inserido
+                dados = (uuid_documento, tag_fragmento, conteudo, titulo, subtitulo, autor, fonte, uuid_colecao)
+                lista_dados.append(dados)
+                docs_inseridos[uuid_documento] = 1
                 
         client._system.stop()
+
+        num_inseridos = banco_dados.executar_query_insercao_em_lote(query=query_inserir_doc, lista_dados=lista_dados)
+        print(f'''{num_inseridos} documentos salvos em {self.info_banco['nome_banco']}''')
         
         return docs_inseridos
     
+    def persistir_template(self, template: str) -> str:
+        '''
+        Armazena o template de system na tabela Template_System, caso ainda não tenha sido armazenado
+
+        Retorna:
+            (str): hash do template (chave na tabela Template_System)
+        '''
+
+        hash_template = calcular_hash_template(template)
+        with self.trava_templates:
+            if hash_template in self.hashes_templates_persistidos:
+                return hash_template
+
+        self.obter_conexao_banco().executar_upsert(
+            tabela='Template_System',
+            colunas_chave=('Hash_Template',),
+            colunas=('Hash_Template', 'Conteudo'),
+            dados=(hash_template, template))
+        with self.trava_templates:
+            self.hashes_templates_persistidos.add(hash_template)
+        return hash_template
+
     def persistir_interacao(self, dados_interacao: dict):
+        multiplas_queries, multiplos_dados = self.preparar_interacao(dados_interacao)
+        banco_dados = self.obter_conexao_banco()
+        try:
+            banco_dados.executar_query_insercao_multipla(multiplas_queries=multiplas_queries, multiplos_dados=multiplos_dados)
+            return dados_interacao['uuid_interacao']
+        except Exception as e:
+            print(f'Ocorreu um erro: {e}')
+            raise
+
+    def persistir_interacoes(self, lista_dados_interacoes: List[dict]):
+        '''
+        Persiste várias interações em uma única transação. As interações devem ter sido preparadas
+        com preparar_interacao() (ou seja, já possuem 'uuid_interacao')
+
+        Retorna:
+            (List[str]): uuids das interações persistidas
+        '''
+
+        self.executar_comandos_interacoes([self.preparar_interacao(dados_interacao) for dados_interacao in lista_dados_interacoes])
+        return [dados_interacao['uuid_interacao'] for dados_interacao in lista_dados_interacoes]
+
+    def executar_comandos_interacoes(self, comandos_interacoes: List[Tuple[list, list]]):
+        '''
+        Executa, em uma única transação, os comandos de inserção de várias interações, já montados por preparar_interacao()
+        (usado pelo EscritorPersistencia, que prepara as interações ao enfileirá-las)
+        '''
+
+        multiplas_queries = []
+        multiplos_dados = []
+        for queries, dados in comandos_interacoes:
+            multiplas_queries += queries
+            multiplos_dados += dados
+
+        banco_dados = self.obter_conexao_banco()
+        banco_dados.executar_query_insercao_multipla(multiplas_queries=multiplas_queries, multiplos_dados=multiplos_dados)
+
+    def preparar_interacao(self, dados_interacao: dict) -> Tuple[list, list]:
+        '''
+        Monta os comandos de inserção da interação e dos documentos utilizados nela. Caso a interação ainda não
+        tenha 'uuid_interacao', ele é gerado e atribuído a dados_interacao
+
+        Retorna:
+            (Tuple[list, list]): queries e respectivos dados
+        '''
 
         multiplas_queries = []
         multiplos_dados = []
 
-        banco_dados = self.classeInterface(**self.info_banco['parametros'])
         query_inserir_interacao = 'INSERT INTO Interacao ' + \
                                   '(UUID_Interacao, Pergunta, Tipo_Dispositivo_Aplicacao, Tipo_Dispositivo_LLM, Tempo_Recuperacao_Documentos, ' + \
                                   'Tempo_Estimativa_Bert, LLM_Template_System, LLM_Historico, LLM_Cliente, LLM_Nome_Modelo, ' + \
@@ -346,7 +622,14 @@ class GerenciadorPersistencia:
                                   'LLM_Tipo_Conclusao, Intencao, JSON_Interacao, UUID_Sessao, UUID_Cliente) ' + \
                                   'VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?);'
 
-        dados_interacao['uuid_interacao'] = str(uuid.uuid4())
+        if not dados_interacao.get('uuid_interacao'):
+            dados_interacao['uuid_interacao'] = str(uuid.uuid4())
+
+        template_system = dados_interacao['template_system_llm']
+        dados_json_interacao = dados_interacao
+        if self.armazenamento_compacto:
+            template_system = self.persistir_template(template_system) if template_system else None
+            dados_json_interacao = compactar_interacao(dados_interacao, hash_template=template_system)
         dados_inserir_interacao=(
             dados_interacao['uuid_interacao'],
             dados_interacao['pergunta'],
@@ -354,7 +637,7 @@ class GerenciadorPersistencia:
             dados_interacao['tipo_dispositivo_llm'],
             dados_interacao['tempo_recuperacao_documentos'],
             dados_interacao['tempo_estimativa_bert'],
-            dados_interacao['template_system_llm'],
+            template_system,                                                                                                                         # no armazenamento compacto, hash do template (tabela Template_System)
             str(dados_interacao['historico_llm']),
             dados_interacao['cliente_llm'],
             dados_interacao['modelo_llm'],
@@ -366,9 +649,10 @@ class GerenciadorPersistencia:
             dados_interacao['tempo_inicio_stream_resposta'],
             dados_interacao['tempo_total_llm'],
             dados_interacao['resposta'],
-            dados_interacao['resposta_completa_llm']['done_reason'] if dados_interacao['resposta_completa_llm'] else None,                           # tipo_conclusao_llm
+            'cache' if dados_interacao.get('resposta_em_cache') else                                                                                 # tipo_conclusao_llm ('cache' quando a resposta foi reaproveitada)
+            dados_interacao['resposta_completa_llm']['done_reason'] if dados_interacao['resposta_completa_llm'] else None,
             dados_interacao['intencao'],                                                                                                             # intenção do usuário segundo predito pelo classificador
-            json.dumps(dados_interacao, ensure_ascii=False),                                                                                         # conteúdo completo da interação em json-string
+            codificar_json_interacao(dados_json_interacao, comprimir=self.comprimir_json_interacao),                                                 # conteúdo da interação em json-string (completo ou compacto, opcionalmente comprimido)
             dados_interacao['id_sessao'],                                                                                                            # identificador da sessão de que a intereção faz parte
             dados_interacao['id_cliente']
         )
@@ -392,46 +676,24 @@ class GerenciadorPersistencia:
 
             multiplas_queries.append(query_inserir_doc_interacao)
             multiplos_dados.append(dados_inserir_doc_interacao)
+
+        return multiplas_queries, multiplos_dados
+
+    def persistir_avaliacao(self, dados_avaliacao: dict):
+        banco_dados = self.obter_conexao_banco()
+
+        # insere a avaliação ou substitui a anterior da mesma interação, sem consulta prévia
+        dados_avaliacao_interacao = (dados_avaliacao['uuid_interacao'], dados_avaliacao['avaliacao'], dados_avaliacao['comentario'])
         try:
-            banco_dados.executar_query_insercao_multipla(multiplas_queries=multiplas_queries, multiplos_dados=multiplos_dados)
-            return dados_interacao['uuid_interacao']
+            return banco_dados.executar_upsert(
+                tabela='Avaliacao_Interacao',
+                colunas_chave=('UUID_Interacao',),
+                colunas=('UUID_Interacao', 'Avaliacao', 'Comentario'),
+                dados=dados_avaliacao_interacao)
         except Exception as e:
             print(f'Ocorreu um erro: {e}')
             raise
 
-    def persistir_avaliacao(self, dados_avaliacao: dict):
-        banco_dados = self.classeInterface(**self.info_banco['parametros'])
-
-        # AFAZER: implementar select com where nas interfaces de persistência
-        query = f'''SELECT * FROM Avaliacao_Interacao WHERE UUID_Interacao = ?;'''
-        dados = (dados_avaliacao['uuid_interacao'],)
-
-        resultados = banco_dados.executar_query_select(query=query, dados=dados)
-
-        if len(resultados) == 0:
-            query_inserir_avaliacao = 'INSERT INTO Avaliacao_Interacao ' + \
-                                      '(UUID_Interacao, Avaliacao, Comentario) ' + \
-                                      'VALUES (?,?,?);'
-            
-            dados_inserir_avaliacao = (dados_avaliacao['uuid_interacao'], dados_avaliacao['avaliacao'], dados_avaliacao['comentario'])
-
-            try:
-                return banco_dados.executar_query_insercao(query=query_inserir_avaliacao, dados=dados_inserir_avaliacao)
-            except Exception as e:
-                print(f'Ocorreu um erro: {e}')
-                raise
-        else:
-            query_atualizar_avaliacao = 'UPDATE Avaliacao_Interacao ' + \
-                                        'SET Avaliacao=?, Comentario=? ' + \
-                                        'WHERE UUID_Interacao = ?;'
-            
-            dados_atualizar_avaliacao =  (dados_avaliacao['avaliacao'], dados_avaliacao['comentario'], dados_avaliacao['uuid_interacao'])
-            try:
-                return banco_dados.executar_query_update(query=query_atualizar_avaliacao, dados=dados_atualizar_avaliacao)
-            except Exception as e:
-                print(f'Ocorreu um erro: {e}')
-                raise
-
 
 class GerenciadorPersistenciaSQLite(GerenciadorPersistencia):
     def __init__(self, info_banco: dict=configuracoes.configuracoes_banco_sqlite()):
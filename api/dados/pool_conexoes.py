@@ -0,0 +1,231 @@
+import threading
+from contextlib import contextmanager
+from queue import Empty, LifoQueue
+from time import monotonic
+from typing import Callable
+
+from api.configuracoes.config_gerais import configuracoes
+
+
+class PoolConexoes:
+    '''
+    Pool de conexões com banco de dados, para evitar o custo de abrir uma conexão (ex.: autenticação no SQL Server)
+    a cada comando executado. Cada conexão é usada por uma única thread por vez.
+
+    Conexões que ficaram ociosas por mais de `intervalo_verificacao` segundos são testadas antes de serem
+    reutilizadas, e substituídas caso estejam inválidas (ex.: encerradas pelo servidor).
+
+    Atributos:
+        fabrica_conexao (Callable): função que abre uma nova conexão
+        verificar_conexao (Callable): função que recebe uma conexão e gera exceção caso ela não esteja válida
+        tamanho_minimo (int): quantidade de conexões abertas no primeiro uso do pool e mantidas ociosas
+        tamanho_maximo (int): quantidade máxima de conexões abertas simultaneamente
+        intervalo_verificacao (float): tempo ocioso, em segundos, a partir do qual a conexão é testada antes do uso
+        timeout (float): tempo máximo, em segundos, de espera por uma conexão livre
+    '''
+
+    def __init__(self,
+                 fabrica_conexao: Callable,
+                 verificar_conexao: Callable=None,
+                 tamanho_minimo: int=configuracoes.pool_conexoes_tamanho_minimo,
+                 tamanho_maximo: int=configuracoes.pool_conexoes_tamanho_maximo,
+                 intervalo_verificacao: float=configuracoes.pool_conexoes_intervalo_verificacao,
+                 timeout: float=configuracoes.pool_conexoes_timeout):
+        if tamanho_maximo < 1 or tamanho_minimo > tamanho_maximo:
+            raise ValueError('Tamanhos do pool inválidos: é necessário que 1 <= tamanho máximo e tamanho mínimo <= tamanho máximo')
+        self.fabrica_conexao = fabrica_conexao
+        self.verificar_conexao = verificar_conexao
+        self.tamanho_minimo = tamanho_minimo
+        self.tamanho_maximo = tamanho_maximo
+        self.intervalo_verificacao = intervalo_verificacao
+        self.timeout = timeout
+
+        # conexões livres, com o instante em que foram devolvidas. LIFO: as usadas mais recentemente são reaproveitadas primeiro
+        self.conexoes_livres = LifoQueue()
+        self.trava = threading.Lock()
+        self.num_conexoes = 0
+        self.fechado = False
+        # as conexões mínimas são abertas no primeiro uso, para que a indisponibilidade do banco não impeça a inicialização da aplicação
+        self.preenchido = False
+
+    def __preencher(self):
+        with self.trava:
+            if self.preenchido:
+                return
+            self.preenchido = True
+            num_abrir = self.tamanho_minimo - self.num_conexoes
+        for _ in range(num_abrir):
+            self.conexoes_livres.put((self.__abrir_conexao(), monotonic()))
+
+    def __abrir_conexao(self):
+        with self.trava:
+            self.num_conexoes += 1
+        try:
+            return self.fabrica_conexao()
+        except Exception:
+            with self.trava:
+                self.num_conexoes -= 1
+            raise
+
+    def __descartar_conexao(self, conexao):
+        with self.trava:
+            self.num_conexoes -= 1
+        try:
+            conexao.close()
+        except Exception:
+            pass
+
+    def __conexao_valida(self, conexao, instante_devolucao: float) -> bool:
+        if not self.verificar_conexao or monotonic() - instante_devolucao < self.intervalo_verificacao:
+            return True
+        try:
+            self.verificar_conexao(conexao)
+            return True
+        except Exception:
+            return False
+
+    def obter(self):
+        '''
+        Obtém uma conexão do pool, abrindo uma nova caso não haja conexões livres e o tamanho máximo não tenha sido
+        atingido. A conexão deve ser devolvida com devolver()
+        '''
+
+        if self.fechado:
+            raise RuntimeError('O pool de conexões foi encerrado')
+        if not self.preenchido:
+            self.__preencher()
+
+        limite_espera = monotonic() + self.timeout if self.timeout else None
+        while True:
+            try:
+                conexao, instante_devolucao = self.conexoes_livres.get_nowait()
+            except Empty:
+                with self.trava:
+                    pode_abrir = self.num_conexoes < self.tamanho_maximo
+                if pode_abrir:
+                    return self.__abrir_conexao()
+                tempo_restante = limite_espera - monotonic() if limite_espera else None
+                if tempo_restante is not None and tempo_restante <= 0:
+                    raise TimeoutError(f'Nenhuma conexão livre no pool após {self.timeout} segundos')
+                try:
+                    conexao, instante_devolucao = self.conexoes_livres.get(timeout=tempo_restante)
+                except Empty:
+                    continue
+
+            if self.__conexao_valida(conexao, instante_devolucao):
+                return conexao
+            # conexão inválida: descarta e tenta a próxima (ou abre outra)
+            self.__descartar_conexao(conexao)
+
+    def devolver(self, conexao, descartar: bool=False):
+        '''Devolve a conexão ao pool. Conexões com falha (descartar=True) são fechadas'''
+        if descartar or self.fechado:
+            self.__descartar_conexao(conexao)
+        else:
+            self.conexoes_livres.put((conexao, monotonic()))
+
+    @contextmanager
+    def conexao(self):
+        '''
+        Gerenciador de contexto que obtém uma conexão e a devolve ao final. Em caso de exceção, a transação
+        em aberto é desfeita (rollback); se o rollback falhar, a conexão é descartada
+        '''
+
+        conexao = self.obter()
+        descartar = False
+        try:
+            yield conexao
+        except Exception:
+            try:
+                conexao.rollback()
+            except Exception:
+                descartar = True
+            raise
+        finally:
+            self.devolver(conexao, descartar=descartar)
+
+    def fechar(self):
+        '''Fecha as conexões livres. As conexões em uso são fechadas quando devolvidas'''
+        self.fechado = True
+        while True:
+            try:
+                conexao, _ = self.conexoes_livres.get_nowait()
+            except Empty:
+                break
+            self.__descartar_conexao(conexao)
+
+    def estatisticas(self) -> dict:
+        return {
+            'conexoes_abertas': self.num_conexoes,
+            'conexoes_livres': self.conexoes_livres.qsize(),
+            'tamanho_minimo': self.tamanho_minimo,
+            'tamanho_maximo': self.tamanho_maximo
+        }
+
+
+class ConexoesPorThread:
+    '''
+    Mantém uma conexão por thread, reutilizada em todos os comandos executados pela thread. Adequado ao SQLite,
+    cujas conexões não podem ser compartilhadas entre threads e não têm custo de autenticação, e às threads do
+    pool de execução da API, que são reaproveitadas entre requisições.
+
+    Atributos:
+        fabrica_conexao (Callable): função que abre uma nova conexão
+    '''
+
+    def __init__(self, fabrica_conexao: Callable):
+        self.fabrica_conexao = fabrica_conexao
+        self.locais = threading.local()
+        self.trava = threading.Lock()
+        self.conexoes = []
+
+    def obter(self):
+        conexao = getattr(self.locais, 'conexao', None)
+        if conexao is None:
+            conexao = self.fabrica_conexao()
+            self.locais.conexao = conexao
+            with self.trava:
+                self.conexoes.append(conexao)
+        return conexao
+
+    def __descartar_conexao_thread(self):
+        conexao = self.locais.conexao
+        self.locais.conexao = None
+        with self.trava:
+            self.conexoes.remove(conexao)
+        try:
+            conexao.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def conexao(self):
+        '''
+        Gerenciador de contexto que fornece a conexão da thread atual. Em caso de exceção, a transação em aberto
+        é desfeita (rollback); se o rollback falhar, a conexão é descartada
+        '''
+
+        conexao = self.obter()
+        try:
+            yield conexao
+        except Exception:
+            try:
+                conexao.rollback()
+            except Exception:
+                self.__descartar_conexao_thread()
+            raise
+
+    def fechar(self):
+        '''Fecha as conexões de todas as threads'''
+        with self.trava:
+            conexoes, self.conexoes = self.conexoes, []
+        for conexao in conexoes:
+            try:
+                conexao.close()
+            except Exception:
+                pass
+        self.locais = threading.local()
+
+    def estatisticas(self) -> dict:
+        with self.trava:
+            return {'conexoes_abertas': len(self.conexoes)}
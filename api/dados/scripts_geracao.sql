@@ -66,7 +66,18 @@ CREATE TABLE Avaliacao_Interacao (
     Data_Criacao DATETIME DEFAULT GETDATE(),
     CONSTRAINT Pk_Avaliacao_Interacao PRIMARY KEY (UUID_Interacao));
 
+CREATE TABLE Template_System (
+    Hash_Template CHAR(64) NOT NULL,
+    Conteudo VARCHAR(MAX),
+    Data_Criacao DATETIME DEFAULT GETDATE(),
+    CONSTRAINT Pk_Template_System PRIMARY KEY (Hash_Template));
+
 ALTER TABLE Documento ADD CONSTRAINT Fk_Documento_Colecao FOREIGN KEY(UUID_Colecao) REFERENCES Colecao (UUID_Colecao);
 ALTER TABLE Documento_em_Interacao ADD CONSTRAINT Fk_Documento_em_Interacao_Documento FOREIGN KEY(UUID_Documento) REFERENCES Documento (UUID_Documento);
 ALTER TABLE Documento_em_Interacao ADD CONSTRAINT Fk_Documento_em_Interacao_Interacao FOREIGN KEY(UUID_Interacao) REFERENCES Interacao (UUID_Interacao);
-ALTER TABLE Avaliacao_Interacao ADD CONSTRAINT Fk_Avaliacao_Interacao FOREIGN KEY (UUID_Interacao) REFERENCES Interacao (UUID_Interacao);
\ No newline at end of file
+ALTER TABLE Avaliacao_Interacao ADD CONSTRAINT Fk_Avaliacao_Interacao FOREIGN KEY (UUID_Interacao) REFERENCES Interacao (UUID_Interacao);
+CREATE INDEX Idx_Interacao_UUID_Sessao ON Interacao (UUID_Sessao);
+CREATE INDEX Idx_Interacao_UUID_Cliente ON Interacao (UUID_Cliente);
+CREATE INDEX Idx_Interacao_Data_Criacao ON Interacao (Data_Criacao);
+CREATE INDEX Idx_Interacao_Intencao ON Interacao (Intencao);
+CREATE INDEX Idx_Documento_em_Interacao_UUID_Interacao ON Documento_em_Interacao (UUID_Interacao);
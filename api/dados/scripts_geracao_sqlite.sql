@@ -73,4 +73,17 @@ CREATE TABLE Avaliacao_Interacao (
     Data_Criacao DATETIME DEFAULT (CURRENT_TIMESTAMP),
     PRIMARY KEY (UUID_Interacao),
     FOREIGN KEY (UUID_Interacao) REFERENCES Interacao (UUID_Interacao)
-);
\ No newline at end of file
+);
+
+CREATE TABLE Template_System (
+    Hash_Template TEXT NOT NULL,
+    Conteudo TEXT,
+    Data_Criacao DATETIME DEFAULT (CURRENT_TIMESTAMP),
+    PRIMARY KEY (Hash_Template)
+);
+
+CREATE INDEX IF NOT EXISTS Idx_Interacao_UUID_Sessao ON Interacao (UUID_Sessao);
+CREATE INDEX IF NOT EXISTS Idx_Interacao_UUID_Cliente ON Interacao (UUID_Cliente);
+CREATE INDEX IF NOT EXISTS Idx_Interacao_Data_Criacao ON Interacao (Data_Criacao);
+CREATE INDEX IF NOT EXISTS Idx_Interacao_Intencao ON Interacao (Intencao);
+CREATE INDEX IF NOT EXISTS Idx_Documento_em_Interacao_UUID_Interacao ON Documento_em_Interacao (UUID_Interacao);
@@ -0,0 +1,62 @@
+import argparse
+import json
+import os
+
+from api.configuracoes.config_gerais import configuracoes
+from api.dados.gerenciador_banco_vetores import GerenciadorBancoVetores
+
+
+def obter_descritor_colecao(url_banco_vetores: str, nome_colecao: str) -> dict:
+    '''Informações da coleção no descritor.json do banco de vetores (gerado por GerenciadorBancoVetores.executar)'''
+    try:
+        with open(os.path.join(url_banco_vetores, 'descritor.json'), 'r', encoding='utf-8') as arq:
+            descritor = json.load(arq)
+    except FileNotFoundError:
+        return {}
+    for colecao in descritor.get('colecoes', []):
+        if colecao['nome'] == nome_colecao:
+            return colecao
+    return {}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Atualiza incrementalmente uma coleção do banco vetorial a partir do índice de documentos: somente fragmentos novos geram embeddings")
+    parser.add_argument('--url_indice_documentos', type=str, help="caminho para arquivo com a lista de documentos")
+    parser.add_argument('--nome_banco_vetores', type=str, required=True, help="nome do banco de vetores a ser atualizado")
+    parser.add_argument('--nome_colecao', type=str, required=True, help="nome da coleção a ser atualizada")
+    parser.add_argument('--nome_modelo_embeddings', type=str, help="modelo da função de embeddings (padrão: o do descritor.json)")
+    parser.add_argument('--comprimento_max_fragmento', type=int, help="número máximo de palavras por fragmento (padrão: o do descritor.json)")
+    parser.add_argument('--manter_ausentes', action='store_true', help="não remove os fragmentos de documentos que não constam do índice")
+    parser.add_argument('--sem_banco_relacional', action='store_true', help="não atualiza a tabela Documento do banco relacional")
+    parser.add_argument('--num_processos', type=int, help="quantidade de processos para a extração dos fragmentos dos documentos")
+    args = parser.parse_args()
+
+    if args.url_indice_documentos:
+        with open(args.url_indice_documentos, 'r', encoding='utf-8') as arq:
+            indice_documentos = json.load(arq)
+    else:
+        indice_documentos = None
+
+    url_banco_vetores = os.path.join(configuracoes.url_pasta_bancos_vetores, args.nome_banco_vetores)
+    descritor_colecao = obter_descritor_colecao(url_banco_vetores, args.nome_colecao)
+
+    nome_modelo_embeddings = args.nome_modelo_embeddings or descritor_colecao.get('funcao_embeddings', {}).get('nome_modelo') or configuracoes.embedding_bge_m3
+    comprimento_max_fragmento = args.comprimento_max_fragmento or descritor_colecao.get('quantidade_max_palavras_por_documento') or configuracoes.num_maximo_palavras_por_fragmento
+
+    resumo = GerenciadorBancoVetores().sincronizar_colecao(
+        indice_documentos=indice_documentos,
+        url_banco_vetores=url_banco_vetores,
+        nome_colecao=args.nome_colecao,
+        nome_modelo_embeddings=nome_modelo_embeddings,
+        instrucao=descritor_colecao.get('instrucao'),
+        comprimento_max_fragmento=comprimento_max_fragmento,
+        remover_ausentes=not args.manter_ausentes,
+        atualizar_banco_relacional=not args.sem_banco_relacional,
+        num_processos=configuracoes.num_processos_extracao if not args.num_processos else args.num_processos)
+
+    print(json.dumps(resumo, ensure_ascii=False, indent=4))
+
+# Modelo de execução
+# python -m api.dados.sincronizar_banco_vetores \
+# --nome_banco_vetores banco_assistente \
+# --nome_colecao documentos_rh_bge_m3
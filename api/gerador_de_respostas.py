@@ -1,17 +1,24 @@
+import asyncio
 import json
+from functools import partial
+from typing import Callable, Dict, List
 from torch import cuda
-from concurrent.futures import ThreadPoolExecutor
-from time import sleep, time
+from time import time
 import wandb
 from random import choice
 
 from api.configuracoes.config_gerais import configuracoes
 from api.dados.persistencia import GerenciadorPersistencia
+from api.dados.escritor_persistencia import EscritorPersistencia
 from api.utils.interface_llm import InterfaceLLM, DadosChat
 from api.utils.interface_banco_vetores import InterfaceBancoVetorial
 from api.utils.reclassificador import Reclassificador
 from api.utils.mensagem import MensagemControle, MensagemDados, MensagemErro, MensagemInfo
 from api.utils.gerador_prompts import GeradorPrompts
+from api.utils.executor_etapas import ExecutorEtapas
+from api.utils.cache import CacheLRU, CacheRespostas
+from api.utils.seletor_contexto import SeletorContexto
+from api.utils.roteador_documentos import RoteadorDocumentos
     
 
 class GeradorDeRespostas:
@@ -25,7 +32,13 @@ class GeradorDeRespostas:
                  reclassificador: Reclassificador,
                  gerenciador_persistencia:GerenciadorPersistencia,
                  fazer_log:bool=True,
-                 device: str=None):
+                 device: str=None,
+                 funcao_de_embeddings: Callable[[List[str]], List[List[float]]]=None,
+                 caches: Dict[str, CacheLRU]=None,
+                 cache_respostas: CacheRespostas=None,
+                 seletor_contexto: SeletorContexto=None,
+                 escritor_persistencia: EscritorPersistencia=None,
+                 roteador_documentos: RoteadorDocumentos=None):
         
         if configuracoes.usar_wandb:
             self.wandb_run = wandb.init(
@@ -39,25 +52,60 @@ class GeradorDeRespostas:
             self.tabela_log_requisicao = None
         self.fazer_log = fazer_log
         self.device = device
-        self.executor = ThreadPoolExecutor(max_workers=configuracoes.threadpool_max_workers)
+        # etapas bloqueantes (Chroma, Bert, persistência) são executadas fora do event loop,
+        # para que os streams de outras requisições não sejam interrompidos
+        self.executor = ExecutorEtapas(
+            max_workers=configuracoes.threadpool_max_workers,
+            limites_etapas=configuracoes.limites_concorrencia_etapas)
 
         self.interface_banco_vetorial = interface_banco_vetorial
 
+        # quando fornecida, a pergunta é convertida em embeddings uma única vez por requisição,
+        # e o vetor é reaproveitado pelo classificador de intenção e pela consulta ao banco vetorial
+        self.funcao_de_embeddings = funcao_de_embeddings
+        # caches utilizados no pipeline, cujas estatísticas são expostas pelo health
+        self.caches = caches if caches else {}
+        # gravação das interações em segundo plano (quando None, as interações são gravadas antes do fim da resposta)
+        self.escritor_persistencia = escritor_persistencia
+        # seleção dos documentos incluídos no prompt (limiares de score, agrupamento de artigos e limite de tokens)
+        self.seletor_contexto = seletor_contexto
+        # filtros de metadados atribuídos pelas palavras-chave da pergunta (consulta restrita aos documentos citados)
+        self.roteador_documentos = roteador_documentos
+        # respostas completas do pipeline RAG, reaproveitadas para perguntas semanticamente equivalentes
+        self.cache_respostas = cache_respostas
+        # respostas armazenadas só são reaproveitadas se geradas com a mesma coleção e os mesmos modelos
+        self.versao_cache_respostas = (
+            configuracoes.nome_colecao_de_documentos,
+            configuracoes.modelo_funcao_de_embeddings,
+            configuracoes.cliente_llm,
+            configuracoes.modelo_llm)
+
         self.reestimador = reclassificador
         
         self.interface_llm = interface_llm
         
         self.gerenciador_persistencia = gerenciador_persistencia
         
-    def health(self):
-        status_code_llm = self.interface_llm.health()
+    async def health(self):
+        try:
+            status_code_llm = await self.interface_llm.health()
+        except Exception:
+            status_code_llm = None
         return json.dumps({
             'status_api': 'Ativo',
-            'status_cliente_llm': 'Ativo' if status_code_llm == 200 else 'Inativo'
+            'status_cliente_llm': 'Ativo' if status_code_llm == 200 else 'Inativo',
+            'caches': {nome: cache.estatisticas() for nome, cache in self.caches.items()},
+            'escritor_persistencia': self.escritor_persistencia.estatisticas() if self.escritor_persistencia else None
         })
 
-    async def consultar_documentos_banco_vetores(self, pergunta: str, num_resultados:int=configuracoes.num_documentos_retornados):
-        return self.interface_banco_vetorial.consultar_documentos(pergunta, num_resultados)
+    async def gerar_embeddings_pergunta(self, pergunta: str) -> List[float]:
+        if not self.funcao_de_embeddings:
+            return None
+        embeddings = await self.executor.executar('embeddings', self.funcao_de_embeddings, [pergunta])
+        return embeddings[0]
+
+    async def consultar_documentos_banco_vetores(self, pergunta: str, num_resultados:int=configuracoes.num_documentos_retornados, embeddings_pergunta: List[float]=None, filtros: dict=None):
+        return await self.executor.executar('consulta', self.interface_banco_vetorial.consultar_documentos, pergunta, num_resultados, embeddings_consulta=embeddings_pergunta, filtros=filtros)
     
     def formatar_lista_documentos(self, documentos: dict):
         return [
@@ -69,12 +117,74 @@ class GeradorDeRespostas:
             } for idx in range(len(documentos['ids'][0]))
         ]
 
-    async def reclassificar_documentos(self, pergunta, texto_documento: str):
-        return self.reestimador.reclassificar_documento(pergunta=pergunta, texto_documento=texto_documento)
+    async def reclassificar_documentos(self, pergunta, textos_documentos: List[str], ids_documentos: List[str]=None):
+        return await self.executor.executar('reclassificacao', self.reestimador.reclassificar_documentos, pergunta=pergunta, textos_documentos=textos_documentos, ids_documentos=ids_documentos)
+
+    async def persistir_interacao(self, dados_interacao: dict):
+        if self.escritor_persistencia:
+            return await self.executor.executar('persistencia', self.escritor_persistencia.enfileirar, dados_interacao=dados_interacao)
+        return await self.executor.executar('persistencia', self.gerenciador_persistencia.persistir_interacao, dados_interacao=dados_interacao)
     
+    async def aplicar_reclassificacao(self, pergunta: str, lista_documentos_formatados: List[dict]):
+        '''
+        Aplica o reclassificador aos documentos recuperados e os reordena pelo score atribuído
+
+        Retorna:
+            (Tuple[List[dict], float, bool]): lista reordenada, tempo gasto e indicador de sucesso. Em caso de falha,
+                                              os documentos recebem o menor score possível e a ordem é mantida
+        '''
+
+        marcador_tempo_inicio = time()
+        sucesso = True
+        try:
+            respostas_estimadas = await self.reclassificar_documentos(
+                pergunta,
+                textos_documentos=[documento['conteudo'] for documento in lista_documentos_formatados],
+                ids_documentos=[documento['id'] for documento in lista_documentos_formatados])
+            for documento, resposta_estimada in zip(lista_documentos_formatados, respostas_estimadas):
+                documento['score_bert'] = resposta_estimada['score']
+                documento['score_ponderado'] = resposta_estimada['score_ponderado']
+                documento['resposta_bert'] = resposta_estimada['resposta']
+        except Exception:
+            sucesso = False
+            for documento in lista_documentos_formatados:
+                documento['score_bert'] = (float('-inf'), float('-inf'))
+                documento['score_ponderado'] = float('-inf')
+                documento['resposta_bert'] = 'Resposta não estimada'
+
+        # reordenando lista com base no score atribuído pelo Bert
+        lista_documentos_formatados = sorted(lista_documentos_formatados, key=lambda x: x['score_bert'][0], reverse=True)
+        marcador_tempo_fim = time()
+        tempo_estimativa_bert = marcador_tempo_fim - marcador_tempo_inicio
+        if self.fazer_log: print(f'--- scores atribuídos ({tempo_estimativa_bert} segundos)')
+        return lista_documentos_formatados, tempo_estimativa_bert, sucesso
+
+    def selecionar_contexto(self, lista_documentos_formatados: List[dict]) -> List[dict]:
+        '''Aplica o seletor de contexto, caso configurado. Retorna None quando todos os documentos devem ser utilizados'''
+        if self.seletor_contexto is None:
+            return None
+        blocos_contexto = self.seletor_contexto.selecionar(lista_documentos_formatados)
+        if self.fazer_log: print(f'--- contexto selecionado: {sum(len(bloco["ids"]) for bloco in blocos_contexto)} de {len(lista_documentos_formatados)} documentos, em {len(blocos_contexto)} blocos')
+        return blocos_contexto
+
+    def mensagem_lista_documentos(self, lista_documentos_formatados: List[dict]) -> str:
+        return MensagemDados(
+            descricao='Lista de Documentos Recuperados',
+            dados={
+                'tag': 'lista-docs-recuperados',
+                'conteudo': lista_documentos_formatados
+            }
+            ).json() + '\n'
+
+    def mensagem_falha_reclassificacao(self) -> str:
+        return MensagemInfo(
+            descricao='Falha na aplicação do BERT',
+            mensagem='Houve erro na aplicação dos valores, mas o processo continuou. Scores atribuídos com menor valor possível'
+        ).json() + '\n'
+
     async def enviar_prompt_llm(self, prompt: str, historico: list):
         if self.fazer_log:
-            print(f'--- gerando resposta com o cliente LLM')
+            print('--- gerando resposta com o cliente LLM')
 
         yield MensagemControle(
             descricao='Informação de Status',
@@ -131,12 +241,13 @@ class GeradorDeRespostas:
             print(f'CONCLUÍDO POR ERRO: Falha na conexão com o LLM. Ollama offline ou {configuracoes.modelo_llm} não disponível. {excecao.__class__.__name__}')
             return
 
-    async def gerar_resposta_rag(self, dados_chat: DadosChat):
+    async def gerar_resposta_rag(self, dados_chat: DadosChat, embeddings_pergunta: List[float]=None):
         historico = dados_chat.historico
         pergunta = dados_chat.pergunta
         id_sessao = dados_chat.id_sessao
         id_cliente = dados_chat.id_cliente
         intencao = dados_chat.intencao
+        filtros = dados_chat.filtros
         
         if len(pergunta.split(' ')) > 300:
             #AFAZER: decidir se mantém essa limitação. Colocada a princípio para evitar
@@ -148,6 +259,20 @@ class GeradorDeRespostas:
             print('CONCLUÍDO POR ERRO: pergunta com mais de 300 palavras.')
             return
         
+        # O cache de respostas só é utilizado, por padrão, em perguntas sem histórico: com histórico, a mesma pergunta pode ter outro sentido.
+        # Com filtros informados na requisição, os documentos consultados dependem dos filtros, e não apenas da pergunta
+        usar_cache_respostas = self.cache_respostas is not None \
+                               and embeddings_pergunta is not None \
+                               and not filtros \
+                               and (not historico or not configuracoes.cache_respostas_apenas_sem_historico)
+        if usar_cache_respostas:
+            resposta_em_cache, similaridade = self.cache_respostas.buscar(embeddings_pergunta, self.versao_cache_respostas)
+            if resposta_em_cache:
+                if self.fazer_log: print(f'--- resposta recuperada do cache (similaridade {similaridade})')
+                async for mensagem in self.responder_do_cache(dados_chat, resposta_em_cache, similaridade):
+                    yield mensagem
+                return
+
         yield MensagemControle(
             descricao='Informação de Status',
             dados={'tag':'status', 'conteudo': configuracoes.mensagens_retorno['consulta']}
@@ -155,8 +280,11 @@ class GeradorDeRespostas:
         
         # Recuperando documentos usando o ChromaDB
         marcador_tempo_inicio = time()
+        if not filtros and self.roteador_documentos:
+            filtros = self.roteador_documentos.obter_filtros(pergunta)
+            if filtros and self.fazer_log: print(f'--- consulta restrita aos documentos citados na pergunta: {filtros}')
         try:
-            documentos = await self.consultar_documentos_banco_vetores(pergunta)
+            documentos = await self.consultar_documentos_banco_vetores(pergunta, embeddings_pergunta=embeddings_pergunta, filtros=filtros)
             lista_documentos_formatados = self.formatar_lista_documentos(documentos)
         except Exception as excecao:
             print(excecao.__traceback__)
@@ -170,66 +298,68 @@ class GeradorDeRespostas:
         tempo_recuperacao_documentos = marcador_tempo_fim - marcador_tempo_inicio
         if self.fazer_log: print(f'--- consulta no banco concluída ({tempo_recuperacao_documentos} segundos)')
 
-        # Fazendo re-ranking dos documentos utilizando Bert
-        if self.fazer_log: print(f'--- aplicando re-ranking nos documentos utilizando Bert...')
-        yield MensagemControle(
-            descricao='Informação de Status',
-            dados={'tag':'status', 'conteudo': configuracoes.mensagens_retorno['reranking']}
-        ).json() + '\n'
+        # Sem a seleção de contexto, o prompt é montado com os documentos na ordem do banco vetorial, então a geração da
+        # resposta não depende do re-ranking. Com a reclassificação paralela, o Bert é aplicado enquanto o LLM gera a
+        # resposta (e a seleção de contexto, se houver, utiliza apenas os scores do banco vetorial)
+        tarefa_reclassificacao = None
+        if configuracoes.reclassificacao_paralela_llm:
+            blocos_contexto = self.selecionar_contexto(lista_documentos_formatados)
+            # lista preliminar (sem os scores do Bert), substituída pela lista reclassificada ao final
+            yield self.mensagem_lista_documentos(lista_documentos_formatados)
+            if self.fazer_log: print('--- aplicando re-ranking nos documentos utilizando Bert (em paralelo com o LLM)...')
+            tarefa_reclassificacao = asyncio.create_task(self.aplicar_reclassificacao(pergunta, lista_documentos_formatados))
+        else:
+            # Fazendo re-ranking dos documentos utilizando Bert
+            if self.fazer_log: print('--- aplicando re-ranking nos documentos utilizando Bert...')
+            yield MensagemControle(
+                descricao='Informação de Status',
+                dados={'tag':'status', 'conteudo': configuracoes.mensagens_retorno['reranking']}
+            ).json() + '\n'
 
-        marcador_tempo_inicio = time()
-        for documento in lista_documentos_formatados:
-            try:
-                resposta_estimada = await self.reclassificar_documentos(pergunta, documento['conteudo'])
-                documento['score_bert'] = resposta_estimada['score']
-                documento['score_ponderado'] = resposta_estimada['score_ponderado']
-                documento['resposta_bert'] = resposta_estimada['resposta']
-            except Exception as excecao:
-                documento['score_bert'] = float('-inf')
-                documento['score_ponderado'] = float('-inf')
-                documento['resposta_bert'] = 'Resposta não estimada'
-                yield MensagemInfo(
-                    descricao='Falha na aplicação do BERT',
-                    mensagem='Houve erro na aplicação dos valores, mas o processo continuou. Scores atribuídos com menor valor possível'
-                ).json() + '\n'
+            lista_documentos_formatados, tempo_estimativa_bert, sucesso_reclassificacao = await self.aplicar_reclassificacao(pergunta, lista_documentos_formatados)
+            if not sucesso_reclassificacao:
+                yield self.mensagem_falha_reclassificacao()
+            yield self.mensagem_lista_documentos(lista_documentos_formatados)
+            blocos_contexto = self.selecionar_contexto(lista_documentos_formatados)
 
-        # reordenando lista com base no score atribuído pelo Bert
-        lista_documentos_formatados = sorted(lista_documentos_formatados, key=lambda x: x['score_bert'][0], reverse=True)
-        marcador_tempo_fim = time()
-        tempo_estimativa_bert = marcador_tempo_fim - marcador_tempo_inicio
-        if self.fazer_log: print(f'--- scores atribuídos ({tempo_estimativa_bert} segundos)')
-        
-        yield MensagemDados(
-            descricao='Lista de Documentos Recuperados',
-            dados={
-                'tag': 'lista-docs-recuperados',
-                'conteudo': lista_documentos_formatados
-            }
-            ).json() + '\n'
-        
-        # Gerando resposta utilizando a interface do LLM
-        if self.fazer_log: print(f'--- gerando resposta com o cliente LLM')
-        yield MensagemControle(
-            descricao='Informação de Status',
-            dados={'tag':'status', 'conteudo': configuracoes.mensagens_retorno['geracao_resposta']}
-            ).json() + '\n'
+        # se o cliente se desconectar (ou o gerador for encerrado) antes do fim da geração, a reclassificação paralela é cancelada
+        try:
+            if blocos_contexto is None:
+                documentos_prompt = [f"{doc[0]['titulo']} - {doc[1]}" for doc in zip(documentos['metadatas'][0], documentos['documents'][0])]
+            else:
+                documentos_prompt = [self.seletor_contexto.formatar_bloco(bloco) for bloco in blocos_contexto]
+            prompt_usuario = GeradorPrompts.gerar_prompt_rag(pergunta=pergunta, documentos=documentos_prompt)
         
-        prompt_usuario = GeradorPrompts.gerar_prompt_rag(pergunta=pergunta, documentos=[f"{doc[0]['titulo']} - {doc[1]}" for doc in zip(documentos['metadatas'][0], documentos['documents'][0])])
+            # Gerando resposta utilizando a interface do LLM
+            if self.fazer_log: print('--- gerando resposta com o cliente LLM')
+            yield MensagemControle(
+                descricao='Informação de Status',
+                dados={'tag':'status', 'conteudo': configuracoes.mensagens_retorno['geracao_resposta']}
+                ).json() + '\n'
 
-        resposta_final = None
-        gen_llm = self.enviar_prompt_llm(prompt_usuario, historico)
+            resposta_final = None
+            gen_llm = self.enviar_prompt_llm(prompt_usuario, historico)
 
-        try:
-            async for fragmento in gen_llm:
-                fragmento_serializado = json.loads(fragmento)
-                if fragmento_serializado['dados']['tag'] == 'metadados-geracao-llm':
-                    resposta_final = fragmento_serializado['dados']['conteudo']
-                else:
-                    yield fragmento
-        except StopAsyncIteration as resultado:
-            resposta_final = resultado.value
+            try:
+                async for fragmento in gen_llm:
+                    fragmento_serializado = json.loads(fragmento)
+                    if fragmento_serializado['dados']['tag'] == 'metadados-geracao-llm':
+                        resposta_final = fragmento_serializado['dados']['conteudo']
+                    else:
+                        yield fragmento
+            except StopAsyncIteration as resultado:
+                resposta_final = resultado.value
+            finally:
+                await gen_llm.aclose()
+
+            if tarefa_reclassificacao:
+                lista_documentos_formatados, tempo_estimativa_bert, sucesso_reclassificacao = await tarefa_reclassificacao
+                if not sucesso_reclassificacao:
+                    yield self.mensagem_falha_reclassificacao()
+                yield self.mensagem_lista_documentos(lista_documentos_formatados)
         finally:
-            await gen_llm.aclose()
+            if tarefa_reclassificacao and not tarefa_reclassificacao.done():
+                tarefa_reclassificacao.cancel()
 
         if not resposta_final:
             return
@@ -257,11 +387,21 @@ class GeradorDeRespostas:
             'id_sessao': id_sessao,
             'id_cliente': id_cliente,
             'intencao': intencao,
-            'ambiente_execucao': configuracoes.ambiente_execucao
+            'ambiente_execucao': configuracoes.ambiente_execucao,
+            'reclassificacao_paralela_llm': tarefa_reclassificacao is not None,
+            'ids_documentos_contexto': [id for bloco in blocos_contexto for id in bloco['ids']] if blocos_contexto is not None else None
         }
         
         # id no índice 0 é o da interação persistida
-        ids_persistencia_interacao = self.gerenciador_persistencia.persistir_interacao(dados_interacao=dados_interacao)
+        ids_persistencia_interacao = await self.persistir_interacao(dados_interacao=dados_interacao)
+
+        # somente respostas concluídas normalmente são armazenadas no cache
+        if usar_cache_respostas and resposta_completa_llm and resposta_completa_llm.get('done_reason') == 'stop':
+            self.cache_respostas.armazenar(embeddings_pergunta, self.versao_cache_respostas, {
+                'pergunta': pergunta,
+                'documentos': lista_documentos_formatados,
+                'resposta': texto_resposta_llm
+            })
         
         # Retornando dados compilados
         msg = MensagemDados(
@@ -279,6 +419,63 @@ class GeradorDeRespostas:
         yield msg
         if self.fazer_log: print('Concluído')
 
+    async def responder_do_cache(self, dados_chat: DadosChat, resposta_em_cache: dict, similaridade: float):
+        '''
+        Reproduz uma resposta armazenada no cache de respostas, com as mesmas mensagens do fluxo RAG
+        (lista de documentos e fragmento de resposta), e persiste a interação sinalizada como atendida pelo cache
+        '''
+
+        yield MensagemDados(
+            descricao='Lista de Documentos Recuperados',
+            dados={
+                'tag': 'lista-docs-recuperados',
+                'conteudo': resposta_em_cache['documentos']
+            }
+            ).json() + '\n'
+
+        yield MensagemDados(
+            descricao='Fragmento de Resposta do LLM',
+            dados={
+                'tag': 'frag-resposta-llm',
+                'conteudo': resposta_em_cache['resposta']
+            }
+        ).json() + '\n'
+
+        dados_interacao = {
+            'pergunta': dados_chat.pergunta,
+            'tipo_dispositivo_aplicacao': configuracoes.device,
+            'tipo_dispositivo_llm': 'cuda' if cuda.is_available() else 'cpu',
+            'documentos': resposta_em_cache['documentos'],
+            'tempo_recuperacao_documentos': 0,
+            'tempo_estimativa_bert': 0,
+            'template_system_llm': configuracoes.template_mensagem_system,
+            'historico_llm': dados_chat.historico,
+            'cliente_llm': configuracoes.cliente_llm,
+            'modelo_llm': configuracoes.modelo_llm,
+            'tempo_inicio_stream_resposta': 0,
+            'tempo_total_llm': 0,
+            'resposta': resposta_em_cache['resposta'],
+            'resposta_completa_llm': None,
+            'id_sessao': dados_chat.id_sessao,
+            'id_cliente': dados_chat.id_cliente,
+            'intencao': dados_chat.intencao,
+            'ambiente_execucao': configuracoes.ambiente_execucao,
+            'resposta_em_cache': True,
+            'pergunta_em_cache': resposta_em_cache['pergunta'],
+            'similaridade_cache': similaridade
+        }
+
+        ids_persistencia_interacao = await self.persistir_interacao(dados_interacao=dados_interacao)
+
+        yield MensagemDados(
+                descricao='INTERAÇÃO FINALIZADA. Contém Id da interação (primeiro elemento)',
+                dados={
+                    'tag': 'interacao-finalizada',
+                    'conteudo': ids_persistencia_interacao
+                }
+            ).json()
+        if self.fazer_log: print('Concluído')
+
     async def interacao(self, dados_chat: DadosChat):
         prompt = GeradorPrompts.gerar_prompt_interacao(pergunta=dados_chat.pergunta, intencao_usuario=dados_chat.intencao)
         
@@ -327,7 +524,7 @@ class GeradorDeRespostas:
         }
         
         # id no índice 0 é o da interação persistida
-        ids_persistencia_interacao = self.gerenciador_persistencia.persistir_interacao(dados_interacao=dados_interacao)
+        ids_persistencia_interacao = await self.persistir_interacao(dados_interacao=dados_interacao)
 
         # Retornando dados compilados
         msg = MensagemDados(
@@ -379,7 +576,7 @@ class GeradorDeRespostas:
         }
 
         # id no índice 0 é o da interação persistida
-        ids_persistencia_interacao = self.gerenciador_persistencia.persistir_interacao(dados_interacao=dados_interacao)
+        ids_persistencia_interacao = await self.persistir_interacao(dados_interacao=dados_interacao)
 
         # Retornando dados compilados
         msg = MensagemDados(
@@ -427,7 +624,7 @@ class GeradorDeRespostas:
         }
 
         # id no índice 0 é o da interação persistida
-        ids_persistencia_interacao = self.gerenciador_persistencia.persistir_interacao(dados_interacao=dados_interacao)
+        ids_persistencia_interacao = await self.persistir_interacao(dados_interacao=dados_interacao)
 
         # Retornando dados compilados
         msg = MensagemDados(
@@ -442,12 +639,30 @@ class GeradorDeRespostas:
         if self.fazer_log: print('Concluído')
         return
     
-    async def gerar_resposta(self, dados_chat: DadosChat):
+    async def classificar_intencao(self, classificador, pergunta: str, embeddings_pergunta: List[float]=None) -> str:
+        if embeddings_pergunta is not None:
+            return await self.executor.executar('classificacao_intencao', classificador.classificar_intencao_embeddings, embeddings_pergunta)
+        return await self.executor.executar('classificacao_intencao', classificador.classificar_intencao, pergunta)
+
+    async def iniciar(self):
+        '''Prepara os recursos compartilhados entre requisições (conexões com o LLM)'''
+        await self.interface_llm.iniciar()
+
+    async def encerrar(self):
+        '''Libera os recursos do gerador de respostas (conexões com o LLM e com o banco de persistência e pool de threads das etapas bloqueantes)'''
+        await self.interface_llm.encerrar()
+        self.executor.encerrar()
+        # grava as interações pendentes antes de fechar as conexões com o banco
+        if self.escritor_persistencia:
+            self.escritor_persistencia.encerrar()
+        self.gerenciador_persistencia.encerrar()
+
+    async def gerar_resposta(self, dados_chat: DadosChat, embeddings_pergunta: List[float]=None):
         """
         Decide o fluxo de geração de resposta com base na intenção do usuário.
         """
         mapa_intencoes = {
-            'consulta': self.gerar_resposta_rag,
+            'consulta': partial(self.gerar_resposta_rag, embeddings_pergunta=embeddings_pergunta),
             'doc': self.servir_documento, # AFAZER: Alterar e implementar lógica de servir documento
             'ping': self.interacao,
             'out': self.interacao,
@@ -463,7 +678,13 @@ class GeradorDeRespostas:
 
     async def avaliar_interacao(self, dados_avaliacao: dict):
         try:
-            resultado = self.gerenciador_persistencia.persistir_avaliacao(dados_avaliacao=dados_avaliacao)
+            # a avaliação referencia a interação, que pode ainda estar na fila de gravação: aguarda apenas a gravação dessa
+            # interação, no event loop, sem ocupar threads do pool nem execuções da etapa 'persistencia' usadas pelo chat
+            if self.escritor_persistencia:
+                gravada = await self.escritor_persistencia.descarregar(dados_avaliacao['uuid_interacao'])
+                if not gravada:
+                    print(f'AVISO: interação {dados_avaliacao["uuid_interacao"]} ainda não gravada. Registrando a avaliação mesmo assim')
+            resultado = await self.executor.executar('persistencia', self.gerenciador_persistencia.persistir_avaliacao, dados_avaliacao=dados_avaliacao)
             if resultado == 1:
                 dados_avaliacao['sucesso_avaliacao'] = True
                 dados_avaliacao['mensagem_retorno'] = 'Avaliação registrada'
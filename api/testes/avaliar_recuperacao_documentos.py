@@ -2,45 +2,121 @@ print('Carregando bibliotecas...')
 
 import argparse
 import json, os
-from typing import Dict, List
-from chromadb import chromadb
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Tuple
+from chromadb import chromadb, EmbeddingFunction
 from torch import cuda
 
 from dados.gerenciador_banco_vetores import GerenciadorBancoVetores
 from api.utils.reclassificador import ReclassificadorBert
+from api.utils.cache import CacheLRU, CacheSQLite
 from api.configuracoes.config_gerais import configuracoes
 
 DEVICE='cuda' if cuda.is_available() else 'cpu'
 print(f'Ambiente de execução: {DEVICE}')
 
 
-def recuperar_colecoes(url_banco_vetores: str) -> Dict[str, chromadb.Collection]:
+def recuperar_colecoes_por_modelo(url_banco_vetores: str) -> Tuple[Dict[str, chromadb.Collection], List[Tuple[EmbeddingFunction, List[str]]]]:
     '''
-    Recupera uma lista de chromadb.Collections correspondente às coleções em um banco de vetores.
+    Recupera as coleções de um banco de vetores, agrupadas pela função de embeddings (modelo e instrução) que utilizam.
+    Cada modelo é carregado uma única vez, ainda que usado por várias coleções.
 
     Parâmetros:
         url_banco_vetores (str): a url do banco de vetores
 
     Retorna:
-        (Dict[str, chromadb.Collection]) as coleções existentes no banco de vetores
+        (Dict[str, chromadb.Collection]): as coleções existentes no banco de vetores, na ordem do descritor.json
+        (List[Tuple[EmbeddingFunction, List[str]]]): cada função de embeddings e os nomes das coleções que a utilizam
     '''
 
     with open(os.path.abspath(os.path.join(url_banco_vetores, 'descritor.json')), 'r') as arq:
         desc = json.load(arq)
     
     colecoes = {}
+    grupos = {}
     cliente_chroma = chromadb.PersistentClient(path=url_banco_vetores)
     gb = GerenciadorBancoVetores()
 
     for desc_colecao in desc['colecoes']:
-        funcao = gb.obter_funcao_embeddings(
-            nome_modelo=desc_colecao['funcao_embeddings']['nome_modelo'],
-            instrucao=desc_colecao['instrucao']
-        )
-        colecao = cliente_chroma.get_collection(name=desc_colecao['nome'], embedding_function=funcao)
+        chave_modelo = (desc_colecao['funcao_embeddings']['nome_modelo'], desc_colecao['instrucao'])
+        if chave_modelo not in grupos:
+            funcao = gb.obter_funcao_embeddings(
+                nome_modelo=desc_colecao['funcao_embeddings']['nome_modelo'],
+                instrucao=desc_colecao['instrucao']
+            )
+            grupos[chave_modelo] = (funcao, [])
+        colecao = cliente_chroma.get_collection(name=desc_colecao['nome'], embedding_function=grupos[chave_modelo][0])
         colecoes[desc_colecao['nome']] = colecao
+        grupos[chave_modelo][1].append(desc_colecao['nome'])
     
-    return colecoes
+    return colecoes, list(grupos.values())
+
+def recuperar_colecoes(url_banco_vetores: str) -> Dict[str, chromadb.Collection]:
+    '''
+    Recupera uma lista de chromadb.Collections correspondente às coleções em um banco de vetores.
+
+    Parâmetros:
+        url_banco_vetores (str): a url do banco de vetores
+
+    Retorna:
+        (Dict[str, chromadb.Collection]) as coleções existentes no banco de vetores
+    '''
+
+    return recuperar_colecoes_por_modelo(url_banco_vetores)[0]
+
+def consultar_colecoes_em_lote(
+    perguntas: List[str],
+    colecoes: Dict[str, chromadb.Collection],
+    grupos_modelos: List[Tuple[EmbeddingFunction, List[str]]],
+    num_resultados: int,
+    tamanho_lote_consultas: int=64,
+    num_threads: int=4) -> Dict[str, List[dict]]:
+    '''
+    Consulta todas as perguntas em todas as coleções: as perguntas são convertidas em embeddings em um único lote por
+    modelo (e não uma vez por coleção e pergunta), e as consultas às coleções, com vários embeddings por chamada, são
+    executadas em paralelo. As consultas das coleções de um modelo são executadas enquanto os embeddings do modelo
+    seguinte são gerados.
+
+    Parâmetros:
+        perguntas (List[str]): perguntas a serem consultadas
+        colecoes (Dict[str, chromadb.Collection]): coleções consultadas
+        grupos_modelos (List[Tuple[EmbeddingFunction, List[str]]]): funções de embeddings e as coleções que as utilizam,
+                                                                    conforme recuperar_colecoes_por_modelo()
+        num_resultados (int): a quantidade de documentos a serem recuperados de cada coleção
+        tamanho_lote_consultas (int): quantidade de perguntas por chamada a colecao.query()
+        num_threads (int): quantidade de consultas executadas simultaneamente
+
+    Retorna:
+        (Dict[str, List[dict]]): para cada coleção, o resultado de cada pergunta ('ids', 'documents' e 'distances'),
+                                 na ordem de `perguntas`
+    '''
+
+    resultados = {nome_colecao: [None] * len(perguntas) for nome_colecao in colecoes}
+    if not perguntas:
+        return resultados
+
+    with ThreadPoolExecutor(max_workers=num_threads, thread_name_prefix='consulta') as executor:
+        tarefas = {}
+        for funcao, nomes_colecoes in grupos_modelos:
+            print(f'--- gerando embeddings de {len(perguntas)} perguntas para as coleções {", ".join(nomes_colecoes)}...')
+            embeddings = funcao(perguntas)
+            for nome_colecao in nomes_colecoes:
+                for inicio in range(0, len(perguntas), tamanho_lote_consultas):
+                    tarefa = executor.submit(
+                        colecoes[nome_colecao].query,
+                        query_embeddings=embeddings[inicio:inicio + tamanho_lote_consultas],
+                        n_results=num_resultados,
+                        include=['documents', 'distances'])
+                    tarefas[tarefa] = (nome_colecao, inicio)
+
+        for num_concluidas, tarefa in enumerate(as_completed(tarefas), start=1):
+            nome_colecao, inicio = tarefas[tarefa]
+            res_consulta = tarefa.result()
+            for deslocamento, (ids, conteudo, distancias) in enumerate(zip(res_consulta['ids'], res_consulta['documents'], res_consulta['distances'])):
+                resultados[nome_colecao][inicio + deslocamento] = {'ids': ids, 'documents': conteudo, 'distances': distancias}
+            print(f'--- consultas: lote {num_concluidas} de {len(tarefas)}')
+
+    return resultados
 
 def gerar_mapa_fragmentos(fragmentos_referencia: List[dict], colecoes: Dict[str, chromadb.Collection]) -> dict:
     '''
@@ -71,7 +147,8 @@ def gerar_mapa_fragmentos(fragmentos_referencia: List[dict], colecoes: Dict[str,
     return mapa
 
 
-def simular_recuperacao_documentos(url_arq_fragmentos: str, url_banco_vetores: str, num_resultados: int) -> List[dict]:
+def simular_recuperacao_documentos(url_arq_fragmentos: str, url_banco_vetores: str, num_resultados: int, url_cache_reclassificacao: str=None,
+                                   tamanho_lote_consultas: int=64, num_threads_consulta: int=4) -> List[dict]:
     '''
     Utiliza uma lista de perguntas geradas para fragmentos no banco vetorial e realiza recuperação de documentos por similaridade.
 
@@ -79,6 +156,10 @@ def simular_recuperacao_documentos(url_arq_fragmentos: str, url_banco_vetores: s
         url_arq_fragmentos (str): a url do arquivo com fragmentos e perguntas
         url_banco_vetores (str): a url do banco de vetores
         num_resultados (int): a quantidade de documentos a serem recuperados do banco vetorial
+        url_cache_reclassificacao (str): parâmetro opcional, arquivo SQLite em que os resultados do Bert são memorizados.
+                                         Permite retomar uma avaliação interrompida sem recalcular os pares já processados
+        tamanho_lote_consultas (int): parâmetro opcional, quantidade de perguntas por consulta a uma coleção
+        num_threads_consulta (int): parâmetro opcional, quantidade de consultas às coleções executadas simultaneamente
 
     Retorna:
         (List[dict]): a url do banco de vetores
@@ -113,51 +194,69 @@ def simular_recuperacao_documentos(url_arq_fragmentos: str, url_banco_vetores: s
     ```
     '''
     
-    colecoes = recuperar_colecoes(url_banco_vetores=url_banco_vetores)
+    colecoes, grupos_modelos = recuperar_colecoes_por_modelo(url_banco_vetores=url_banco_vetores)
     with open(url_arq_fragmentos, 'r', encoding='utf-8') as arq:
         fragmentos_com_perguntas = json.load(arq)
 
-    reclassificador_bert = ReclassificadorBert(device=DEVICE, fazer_log=False)
+    # os mesmos fragmentos são recuperados por várias coleções: com os ids mapeados para os da referência,
+    # cada par (pergunta, fragmento) passa pelo Bert uma única vez
+    cache_disco = CacheSQLite(url_arquivo=url_cache_reclassificacao) if url_cache_reclassificacao else None
+    reclassificador_bert = ReclassificadorBert(
+        device=DEVICE,
+        fazer_log=False,
+        cache=CacheLRU(capacidade=configuracoes.cache_reclassificacao_capacidade),
+        cache_disco=cache_disco)
     mapa_fragmentos = gerar_mapa_fragmentos(fragmentos_referencia=fragmentos_com_perguntas, colecoes=colecoes)
 
+    pares_perguntas = [(fragmento['id'], par['pergunta']) for fragmento in fragmentos_com_perguntas for par in fragmento['perguntas']]
+    print('RECUPERANDO DOCUMENTOS')
+    print(f'{len(pares_perguntas)} perguntas de {len(fragmentos_com_perguntas)} fragmentos, em {len(colecoes)} coleções')
+    consultas = consultar_colecoes_em_lote(
+        perguntas=[pergunta for _, pergunta in pares_perguntas],
+        colecoes=colecoes,
+        grupos_modelos=grupos_modelos,
+        num_resultados=num_resultados,
+        tamanho_lote_consultas=tamanho_lote_consultas,
+        num_threads=num_threads_consulta)
+
+    print('RECLASSIFICANDO DOCUMENTOS')
     resultado = []
-    for idx in range(len(fragmentos_com_perguntas)):
-        fragmento = fragmentos_com_perguntas[idx]
-        id_frag = fragmento['id']
-        perguntas = [par['pergunta'] for par in fragmento['perguntas']]
-        print('RECUPERANDO DOCUMENTOS')
-        print(f'Processando fragmento {idx+1} de {len(fragmentos_com_perguntas)}')
-
-        for idx in range(len(perguntas)):
-            print(f'-- pergunta {idx+1} de {len(perguntas)}')
-            pergunta = perguntas[idx]
-            relat_busca = {
-                'id_frag': id_frag,
-                'pergunta': pergunta,
-                'docs_recuperados': []
-            }
+    for idx, (id_frag, pergunta) in enumerate(pares_perguntas):
+        print(f'-- pergunta {idx+1} de {len(pares_perguntas)}')
+        relat_busca = {
+            'id_frag': id_frag,
+            'pergunta': pergunta,
+            'docs_recuperados': []
+        }
+
+        for nome_colecao in colecoes:
+            res_consulta = consultas[nome_colecao][idx]
+            ids = res_consulta['ids']
+            conteudo = res_consulta['documents']
+            distancias = res_consulta['distances']
+            scores_bert = reclassificador_bert.reclassificar_documentos(
+                pergunta=pergunta,
+                textos_documentos=conteudo,
+                ids_documentos=[mapa_fragmentos[id] for id in ids])
+            documentos = [item for item in zip(ids, scores_bert, distancias)]
+            documentos = [{
+                'id': mapa_fragmentos[doc[0]],
+                'score_bert': doc[1],
+                'score_cosseno': doc[2]
+            } for doc in documentos]
+
+            relat_busca['docs_recuperados'].append(
+                {
+                    'nome_colecao': nome_colecao,
+                    'documentos': documentos
+                }
+            )
+        
+        resultado.append(relat_busca)
 
-            for nome_colecao, colecao in colecoes.items():
-                print(f'--- recuperando da colecao {nome_colecao}...')
-                res_consulta = colecao.query(query_texts=[pergunta], n_results=num_resultados)
-                ids = res_consulta['ids'][0]
-                conteudo = res_consulta['documents'][0]
-                distancias = res_consulta['distances'][0]
-                documentos = [item for item in zip(ids, conteudo, distancias)]
-                documentos = [{
-                    'id': mapa_fragmentos[doc[0]],
-                    'score_bert': reclassificador_bert.reclassificar_documento(pergunta=pergunta, texto_documento=doc[1]),
-                    'score_cosseno': doc[2]
-                } for doc in documentos]
-
-                relat_busca['docs_recuperados'].append(
-                    {
-                        'nome_colecao': nome_colecao,
-                        'documentos': documentos
-                    }
-                )
-            
-            resultado.append(relat_busca)
+    if cache_disco:
+        print(f'Cache do reclassificador: {cache_disco.estatisticas()}')
+        cache_disco.fechar()
     return resultado
 
 def avaliar_recuperacao(
@@ -165,7 +264,10 @@ def avaliar_recuperacao(
     url_banco_vetores: str,
     url_arquivo_saida: str,
     num_resultados: int,
-    gerar_relatorios_intermediarios_avaliacao: bool=False) -> List[dict]:
+    gerar_relatorios_intermediarios_avaliacao: bool=False,
+    url_cache_reclassificacao: str=None,
+    tamanho_lote_consultas: int=64,
+    num_threads_consulta: int=4) -> List[dict]:
 
     '''
     Utiliza uma lista de perguntas geradas para fragmentos no banco vetorial e realiza uma análise comparativa da taxa de recuperação
@@ -177,6 +279,9 @@ def avaliar_recuperacao(
         url_arquivo_saida (str): caminho onde salvar o arquivo de saída
         num_resultados (int): número de resultados de cada consulta ao banco de vetores
         gerar_relatorios_intermediarios_avaliacao (bool) OPCIONAL. Default: False
+        url_cache_reclassificacao (str) OPCIONAL. Arquivo SQLite para memorizar os resultados do Bert. Default: None
+        tamanho_lote_consultas (int) OPCIONAL. Quantidade de perguntas por consulta a uma coleção. Default: 64
+        num_threads_consulta (int) OPCIONAL. Quantidade de consultas às coleções executadas simultaneamente. Default: 4
     
     Retorna:
         (List[dict]): lista com relatório de cada uma das coleções.
@@ -202,7 +307,8 @@ def avaliar_recuperacao(
     '''
 
     # obtém resultados de consultas no banco vetorial
-    simulacao_recuperacao = simular_recuperacao_documentos(url_arq_fragmentos=url_arq_fragmentos, url_banco_vetores=url_banco_vetores, num_resultados=num_resultados)
+    simulacao_recuperacao = simular_recuperacao_documentos(url_arq_fragmentos=url_arq_fragmentos, url_banco_vetores=url_banco_vetores, num_resultados=num_resultados, url_cache_reclassificacao=url_cache_reclassificacao,
+                                                           tamanho_lote_consultas=tamanho_lote_consultas, num_threads_consulta=num_threads_consulta)
 
     # salva os resultados da busca
     if gerar_relatorios_intermediarios_avaliacao:
@@ -308,6 +414,9 @@ if __name__ == "__main__":
     parser.add_argument('--url_arquivo_saida', type=str, help="caminho para salvar o arquivo com o resultado")
     parser.add_argument('--num_resultados', type=int, help='quantidade de documentos a ser recuperada de cada consulta ao banco de vetores')
     parser.add_argument('--gerar_relatorios_intermediarios', type=bool, help='indicador se deve ou não salvar os resultados')
+    parser.add_argument('--url_cache_reclassificacao', type=str, help='arquivo SQLite para memorizar os resultados do Bert, permitindo retomar a avaliação')
+    parser.add_argument('--tamanho_lote_consultas', type=int, default=64, help='quantidade de perguntas por consulta a uma coleção')
+    parser.add_argument('--num_threads_consulta', type=int, default=4, help='quantidade de consultas às coleções executadas simultaneamente')
     args = parser.parse_args()
 
     url_arq_fragmentos = 'api/testes/resultados/perguntas_documentos.json' if not args.url_arq_fragmentos else args.url_arq_fragmentos
@@ -321,7 +430,10 @@ if __name__ == "__main__":
         url_banco_vetores = url_banco_vetores,
         url_arquivo_saida = url_arquivo_saida,
         num_resultados = num_resultados,
-        gerar_relatorios_intermediarios_avaliacao = gerar_relatorios_intermediarios
+        gerar_relatorios_intermediarios_avaliacao = gerar_relatorios_intermediarios,
+        url_cache_reclassificacao = args.url_cache_reclassificacao,
+        tamanho_lote_consultas = args.tamanho_lote_consultas,
+        num_threads_consulta = args.num_threads_consulta
     )
 
 # Modelo de execução
@@ -330,4 +442,7 @@ if __name__ == "__main__":
 # --url_banco_vetores api/dados/bancos_vetores/banco_assistente \
 # --url_arquivo_saida api/testes/resultados/perguntas_documentos_sumario.json\
 # --num_resultados 10 \
-# --gerar_relatorios_intermediarios True
\ No newline at end of file
+# --gerar_relatorios_intermediarios True \
+# --url_cache_reclassificacao api/testes/resultados/cache_reclassificacao.sqlite \
+# --tamanho_lote_consultas 64 \
+# --num_threads_consulta 4
\ No newline at end of file
@@ -0,0 +1,159 @@
+print('Carregando bibliotecas...')
+
+import argparse
+import json
+import random
+from time import perf_counter
+from typing import List
+
+from api.utils.decodificador_ndjson import DecodificadorNDJSON
+
+
+def gerar_stream_sintetico(num_tokens: int=2000, semente: int=42) -> bytes:
+    '''
+    Gera um stream NDJSON no formato retornado pelo endpoint /api/chat do Ollama (com 'stream': true),
+    para uso quando não há streams gravados disponíveis.
+
+    Parâmetros:
+        num_tokens (int): quantidade de linhas com fragmentos de resposta
+        semente (int): semente do gerador aleatório
+
+    Retorna:
+        (bytes): conteúdo do stream
+    '''
+
+    aleatorio = random.Random(semente)
+    palavras = ['servidor', 'férias', 'Art.', '57', 'licença-prêmio', 'gratificação', 'Assembleia', 'Legislativa',
+                'resolução', 'cálculo', '§ 1º', 'remuneração', 'é', 'o', 'de', 'que', '\n', '**', '"', '\\']
+    linhas = []
+    for _ in range(num_tokens):
+        linhas.append(json.dumps({
+            'model': 'llama3.1',
+            'created_at': '2024-11-13T12:00:00.000000000Z',
+            'message': {'role': 'assistant', 'content': ' ' + aleatorio.choice(palavras)},
+            'done': False
+        }, ensure_ascii=False))
+    linhas.append(json.dumps({
+        'model': 'llama3.1',
+        'created_at': '2024-11-13T12:00:10.000000000Z',
+        'message': {'role': 'assistant', 'content': ''},
+        'done_reason': 'stop',
+        'done': True,
+        'total_duration': 10_000_000_000,
+        'load_duration': 10_000_000,
+        'prompt_eval_count': 1500,
+        'prompt_eval_duration': 2_000_000_000,
+        'eval_count': num_tokens,
+        'eval_duration': 8_000_000_000
+    }))
+    return ('\n'.join(linhas) + '\n').encode('utf-8')
+
+def fragmentar(stream: bytes, tamanho_fragmento: int) -> List[bytes]:
+    '''Divide o stream em fragmentos de tamanho fixo, simulando a chegada de pacotes pela rede'''
+    return [stream[idx:idx + tamanho_fragmento] for idx in range(0, len(stream), tamanho_fragmento)]
+
+def decodificar_por_fragmento(fragmentos: List[bytes]) -> List[dict]:
+    '''Estratégia anterior: um json.loads por fragmento recebido, descartando os que falham'''
+    objetos = []
+    for fragmento in fragmentos:
+        if fragmento:
+            try:
+                objetos.append(json.loads(fragmento.decode()))
+            except:
+                pass
+    return objetos
+
+def decodificar_por_linha(fragmentos: List[bytes]) -> List[dict]:
+    '''Estratégia atual: DecodificadorNDJSON'''
+    decodificador = DecodificadorNDJSON()
+    objetos = []
+    for fragmento in fragmentos:
+        objetos.extend(decodificador.alimentar(fragmento))
+    objetos.extend(decodificador.finalizar())
+    return objetos
+
+def texto_resposta(objetos: List[dict]) -> str:
+    # fragmentos muito pequenos podem ser desserializados como números ou strings soltas pela estratégia anterior
+    return ''.join(objeto['message']['content'] for objeto in objetos if isinstance(objeto, dict) and 'message' in objeto)
+
+def executar_benchmark(streams: dict, tamanhos_fragmentos: List[int], repeticoes: int) -> List[dict]:
+    '''
+    Reproduz cada stream com diferentes tamanhos de fragmento e compara as duas estratégias de decodificação
+    quanto à perda de conteúdo e ao tempo de processamento.
+
+    Parâmetros:
+        streams (dict): nome do stream -> conteúdo (bytes)
+        tamanhos_fragmentos (List[int]): tamanhos de fragmento, em bytes
+        repeticoes (int): quantidade de repetições para medição de tempo
+
+    Retorna:
+        (List[dict]): um resultado por stream, estratégia e tamanho de fragmento
+    '''
+
+    resultados = []
+    estrategias = {
+        'por_fragmento': decodificar_por_fragmento,
+        'por_linha': decodificar_por_linha
+    }
+    for nome_stream, stream in streams.items():
+        referencia = [json.loads(linha) for linha in stream.splitlines() if linha.strip()]
+        texto_referencia = texto_resposta(referencia)
+
+        for tamanho in tamanhos_fragmentos:
+            fragmentos = fragmentar(stream, tamanho)
+            for nome_estrategia, estrategia in estrategias.items():
+                marcador_tempo_inicio = perf_counter()
+                for _ in range(repeticoes):
+                    objetos = estrategia(fragmentos)
+                tempo = (perf_counter() - marcador_tempo_inicio) / repeticoes
+
+                resultados.append({
+                    'stream': nome_stream,
+                    'tamanho_fragmento': tamanho,
+                    'estrategia': nome_estrategia,
+                    'objetos_recuperados': len(objetos),
+                    'objetos_esperados': len(referencia),
+                    'texto_identico': texto_resposta(objetos) == texto_referencia,
+                    'metadados_finais': bool(objetos) and isinstance(objetos[-1], dict) and objetos[-1].get('done', False),
+                    'tempo_ms': tempo * 1000,
+                    'mb_por_segundo': len(stream) / tempo / 1_000_000 if tempo else float('inf')
+                })
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara estratégias de decodificação de streams NDJSON do Ollama com diferentes tamanhos de fragmento")
+    parser.add_argument('--urls_streams', type=str, nargs='*', help="arquivos com streams gravados (bytes brutos da resposta de /api/chat com 'stream': true)")
+    parser.add_argument('--tamanhos_fragmentos', type=int, nargs='*', help="tamanhos de fragmento (em bytes) a serem testados")
+    parser.add_argument('--repeticoes', type=int, help="quantidade de repetições para medição de tempo")
+    parser.add_argument('--url_arquivo_saida', type=str, help="caminho para salvar o resultado em JSON")
+    args = parser.parse_args()
+
+    tamanhos_fragmentos = [1, 7, 16, 64, 256, 1024, 4096] if not args.tamanhos_fragmentos else args.tamanhos_fragmentos
+    repeticoes = 5 if not args.repeticoes else args.repeticoes
+
+    streams = {}
+    if args.urls_streams:
+        for url in args.urls_streams:
+            with open(url, 'rb') as arq:
+                streams[url] = arq.read()
+    else:
+        streams['sintetico'] = gerar_stream_sintetico()
+
+    resultados = executar_benchmark(streams=streams, tamanhos_fragmentos=tamanhos_fragmentos, repeticoes=repeticoes)
+
+    print(f"{'stream':<20}{'fragmento':>10}  {'estrategia':<15}{'objetos':>14}{'texto ok':>10}{'tempo (ms)':>12}{'MB/s':>10}")
+    for res in resultados:
+        print(f"{res['stream'][-20:]:<20}{res['tamanho_fragmento']:>10}  {res['estrategia']:<15}"
+              f"{str(res['objetos_recuperados']) + '/' + str(res['objetos_esperados']):>14}"
+              f"{str(res['texto_identico']):>10}{res['tempo_ms']:>12.3f}{res['mb_por_segundo']:>10.2f}")
+
+    if args.url_arquivo_saida:
+        with open(args.url_arquivo_saida, 'w', encoding='utf-8') as arq:
+            json.dump(resultados, arq, ensure_ascii=False, indent=4)
+
+# Modelo de execução
+# python -m api.testes.benchmark_decodificador_ndjson \
+# --urls_streams api/testes/resultados/stream_ollama_1.ndjson api/testes/resultados/stream_ollama_2.ndjson \
+# --tamanhos_fragmentos 1 7 16 64 256 1024 4096 \
+# --repeticoes 5
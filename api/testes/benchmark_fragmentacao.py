@@ -0,0 +1,312 @@
+print('Carregando bibliotecas...')
+
+import argparse
+import json
+import os
+from time import perf_counter
+from typing import List
+
+from api.configuracoes.config_gerais import configuracoes
+from api.dados.gerenciador_banco_vetores import GerenciadorBancoVetores
+
+
+class GerenciadorBancoVetoresLegado(GerenciadorBancoVetores):
+    '''
+    Cópia da implementação anterior dos fragmentadores (substituições repetidas de '  ', remoção de linhas vazias
+    com list.remove, contagem de palavras do fragmento a cada linha e numeração de subtítulos com list.count),
+    mantida como referência para comparação de desempenho e de resultado.
+    '''
+
+    def fragmentar_texto_markdown(self, texto: str, comprimento_max_fragmento: int) -> List[str]:
+        """
+        Divide um texto Markdown em fragmentos com tamanho máximo de palavras, mantendo a estrutura de títulos.
+        
+        Args:
+            texto: Texto em formato Markdown.
+            comprimento_max_fragmento: Número máximo de palavras por fragmento.
+        
+        Returns:
+            Lista de fragmentos como strings.
+        """
+        linhas = [linha for linha in texto.splitlines() if linha.strip()]
+        
+        fragmentos = []
+        fragmento = ''
+        titulos = []
+        nivel_titulo_base = 1
+
+        for linha in linhas:
+            elementos = linha.split(' ')
+            if elementos[0].startswith('#'):
+                if fragmento:
+                    cabecalho = '\n'.join(titulos) + '\n'
+                    fragmentos.append({'titulos': titulos.copy(), 'conteudo': cabecalho + fragmento})
+                    fragmento = ''
+                nivel_titulo = len(elementos[0])
+                if nivel_titulo_base >= nivel_titulo:
+                    titulos = titulos[:nivel_titulo - 1]            
+                nivel_titulo_base = nivel_titulo
+                titulos.append(' '.join(elementos[1:]))
+            else:
+                # Não é título
+                cabecalho = '\n'.join(titulos) + '\n'
+                texto_possivel_fragmento = cabecalho + fragmento + f'{linha}\n'
+                if len(texto_possivel_fragmento.replace('\n', ' ').split(' ')) <= comprimento_max_fragmento:
+                    # Não extrapola tamanho máximo
+                    fragmento += f'{linha}\n'
+                else:
+                    # Extrapola tamanho máximo
+                    fragmentos.append({'titulos': titulos.copy(), 'conteudo': cabecalho + fragmento})
+                    fragmento = f'{linha}\n'
+
+        if fragmento:
+            cabecalho = '\n'.join(titulos) + '\n'
+            fragmentos.append({'titulos': titulos.copy(), 'conteudo': cabecalho + fragmento})
+        
+        return fragmentos
+    
+    def processar_texto_markdown(self, texto: str, info: dict, comprimento_max_fragmento: int, profund_maxima: int=3) -> List[str]:
+        fragmentos_titulos = self.fragmentar_texto_markdown(texto=texto, comprimento_max_fragmento=comprimento_max_fragmento)
+
+        fragmentos = []
+        titulos = []
+        for frag_titulo in fragmentos_titulos:
+            tit = frag_titulo['titulos'][:profund_maxima][-1]
+            titulos.append(tit)
+            fragmento = {
+                'page_content': frag_titulo['conteudo'],
+                'metadata': {
+                    'titulo': f'{info["titulo"]}',
+                    'subtitulo': f'{tit} - {titulos.count(tit)}',
+                    'autor': f'{info["autor"]}',
+                    'fonte': f'{info["fonte"]}#{self.normalizar_string(tit)}'
+                },
+            }
+            fragmentos.append(fragmento)
+        return fragmentos
+        
+    
+    def processar_texto_articulado(self, texto, info, comprimento_max_fragmento):
+        '''Processa textos legais, divididos em artigos. Mantém o Caput dos artigos em cada um dos fragmentos.'''
+        
+        texto = texto.replace('\n', ' ')
+        while '  ' in texto: texto = texto.replace('  ', ' ')
+        texto = texto.replace(' Art. ', '\nArt. ')
+        
+        for num in range(1, 10):
+                texto = texto.replace(f'Art. {num}º', f'Art. {num}.')
+                texto = texto.replace(f'art. {num}º', f'art. {num}.')
+                texto = texto.replace(f'§ {num}º', f'§ {num}.')
+                
+        texto = texto.split('\n')
+        while '' in texto: texto.remove('')
+        
+        artigos = []
+        for art in texto:
+            item = art.split(' ')
+            qtd_palavras = len(item)
+            if qtd_palavras > comprimento_max_fragmento:
+                item = (
+                        art.replace('. §', '.\n§')
+                        .replace('; §', ';\n§')
+                        .replace(': §', ':\n§')
+                        .replace(';', '\n')
+                        .replace(':', '\n')
+                        .replace('\n ', '\n')
+                        .replace(' \n', '\n')
+                        .split('\n')
+                    )
+                caput = item[0]
+                fragmento_artigo = '' + caput
+                # AFAZER: considerar casos em que, mesmo após divisão das
+                # partes do artigo, haja alguma com mais palavras que o compr. máximo
+                for i in range(1, len(item)):
+                    if len(fragmento_artigo.split(' ')) + len(item[i].split(' ')) <= comprimento_max_fragmento:
+                        fragmento_artigo = fragmento_artigo + ' ' + item[i]
+                    else:
+                        artigos.append(fragmento_artigo)
+                        fragmento_artigo = '' + caput + ' ' + item[i]
+                artigos.append(fragmento_artigo)
+            else:
+                artigos.append(art)
+        
+        fragmentos = []
+        titulos = []
+        for artigo in artigos:
+            tit = artigo.split('. ')[1]
+            titulos.append(tit)
+            fragmento = {
+                'page_content': artigo,
+                'metadata': {
+                    'titulo': f'{info["titulo"]}',
+                    'subtitulo': f'Art. {tit} - {titulos.count(tit)}',
+                    'autor': f'{info["autor"]}',
+                    'fonte': f'{info["fonte"]}#Art_{tit}'
+                },
+            }
+            fragmentos.append(fragmento)
+        return fragmentos
+    
+    def processar_texto(self, texto, info, comprimento_max_fragmento, pagina=None):
+        texto = texto.replace('\n', ' ').replace('\t', ' ')
+        while '  ' in texto: texto = texto.replace('  ', ' ')
+        
+        if info['texto_articulado']:
+            return self.processar_texto_articulado(texto, info, comprimento_max_fragmento)
+        
+        if len(texto.split(' ')) <= comprimento_max_fragmento:
+            fragmento = {
+                'page_content': texto,
+                'metadata': {
+                    'titulo': f'{info["titulo"]}',
+                    'subtitulo':
+                        f'Página {pagina} - Fragmento 1' if pagina
+                        else f'Fragmento 1',
+                    'autor': f'{info["autor"]}',
+                    'fonte': f'{info["fonte"]}',
+                },
+            }
+            if pagina: fragmento['pagina']=pagina
+            return [fragmento]
+            
+        linhas = texto.replace('. ', '.\n')
+        linhas = linhas.split('\n')
+        while '' in linhas: linhas.remove('')
+        
+        fragmentos = []
+        texto_fragmento = ''
+        for idx in range(len(linhas)):
+            if len(texto_fragmento.split(' ')) + len(linhas[idx].split(' ')) < comprimento_max_fragmento:
+                texto_fragmento += ' ' + linhas[idx]
+            else:
+                fragmento = {
+                    'page_content': texto_fragmento,
+                    'metadata': {
+                        'titulo': f'{info["titulo"]}',
+                        'subtitulo':
+                            f'Página {pagina} - Fragmento {len(fragmentos)+1}' if pagina
+                            else f'Fragmento {len(fragmentos)+1}',
+                        'autor': f'{info["autor"]}',
+                        'fonte': f'{info["fonte"]}',
+                    },
+                }
+                if pagina: fragmento['pagina'] = pagina
+                fragmentos.append(fragmento)
+                texto_fragmento = ''
+            
+        return fragmentos       
+
+
+def ler_documentos(indice_documentos: dict, url_pasta_documentos: str, fator_ampliacao: int=1) -> dict:
+    '''
+    Lê os documentos em texto (txt) e Markdown (md) do índice. Os documentos em PDF e HTML são ignorados:
+    o texto extraído deles é processado pelo mesmo processar_texto dos documentos em texto.
+
+    Parâmetros:
+        indice_documentos (dict): índice de documentos (rótulo -> informações do documento)
+        url_pasta_documentos (str): pasta em que se encontram os documentos
+        fator_ampliacao (int): quantidade de vezes que o texto de cada documento é repetido, para simular documentos maiores
+
+    Retorna:
+        (dict): rótulo -> (informações do documento, texto)
+    '''
+
+    documentos = {}
+    for rotulo, info in indice_documentos.items():
+        tipo = info['url'].split('.')[-1]
+        if tipo not in ('txt', 'md'):
+            print(f'-- {rotulo} ignorado (tipo {tipo})')
+            continue
+        with open(os.path.join(url_pasta_documentos, info['url']), 'r', encoding='utf-8') as arq:
+            texto = arq.read()
+        # no texto ampliado, as repetições são separadas por quebra de linha, para não unir a última e a primeira linha
+        documentos[rotulo] = (info, '\n'.join([texto] * fator_ampliacao))
+    return documentos
+
+def processar(gerenciador: GerenciadorBancoVetores, info: dict, texto: str, comprimento_max_fragmento: int) -> List[dict]:
+    if info['url'].split('.')[-1] == 'md':
+        return gerenciador.processar_texto_markdown(texto=texto, info=info, comprimento_max_fragmento=comprimento_max_fragmento)
+    return gerenciador.processar_texto(texto, info, comprimento_max_fragmento)
+
+def medir(gerenciador: GerenciadorBancoVetores, info: dict, texto: str, comprimento_max_fragmento: int, repeticoes: int):
+    '''Retorna os fragmentos gerados e o menor tempo (em segundos) entre as repetições'''
+    tempos = []
+    for _ in range(repeticoes):
+        marcador_tempo_inicio = perf_counter()
+        fragmentos = processar(gerenciador, info, texto, comprimento_max_fragmento)
+        tempos.append(perf_counter() - marcador_tempo_inicio)
+    return fragmentos, min(tempos)
+
+def executar_benchmark(documentos: dict, comprimentos_max_fragmentos: List[int], repeticoes: int) -> List[dict]:
+    '''
+    Processa cada documento com a implementação anterior e a atual dos fragmentadores, verificando se os fragmentos
+    gerados são idênticos (serialização JSON byte a byte) e comparando os tempos de processamento.
+
+    Parâmetros:
+        documentos (dict): rótulo -> (informações do documento, texto), conforme ler_documentos()
+        comprimentos_max_fragmentos (List[int]): quantidades máximas de palavras por fragmento a serem testadas
+        repeticoes (int): quantidade de repetições para medição de tempo
+
+    Retorna:
+        (List[dict]): um resultado por documento e comprimento máximo de fragmento
+    '''
+
+    legado = GerenciadorBancoVetoresLegado()
+    atual = GerenciadorBancoVetores()
+    resultados = []
+    for rotulo, (info, texto) in documentos.items():
+        for comprimento in comprimentos_max_fragmentos:
+            fragmentos_legado, tempo_legado = medir(legado, info, texto, comprimento, repeticoes)
+            fragmentos_atual, tempo_atual = medir(atual, info, texto, comprimento, repeticoes)
+            resultados.append({
+                'documento': rotulo,
+                'tamanho_kb': len(texto.encode('utf-8')) / 1024,
+                'comprimento_max_fragmento': comprimento,
+                'num_fragmentos': len(fragmentos_atual),
+                'identico': json.dumps(fragmentos_legado, ensure_ascii=False) == json.dumps(fragmentos_atual, ensure_ascii=False),
+                'tempo_legado_ms': tempo_legado * 1000,
+                'tempo_atual_ms': tempo_atual * 1000,
+                'aceleracao': tempo_legado / tempo_atual if tempo_atual else float('inf')
+            })
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara a implementação anterior e a atual da fragmentação de documentos (resultado idêntico e tempo)")
+    parser.add_argument('--url_indice_documentos', type=str, help="caminho para arquivo com a lista de documentos")
+    parser.add_argument('--comprimentos_max_fragmentos', type=int, nargs='*', help="quantidades máximas de palavras por fragmento a serem testadas")
+    parser.add_argument('--repeticoes', type=int, help="quantidade de repetições para medição de tempo")
+    parser.add_argument('--fator_ampliacao', type=int, help="quantidade de vezes que o texto de cada documento é repetido")
+    parser.add_argument('--url_arquivo_saida', type=str, help="caminho para salvar o resultado em JSON")
+    args = parser.parse_args()
+
+    if args.url_indice_documentos:
+        with open(args.url_indice_documentos, 'r', encoding='utf-8') as arq:
+            indice_documentos = json.load(arq)
+    else:
+        indice_documentos = configuracoes.documentos
+    comprimentos_max_fragmentos = [100, 300, 500] if not args.comprimentos_max_fragmentos else args.comprimentos_max_fragmentos
+    repeticoes = 3 if not args.repeticoes else args.repeticoes
+    fator_ampliacao = 1 if not args.fator_ampliacao else args.fator_ampliacao
+
+    documentos = ler_documentos(indice_documentos, configuracoes.url_pasta_documentos, fator_ampliacao=fator_ampliacao)
+    resultados = executar_benchmark(documentos=documentos, comprimentos_max_fragmentos=comprimentos_max_fragmentos, repeticoes=repeticoes)
+
+    print(f"{'documento':<45}{'KB':>8}{'compr.':>8}{'frags':>7}{'idêntico':>10}{'legado (ms)':>13}{'atual (ms)':>12}{'acel.':>8}")
+    for res in resultados:
+        print(f"{res['documento'][-45:]:<45}{res['tamanho_kb']:>8.0f}{res['comprimento_max_fragmento']:>8}{res['num_fragmentos']:>7}"
+              f"{str(res['identico']):>10}{res['tempo_legado_ms']:>13.2f}{res['tempo_atual_ms']:>12.2f}{res['aceleracao']:>8.1f}")
+
+    total_legado = sum(res['tempo_legado_ms'] for res in resultados)
+    total_atual = sum(res['tempo_atual_ms'] for res in resultados)
+    print(f"\nTodos idênticos: {all(res['identico'] for res in resultados)} | tempo total: {total_legado:.1f} ms -> {total_atual:.1f} ms")
+
+    if args.url_arquivo_saida:
+        with open(args.url_arquivo_saida, 'w', encoding='utf-8') as arq:
+            json.dump(resultados, arq, ensure_ascii=False, indent=4)
+
+# Modelo de execução
+# python -m api.testes.benchmark_fragmentacao \
+# --comprimentos_max_fragmentos 100 300 500 \
+# --repeticoes 3 \
+# --fator_ampliacao 8
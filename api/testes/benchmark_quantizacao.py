@@ -0,0 +1,171 @@
+print('Carregando bibliotecas...')
+
+import argparse
+import json
+import os
+import tempfile
+from time import perf_counter
+from typing import List
+
+import numpy as np
+from chromadb import chromadb
+
+from api.configuracoes.config_gerais import configuracoes
+from api.dados.exportar_matriz_vetorial import exportar_matriz_vetorial
+from api.utils.interface_banco_vetores import InterfaceMatrizVetorial
+from api.utils.quantizacao_vetores import QUANTIZADORES
+
+
+def obter_consultas(colecao, url_banco_vetores: str, url_arq_fragmentos: str, num_consultas_sinteticas: int, semente: int=42):
+    '''
+    Monta as consultas do benchmark. Com o arquivo de perguntas (formato de api.testes.gerador_perguntas), as perguntas
+    são convertidas em embeddings pelo modelo da coleção (conforme o descritor.json do banco) e a referência de cada
+    uma é o fragmento que a originou. Sem o arquivo, são usados como consultas os embeddings de fragmentos sorteados
+    da coleção, com ruído gaussiano, tendo como referência o próprio fragmento.
+
+    Retorna:
+        (List[List[float]], List[str]): embeddings das consultas e ids dos fragmentos de referência
+    '''
+
+    if url_arq_fragmentos and os.path.exists(url_arq_fragmentos):
+        from api.dados.gerenciador_banco_vetores import GerenciadorBancoVetores
+        with open(url_arq_fragmentos, 'r', encoding='utf-8') as arq:
+            fragmentos_com_perguntas = json.load(arq)
+        with open(os.path.join(url_banco_vetores, 'descritor.json'), 'r', encoding='utf-8') as arq:
+            descritor_colecao = next(desc for desc in json.load(arq)['colecoes'] if desc['nome'] == colecao.name)
+
+        perguntas, ids_referencia = [], []
+        for fragmento in fragmentos_com_perguntas:
+            for par in fragmento['perguntas']:
+                perguntas.append(par['pergunta'])
+                ids_referencia.append(fragmento['id'])
+        print(f'Gerando embeddings de {len(perguntas)} perguntas com {descritor_colecao["funcao_embeddings"]["nome_modelo"]}...')
+        funcao_embeddings = GerenciadorBancoVetores().obter_funcao_embeddings(
+            nome_modelo=descritor_colecao['funcao_embeddings']['nome_modelo'],
+            instrucao=descritor_colecao['instrucao'])
+        return funcao_embeddings(perguntas), ids_referencia
+
+    print(f'Arquivo de perguntas não encontrado: usando {num_consultas_sinteticas} consultas sintéticas')
+    aleatorio = np.random.default_rng(semente)
+    total = colecao.count()
+    deslocamentos = aleatorio.choice(total, size=min(num_consultas_sinteticas, total), replace=False)
+    consultas, ids_referencia = [], []
+    for deslocamento in deslocamentos.tolist():
+        registro = colecao.get(include=['embeddings'], limit=1, offset=deslocamento)
+        embedding = np.asarray(registro['embeddings'][0], dtype=np.float32)
+        ruido = aleatorio.standard_normal(len(embedding)).astype(np.float32) * np.linalg.norm(embedding) / np.sqrt(len(embedding))
+        consultas.append((embedding + ruido).tolist())
+        ids_referencia.append(registro['ids'][0])
+    return consultas, ids_referencia
+
+def medir(consultar, consultas: List[List[float]], num_resultados: int):
+    '''Executa as consultas, retornando os ids recuperados e os tempos (ms) de cada uma'''
+    ids_recuperados, tempos = [], []
+    for embeddings_consulta in consultas:
+        marcador_tempo_inicio = perf_counter()
+        resultado = consultar(embeddings_consulta, num_resultados)
+        tempos.append((perf_counter() - marcador_tempo_inicio) * 1000)
+        ids_recuperados.append(resultado['ids'][0])
+    return ids_recuperados, tempos
+
+def resumir(nome: str, ids_recuperados: List[List[str]], tempos: List[float], ids_exatos: List[List[str]], ids_referencia: List[str], num_bytes: int) -> dict:
+    num_resultados = max(len(ids) for ids in ids_exatos) if ids_exatos else 0
+    return {
+        'configuracao': nome,
+        # proporção dos k documentos da busca exata (float32) também recuperados
+        'recall_busca_exata': float(np.mean([len(set(ids) & set(exatos)) / len(exatos) for ids, exatos in zip(ids_recuperados, ids_exatos) if exatos])),
+        # proporção das consultas em que o fragmento de referência está entre os k recuperados
+        'taxa_acerto_referencia': float(np.mean([referencia in ids for ids, referencia in zip(ids_recuperados, ids_referencia)])),
+        'num_resultados': num_resultados,
+        'tempo_medio_ms': float(np.mean(tempos)),
+        'tempo_p95_ms': float(np.percentile(tempos, 95)),
+        'memoria_percorrida_mb': num_bytes / 2**20
+    }
+
+def executar_benchmark(url_banco_vetores: str, nome_colecao: str, url_arq_fragmentos: str, num_resultados: int, fatores_candidatos: List[int],
+                       num_consultas_sinteticas: int, incluir_chroma: bool=True) -> List[dict]:
+    '''
+    Compara, nas mesmas consultas, a coleção do ChromaDB, a busca exata na matriz vetorial (float32) e a busca com as
+    matrizes quantizadas (int8 e binária) com reclassificação pelos embeddings completos, para cada fator de candidatos
+
+    Retorna:
+        (List[dict]): um resultado por configuração
+    '''
+
+    cliente_chroma = chromadb.PersistentClient(path=url_banco_vetores)
+    colecao = cliente_chroma.get_collection(name=nome_colecao, embedding_function=None)
+    consultas, ids_referencia = obter_consultas(colecao, url_banco_vetores, url_arq_fragmentos, num_consultas_sinteticas)
+
+    resultados = []
+    with tempfile.TemporaryDirectory() as url_matriz_vetorial:
+        print(f'Exportando a coleção {nome_colecao} para uma matriz vetorial temporária...')
+        exportar_matriz_vetorial(url_banco_vetores, nome_colecao, url_matriz_vetorial, tipo_dados='float32', quantizacoes=list(QUANTIZADORES))
+
+        exata = InterfaceMatrizVetorial(url_matriz_vetorial=url_matriz_vetorial, quantizacao=None, fazer_log=False)
+        consultar_exata = lambda embeddings_consulta, k: exata.consultar_documentos(None, k, embeddings_consulta=embeddings_consulta)
+        # primeira passada para carregar as páginas da matriz, fora da medição
+        medir(consultar_exata, consultas[:10], num_resultados)
+        ids_exatos, tempos = medir(consultar_exata, consultas, num_resultados)
+        resultados.append(resumir('matriz float32 (exata)', ids_exatos, tempos, ids_exatos, ids_referencia, exata.matriz.nbytes))
+
+        if incluir_chroma:
+            consultar_chroma = lambda embeddings_consulta, k: colecao.query(query_embeddings=[embeddings_consulta], n_results=k, include=['distances'])
+            medir(consultar_chroma, consultas[:10], num_resultados)
+            ids_recuperados, tempos = medir(consultar_chroma, consultas, num_resultados)
+            resultados.append(resumir('chroma (hnsw)', ids_recuperados, tempos, ids_exatos, ids_referencia, exata.matriz.nbytes))
+
+        for quantizacao in QUANTIZADORES:
+            for fator in fatores_candidatos:
+                interface = InterfaceMatrizVetorial(url_matriz_vetorial=url_matriz_vetorial, quantizacao=quantizacao, fator_candidatos=fator, fazer_log=False)
+                consultar = lambda embeddings_consulta, k: interface.consultar_documentos(None, k, embeddings_consulta=embeddings_consulta)
+                medir(consultar, consultas[:10], num_resultados)
+                ids_recuperados, tempos = medir(consultar, consultas, num_resultados)
+                resultados.append(resumir(f'{quantizacao} x{fator}', ids_recuperados, tempos, ids_exatos, ids_referencia, interface.quantizador.num_bytes()))
+                del interface
+        del exata
+
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara recall e tempo de consulta da coleção do ChromaDB, da matriz vetorial exata e das matrizes quantizadas (int8 e binária) com reclassificação")
+    parser.add_argument('--url_banco_vetores', type=str, help="banco de vetores (padrão: url_banco_vetores da configuração)")
+    parser.add_argument('--nome_colecao', type=str, help="coleção avaliada (padrão: nome_colecao_de_documentos da configuração)")
+    parser.add_argument('--url_arq_fragmentos', type=str, help="arquivo com fragmentos e perguntas (formato de api.testes.gerador_perguntas)")
+    parser.add_argument('--num_resultados', type=int, help="quantidade de documentos recuperados por consulta")
+    parser.add_argument('--fatores_candidatos', type=int, nargs='*', help="fatores de candidatos (candidatos = num_resultados x fator) a serem testados")
+    parser.add_argument('--num_consultas_sinteticas', type=int, help="quantidade de consultas sintéticas, usadas quando não há arquivo de perguntas")
+    parser.add_argument('--sem_chroma', action='store_true', help="não mede as consultas à coleção do ChromaDB")
+    parser.add_argument('--url_arquivo_saida', type=str, help="caminho para salvar o resultado em JSON")
+    args = parser.parse_args()
+
+    url_banco_vetores = configuracoes.url_banco_vetores if not args.url_banco_vetores else args.url_banco_vetores
+    nome_colecao = configuracoes.nome_colecao_de_documentos if not args.nome_colecao else args.nome_colecao
+    url_arq_fragmentos = 'api/testes/resultados/perguntas_documentos.json' if not args.url_arq_fragmentos else args.url_arq_fragmentos
+    num_resultados = 10 if not args.num_resultados else args.num_resultados
+    fatores_candidatos = [2, 5, 10, 20] if not args.fatores_candidatos else args.fatores_candidatos
+    num_consultas_sinteticas = 500 if not args.num_consultas_sinteticas else args.num_consultas_sinteticas
+
+    resultados = executar_benchmark(
+        url_banco_vetores=url_banco_vetores,
+        nome_colecao=nome_colecao,
+        url_arq_fragmentos=url_arq_fragmentos,
+        num_resultados=num_resultados,
+        fatores_candidatos=fatores_candidatos,
+        num_consultas_sinteticas=num_consultas_sinteticas,
+        incluir_chroma=not args.sem_chroma)
+
+    print(f"{'configuração':<26}{'recall exata':>14}{'acerto ref.':>13}{'média (ms)':>12}{'p95 (ms)':>10}{'memória (MB)':>14}")
+    for res in resultados:
+        print(f"{res['configuracao']:<26}{res['recall_busca_exata']:>14.3f}{res['taxa_acerto_referencia']:>13.3f}"
+              f"{res['tempo_medio_ms']:>12.3f}{res['tempo_p95_ms']:>10.3f}{res['memoria_percorrida_mb']:>14.2f}")
+
+    if args.url_arquivo_saida:
+        with open(args.url_arquivo_saida, 'w', encoding='utf-8') as arq:
+            json.dump(resultados, arq, ensure_ascii=False, indent=4)
+
+# Modelo de execução
+# python -m api.testes.benchmark_quantizacao \
+# --url_arq_fragmentos api/testes/resultados/perguntas_documentos.json \
+# --num_resultados 10 \
+# --fatores_candidatos 2 5 10 20
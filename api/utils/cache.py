@@ -0,0 +1,260 @@
+import json
+import sqlite3
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Hashable, Iterable, List, Tuple
+
+import numpy as np
+
+
+class CacheLRU:
+    '''
+    Cache em memória com capacidade limitada, descarte do item usado há mais tempo (LRU) e tempo de
+    validade opcional (TTL) para cada entrada. É seguro para uso por várias threads (as etapas do
+    pipeline são executadas em um pool de threads).
+
+    Atributos:
+        capacidade (int): quantidade máxima de entradas mantidas
+        ttl (float): tempo de validade de cada entrada, em segundos (None: sem expiração)
+        funcao_chave (Callable): função aplicada às chaves antes do acesso (ex.: normalização de texto)
+        acertos (int): quantidade de consultas atendidas pelo cache
+        falhas (int): quantidade de consultas não atendidas pelo cache (ausentes ou expiradas)
+        descartes (int): quantidade de entradas removidas por falta de capacidade
+    '''
+
+    def __init__(self, capacidade: int, ttl: float=None, funcao_chave: Callable[[Any], Hashable]=None):
+        if capacidade <= 0:
+            raise ValueError('A capacidade do cache deve ser maior que zero')
+        self.capacidade = capacidade
+        self.ttl = ttl
+        self.funcao_chave = funcao_chave
+        self.entradas = OrderedDict()
+        self.trava = Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.descartes = 0
+
+    def __chave(self, chave):
+        return self.funcao_chave(chave) if self.funcao_chave else chave
+
+    def __len__(self):
+        return len(self.entradas)
+
+    def obter(self, chave, padrao=None):
+        '''
+        Recupera o valor associado à chave, marcando-o como usado recentemente
+
+        Parâmetros:
+            chave: chave da entrada
+            padrao: valor retornado quando a chave não está no cache ou expirou
+
+        Retorna:
+            O valor armazenado ou `padrao`
+        '''
+
+        chave = self.__chave(chave)
+        with self.trava:
+            entrada = self.entradas.get(chave)
+            if entrada is None:
+                self.falhas += 1
+                return padrao
+            valor, expiracao = entrada
+            if expiracao is not None and expiracao <= monotonic():
+                del self.entradas[chave]
+                self.falhas += 1
+                return padrao
+            self.entradas.move_to_end(chave)
+            self.acertos += 1
+            return valor
+
+    def armazenar(self, chave, valor):
+        '''Armazena o valor associado à chave, descartando as entradas usadas há mais tempo caso a capacidade seja excedida'''
+        chave = self.__chave(chave)
+        expiracao = monotonic() + self.ttl if self.ttl else None
+        with self.trava:
+            self.entradas[chave] = (valor, expiracao)
+            self.entradas.move_to_end(chave)
+            while len(self.entradas) > self.capacidade:
+                self.entradas.popitem(last=False)
+                self.descartes += 1
+
+    def limpar(self):
+        '''Remove todas as entradas (os contadores são mantidos)'''
+        with self.trava:
+            self.entradas.clear()
+
+    def estatisticas(self) -> dict:
+        with self.trava:
+            consultas = self.acertos + self.falhas
+            return {
+                'entradas': len(self.entradas),
+                'capacidade': self.capacidade,
+                'ttl': self.ttl,
+                'acertos': self.acertos,
+                'falhas': self.falhas,
+                'descartes': self.descartes,
+                'taxa_acertos': self.acertos / consultas if consultas else 0.0
+            }
+
+
+class CacheRespostas:
+    '''
+    Cache semântico de respostas completas do pipeline RAG. Cada entrada é indexada pelos embeddings da
+    pergunta, e uma nova pergunta é atendida pelo cache quando a similaridade do cosseno com alguma pergunta
+    armazenada atinge o limiar configurado. As entradas são associadas a uma versão (ex.: coleção de documentos,
+    modelo de embeddings e modelo LLM), e só são reaproveitadas por consultas da mesma versão.
+
+    Atributos:
+        capacidade (int): quantidade máxima de respostas mantidas (descarte LRU)
+        limiar_similaridade (float): similaridade do cosseno mínima para que a resposta armazenada seja reaproveitada
+        ttl (float): tempo de validade de cada entrada, em segundos (None: sem expiração)
+        acertos (int): quantidade de consultas atendidas pelo cache
+        falhas (int): quantidade de consultas não atendidas pelo cache
+        descartes (int): quantidade de entradas removidas por falta de capacidade
+    '''
+
+    def __init__(self, capacidade: int, limiar_similaridade: float, ttl: float=None):
+        if capacidade <= 0:
+            raise ValueError('A capacidade do cache deve ser maior que zero')
+        self.capacidade = capacidade
+        self.limiar_similaridade = limiar_similaridade
+        self.ttl = ttl
+        # chave sequencial -> (versão, embeddings normalizados, valor, expiração)
+        self.entradas = OrderedDict()
+        self.proxima_chave = 0
+        self.trava = Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.descartes = 0
+
+    def __len__(self):
+        return len(self.entradas)
+
+    @staticmethod
+    def __normalizar(embeddings) -> np.ndarray:
+        vetor = np.asarray(embeddings, dtype=np.float32)
+        norma = np.linalg.norm(vetor)
+        return vetor / norma if norma else vetor
+
+    def buscar(self, embeddings: List[float], versao: Hashable) -> Tuple[Any, float]:
+        '''
+        Procura a resposta armazenada cuja pergunta é a mais similar à consultada
+
+        Parâmetros:
+            embeddings (List[float]): embeddings da pergunta
+            versao (Hashable): versão do pipeline que gerou a consulta
+
+        Retorna:
+            (Tuple[Any, float]): o valor armazenado e a similaridade, ou (None, None) caso nenhuma
+                                 entrada válida atinja o limiar
+        '''
+
+        vetor = self.__normalizar(embeddings)
+        agora = monotonic()
+        with self.trava:
+            expiradas = [chave for chave, entrada in self.entradas.items() if entrada[3] is not None and entrada[3] <= agora]
+            for chave in expiradas:
+                del self.entradas[chave]
+
+            candidatas = [chave for chave, entrada in self.entradas.items() if entrada[0] == versao]
+            if candidatas:
+                matriz = np.stack([self.entradas[chave][1] for chave in candidatas])
+                similaridades = matriz @ vetor
+                idx_melhor = int(np.argmax(similaridades))
+                similaridade = float(similaridades[idx_melhor])
+                if similaridade >= self.limiar_similaridade:
+                    chave = candidatas[idx_melhor]
+                    self.entradas.move_to_end(chave)
+                    self.acertos += 1
+                    return self.entradas[chave][2], similaridade
+            self.falhas += 1
+            return None, None
+
+    def armazenar(self, embeddings: List[float], versao: Hashable, valor):
+        '''Armazena a resposta associada aos embeddings da pergunta, descartando as entradas usadas há mais tempo caso a capacidade seja excedida'''
+        expiracao = monotonic() + self.ttl if self.ttl else None
+        vetor = self.__normalizar(embeddings)
+        with self.trava:
+            self.entradas[self.proxima_chave] = (versao, vetor, valor, expiracao)
+            self.proxima_chave += 1
+            while len(self.entradas) > self.capacidade:
+                self.entradas.popitem(last=False)
+                self.descartes += 1
+
+    def limpar(self):
+        '''Remove todas as entradas (os contadores são mantidos)'''
+        with self.trava:
+            self.entradas.clear()
+
+    def estatisticas(self) -> dict:
+        with self.trava:
+            consultas = self.acertos + self.falhas
+            return {
+                'entradas': len(self.entradas),
+                'capacidade': self.capacidade,
+                'ttl': self.ttl,
+                'limiar_similaridade': self.limiar_similaridade,
+                'acertos': self.acertos,
+                'falhas': self.falhas,
+                'descartes': self.descartes,
+                'taxa_acertos': self.acertos / consultas if consultas else 0.0
+            }
+
+
+class CacheSQLite:
+    '''
+    Armazenamento persistente de pares chave-valor em um arquivo SQLite, para uso como camada em disco de um
+    cache em memória (ex.: permitir que execuções de avaliação interrompidas sejam retomadas sem recalcular
+    resultados). Os valores são serializados em JSON.
+
+    Atributos:
+        url_arquivo (str): caminho do arquivo SQLite
+        acertos (int): quantidade de consultas atendidas
+        falhas (int): quantidade de consultas não atendidas
+    '''
+
+    def __init__(self, url_arquivo: str):
+        self.url_arquivo = url_arquivo
+        self.trava = Lock()
+        self.conexao = sqlite3.connect(url_arquivo, check_same_thread=False)
+        self.conexao.execute('CREATE TABLE IF NOT EXISTS Cache (Chave TEXT PRIMARY KEY, Valor TEXT NOT NULL);')
+        self.conexao.commit()
+        self.acertos = 0
+        self.falhas = 0
+
+    def obter(self, chave: str, padrao=None):
+        with self.trava:
+            linha = self.conexao.execute('SELECT Valor FROM Cache WHERE Chave = ?;', (chave,)).fetchone()
+            if linha is None:
+                self.falhas += 1
+                return padrao
+            self.acertos += 1
+            return json.loads(linha[0])
+
+    def armazenar(self, chave: str, valor):
+        self.armazenar_varios([(chave, valor)])
+
+    def armazenar_varios(self, pares: Iterable[Tuple[str, Any]]):
+        '''Armazena vários pares (chave, valor) em uma única transação'''
+        with self.trava:
+            self.conexao.executemany(
+                'INSERT OR REPLACE INTO Cache (Chave, Valor) VALUES (?, ?);',
+                [(chave, json.dumps(valor, ensure_ascii=False)) for chave, valor in pares])
+            self.conexao.commit()
+
+    def fechar(self):
+        with self.trava:
+            self.conexao.close()
+
+    def estatisticas(self) -> dict:
+        with self.trava:
+            entradas = self.conexao.execute('SELECT COUNT(*) FROM Cache;').fetchone()[0]
+            consultas = self.acertos + self.falhas
+            return {
+                'url_arquivo': self.url_arquivo,
+                'entradas': entradas,
+                'acertos': self.acertos,
+                'falhas': self.falhas,
+                'taxa_acertos': self.acertos / consultas if consultas else 0.0
+            }
@@ -24,6 +24,9 @@ class ClassificadorIntencao:
     def classificar_intencao(self, texto:str) -> str:
         raise NotImplementedError('Método classificar_intencao() não foi implantado para esta classe')
 
+    def classificar_intencao_embeddings(self, embeddings:List[float]) -> str:
+        raise NotImplementedError('Método classificar_intencao_embeddings() não foi implantado para esta classe')
+
     def classificar_intencao_proba(self, texto:str) -> Dict[str, float]:
         raise NotImplementedError('Método classificar_intencao_proba() não foi implantado para esta classe')
 
@@ -178,12 +181,19 @@ class ClassificadorIntencaoEmbeddings(ClassificadorIntencao):
         caminho_classificador='api/modelos/classificador_intencao_embeddings.joblib',
         modelo_embeddings=configuracoes.embedding_bge_m3,
         pipeline=None,
-        log_progresso=False
+        log_progresso=False,
+        embedder=None
     ):
         
-        device = 'cuda' if cuda.is_available() else 'cpu'
-        print(f'-- Carregando modelo de embeddings ({modelo_embeddings})')
-        self.embedder = SentenceTransformer(modelo_embeddings, device=device, trust_remote_code=True)
+        # Um embedder já carregado (ex.: a função de embeddings do banco vetorial, com o mesmo modelo)
+        # pode ser compartilhado, evitando manter duas cópias do modelo em memória
+        if embedder is not None:
+            print(f'-- Utilizando modelo de embeddings compartilhado ({modelo_embeddings})')
+            self.embedder = embedder
+        else:
+            device = 'cuda' if cuda.is_available() else 'cpu'
+            print(f'-- Carregando modelo de embeddings ({modelo_embeddings})')
+            self.embedder = SentenceTransformer(modelo_embeddings, device=device, trust_remote_code=True)
 
         self.metadados = {
             "data_criacao": datetime.now().isoformat(),
@@ -271,6 +281,9 @@ class ClassificadorIntencaoEmbeddings(ClassificadorIntencao):
     def classificar_intencao(self, texto:str) -> str:
         embeddings = self.embedder.encode([texto])
         return str(self.classificador.predict(embeddings)[0])
+
+    def classificar_intencao_embeddings(self, embeddings:List[float]) -> str:
+        return str(self.classificador.predict([embeddings])[0])
     
     def classificar_intencao_proba(self, texto:str) -> Dict[str, float]:
         embeddings = self.embedder.encode([texto])
@@ -0,0 +1,69 @@
+import json
+from typing import Any, Iterator
+
+
+class DecodificadorNDJSON:
+    '''
+    Decodificador incremental de streams no formato NDJSON (um objeto JSON por linha), como o retornado
+    pela API do Ollama com a opção 'stream'.
+
+    Os fragmentos recebidos pela rede não respeitam os limites das linhas: um mesmo fragmento pode conter
+    várias linhas, ou apenas parte de uma. O decodificador acumula os bytes recebidos e só desserializa as
+    linhas completas, mantendo a parte final (incompleta) para ser concatenada ao próximo fragmento.
+
+    Atributos:
+        buffer (bytearray): bytes recebidos e ainda não consumidos (linha incompleta)
+        posicao_busca (int): posição do buffer a partir da qual ainda não se procurou por quebras de linha
+    '''
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.posicao_busca = 0
+
+    def alimentar(self, fragmento: bytes) -> Iterator[Any]:
+        '''
+        Recebe um fragmento do stream e retorna os objetos de todas as linhas que foram completadas
+
+        Parâmetros:
+            fragmento (bytes): bytes recebidos da rede
+
+        Retorna:
+            (Iterator[Any]): objetos desserializados, na ordem em que aparecem no stream
+        '''
+
+        self.buffer += fragmento
+        inicio = 0
+        # só procura quebras de linha nos bytes que ainda não foram examinados
+        fim = self.buffer.find(b'\n', self.posicao_busca)
+        while fim != -1:
+            objeto = self.__decodificar_linha(self.buffer[inicio:fim])
+            if objeto is not None:
+                yield objeto
+            inicio = fim + 1
+            fim = self.buffer.find(b'\n', inicio)
+
+        del self.buffer[:inicio]
+        self.posicao_busca = len(self.buffer)
+
+    def finalizar(self) -> Iterator[Any]:
+        '''
+        Processa o conteúdo restante no buffer, ao final do stream (última linha sem quebra de linha)
+
+        Retorna:
+            (Iterator[Any]): objeto da última linha, caso exista
+        '''
+
+        objeto = self.__decodificar_linha(self.buffer)
+        self.buffer = bytearray()
+        self.posicao_busca = 0
+        if objeto is not None:
+            yield objeto
+
+    def __decodificar_linha(self, linha: bytearray):
+        if not linha.strip():
+            return None
+        try:
+            return json.loads(linha)
+        except ValueError:
+            print('ERRO: falha na serialização da linha\n' + linha.decode(errors='replace'))
+            return None
@@ -0,0 +1,63 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict
+
+from api.configuracoes.config_gerais import configuracoes
+
+
+class ExecutorEtapas:
+    '''
+    Executa etapas bloqueantes (consultas ao banco vetorial, inferência de modelos, escrita em banco de dados)
+    em um pool de threads, fora do event loop, limitando a quantidade de execuções simultâneas por etapa.
+
+    Atributos:
+        max_workers (int): quantidade de threads do pool
+        executor (ThreadPoolExecutor): pool de threads compartilhado por todas as etapas
+        limites_etapas (Dict[str, int]): quantidade máxima de execuções simultâneas de cada etapa
+        semaforos (Dict[str, asyncio.Semaphore]): semáforos que aplicam os limites de cada etapa
+    '''
+
+    def __init__(self,
+                 max_workers: int=configuracoes.threadpool_max_workers,
+                 limites_etapas: Dict[str, int]=configuracoes.limites_concorrencia_etapas):
+        '''
+        Inicializa o executor
+
+        Parâmetros:
+            max_workers (int): quantidade de threads do pool
+            limites_etapas (Dict[str, int]): quantidade máxima de execuções simultâneas de cada etapa.
+                                             Etapas não listadas ficam limitadas apenas pelo tamanho do pool
+        '''
+
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='etapa')
+        self.limites_etapas = dict(limites_etapas) if limites_etapas else {}
+        self.semaforos = {}
+
+    def obter_semaforo(self, etapa: str) -> asyncio.Semaphore:
+        if etapa not in self.semaforos:
+            limite = self.limites_etapas.get(etapa, self.max_workers)
+            self.semaforos[etapa] = asyncio.Semaphore(limite)
+        return self.semaforos[etapa]
+
+    async def executar(self, etapa: str, funcao: Callable, *args, **kwargs):
+        '''
+        Executa uma função bloqueante no pool de threads, respeitando o limite de concorrência da etapa
+
+        Parâmetros:
+            etapa (str): nome da etapa (ex.: 'consulta', 'reclassificacao'), usado para aplicar o limite de concorrência
+            funcao (Callable): função bloqueante a ser executada
+            *args, **kwargs: argumentos repassados à função
+
+        Retorna:
+            O valor retornado pela função
+        '''
+
+        loop = asyncio.get_running_loop()
+        async with self.obter_semaforo(etapa):
+            return await loop.run_in_executor(self.executor, partial(funcao, *args, **kwargs))
+
+    def encerrar(self, aguardar: bool=True):
+        '''Encerra o pool de threads, aguardando (ou não) as execuções em andamento'''
+        self.executor.shutdown(wait=aguardar)
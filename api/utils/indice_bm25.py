@@ -0,0 +1,169 @@
+import os
+import re
+from math import log
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+from api.utils.texto import remover_acentos
+
+RE_TERMOS = re.compile(r'[a-z0-9]+')
+
+# palavras muito frequentes em português (sem acentos), descartadas na indexação e nas consultas
+PALAVRAS_VAZIAS = {
+    'a', 'o', 'as', 'os', 'ao', 'aos', 'de', 'da', 'do', 'das', 'dos', 'e', 'em', 'no', 'na', 'nos', 'nas', 'um',
+    'uma', 'uns', 'umas', 'para', 'pra', 'por', 'pelo', 'pela', 'pelos', 'pelas', 'com', 'que', 'se', 'ou', 'como',
+    'qual', 'quais', 'quando', 'onde', 'sao', 'ser', 'eu', 'meu', 'minha', 'me', 'sobre', 'ja', 'mais', 'tem'
+}
+
+
+def obter_url_indice_bm25(url_banco_vetores: str, nome_colecao: str) -> str:
+    '''Caminho do índice BM25 de uma coleção, gravado na pasta do banco de vetores'''
+    return os.path.join(url_banco_vetores, f'bm25_{nome_colecao}.npz')
+
+def tokenizar(texto: str) -> List[str]:
+    '''
+    Divide o texto em termos para o índice léxico: remove acentos, converte para minúsculas e descarta pontuação
+    e palavras vazias. Ex.: 'Licença-prêmio do Art. 57' -> ['licenca', 'premio', 'art', '57']
+    '''
+    return [termo for termo in RE_TERMOS.findall(remover_acentos(texto).lower()) if termo not in PALAVRAS_VAZIAS]
+
+class IndiceBM25:
+    '''
+    Índice léxico (esparso) dos fragmentos de uma coleção, consultado com o BM25. Para cada termo, o índice guarda os
+    documentos em que ele ocorre e o peso BM25 já calculado (idf x frequência normalizada pelo tamanho do documento),
+    de modo que a consulta apenas soma os pesos dos termos da pergunta.
+
+    Atributos:
+        ids (List[str]): ids dos documentos (os mesmos da coleção do banco vetorial)
+        posicoes (dict): id -> posição do documento em `ids`
+        vocabulario (dict): termo -> posição do termo nas listas de documentos e pesos
+        inicios (np.ndarray): início, em `documentos` e `pesos`, da lista de cada termo (o fim é o início do termo seguinte)
+        documentos (np.ndarray): índices dos documentos que contêm cada termo
+        pesos (np.ndarray): peso BM25 do termo em cada documento
+        k1 (float): saturação da frequência do termo
+        b (float): normalização pelo tamanho do documento
+    '''
+
+    def __init__(self, ids: List[str], vocabulario: List[str], inicios: np.ndarray, documentos: np.ndarray, pesos: np.ndarray, k1: float=1.5, b: float=0.75):
+        self.ids = list(ids)
+        self.posicoes = {id_doc: idx for idx, id_doc in enumerate(self.ids)}
+        self.vocabulario = {termo: idx for idx, termo in enumerate(vocabulario)}
+        self.inicios = inicios
+        self.documentos = documentos
+        self.pesos = pesos
+        self.k1 = k1
+        self.b = b
+
+    @classmethod
+    def construir(cls, ids: List[str], textos: List[str], k1: float=1.5, b: float=0.75) -> 'IndiceBM25':
+        '''
+        Constrói o índice a partir dos textos dos documentos
+
+        Parâmetros:
+            ids (List[str]): ids dos documentos
+            textos (List[str]): conteúdo dos documentos
+            k1 (float): saturação da frequência do termo
+            b (float): normalização pelo tamanho do documento
+
+        Retorna:
+            (IndiceBM25): índice construído
+        '''
+
+        listas_termos = {}
+        tamanhos = np.zeros(len(textos), dtype=np.float32)
+        for idx_doc, texto in enumerate(textos):
+            termos = tokenizar(texto)
+            tamanhos[idx_doc] = len(termos)
+            frequencias = {}
+            for termo in termos:
+                frequencias[termo] = frequencias.get(termo, 0) + 1
+            for termo, frequencia in frequencias.items():
+                listas_termos.setdefault(termo, []).append((idx_doc, frequencia))
+
+        num_documentos = len(textos)
+        tamanho_medio = float(tamanhos.mean()) if num_documentos and tamanhos.sum() else 1.0
+        vocabulario = sorted(listas_termos)
+        inicios = np.zeros(len(vocabulario) + 1, dtype=np.int64)
+        lista_documentos, lista_pesos = [], []
+        for idx_termo, termo in enumerate(vocabulario):
+            ocorrencias = listas_termos[termo]
+            documentos = np.array([idx_doc for idx_doc, _ in ocorrencias], dtype=np.int32)
+            frequencias = np.array([frequencia for _, frequencia in ocorrencias], dtype=np.float32)
+            # idf do BM25 (variante sempre positiva, como no Lucene)
+            idf = log(1 + (num_documentos - len(ocorrencias) + 0.5) / (len(ocorrencias) + 0.5))
+            pesos = idf * frequencias * (k1 + 1) / (frequencias + k1 * (1 - b + b * tamanhos[documentos] / tamanho_medio))
+            lista_documentos.append(documentos)
+            lista_pesos.append(pesos.astype(np.float32))
+            inicios[idx_termo + 1] = inicios[idx_termo] + len(ocorrencias)
+
+        return cls(
+            ids=ids,
+            vocabulario=vocabulario,
+            inicios=inicios,
+            documentos=np.concatenate(lista_documentos) if lista_documentos else np.zeros(0, dtype=np.int32),
+            pesos=np.concatenate(lista_pesos) if lista_pesos else np.zeros(0, dtype=np.float32),
+            k1=k1,
+            b=b)
+
+    def consultar(self, termos_de_consulta: str, num_resultados: int, ids_permitidos: Iterable[str]=None) -> List[Tuple[str, float]]:
+        '''
+        Recupera os documentos com maior score BM25 para a consulta
+
+        Parâmetros:
+            termos_de_consulta (str): texto da consulta
+            num_resultados (int): quantidade de documentos a serem recuperados
+            ids_permitidos (Iterable[str]): parâmetro opcional, restringe a consulta a esses documentos (ex.: os que
+                                            atendem a filtros de metadados)
+
+        Retorna:
+            (List[Tuple[str, float]]): ids e scores dos documentos, em ordem decrescente de score. Documentos sem
+                                       nenhum termo da consulta não são retornados
+        '''
+
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for termo in set(tokenizar(termos_de_consulta)):
+            idx_termo = self.vocabulario.get(termo)
+            if idx_termo is None:
+                continue
+            inicio, fim = self.inicios[idx_termo], self.inicios[idx_termo + 1]
+            scores[self.documentos[inicio:fim]] += self.pesos[inicio:fim]
+        if ids_permitidos is not None:
+            permitidos = np.zeros(len(self.ids), dtype=bool)
+            permitidos[[self.posicoes[id_doc] for id_doc in ids_permitidos if id_doc in self.posicoes]] = True
+            scores[~permitidos] = 0
+
+        num_candidatos = int(np.count_nonzero(scores))
+        num_resultados = min(num_resultados, num_candidatos)
+        if num_resultados <= 0:
+            return []
+        indices = np.argpartition(-scores, num_resultados - 1)[:num_resultados]
+        indices = indices[np.argsort(-scores[indices], kind='stable')]
+        return [(self.ids[idx], float(scores[idx])) for idx in indices]
+
+    def salvar(self, url_arquivo: str):
+        '''Grava o índice em um arquivo .npz (sem objetos serializados com pickle)'''
+        # grava em arquivo temporário e o substitui ao final, para que leitores não vejam um índice parcialmente gravado
+        with open(url_arquivo + '.tmp', 'wb') as arq:
+            np.savez(
+                arq,
+                ids=np.array(self.ids, dtype=str),
+                vocabulario=np.array(sorted(self.vocabulario, key=self.vocabulario.get), dtype=str),
+                inicios=self.inicios,
+                documentos=self.documentos,
+                pesos=self.pesos,
+                parametros=np.array([self.k1, self.b], dtype=np.float64))
+        os.replace(url_arquivo + '.tmp', url_arquivo)
+
+    @classmethod
+    def carregar(cls, url_arquivo: str) -> 'IndiceBM25':
+        with np.load(url_arquivo, allow_pickle=False) as dados:
+            k1, b = dados['parametros'].tolist()
+            return cls(
+                ids=dados['ids'].tolist(),
+                vocabulario=dados['vocabulario'].tolist(),
+                inicios=dados['inicios'],
+                documentos=dados['documentos'],
+                pesos=dados['pesos'],
+                k1=k1,
+                b=b)
@@ -1,10 +1,19 @@
-from typing import Callable
+import json
+import os
+import threading
+from typing import Callable, List
+import httpx
+import numpy as np
 from chromadb import chromadb, Documents, EmbeddingFunction, Embeddings
 from sentence_transformers import SentenceTransformer
 from torch import cuda
-from api.utils.interface_llm import ClienteOllama
+from api.utils.cache import CacheLRU
+from api.utils.quantizacao_vetores import QUANTIZADORES
 from api.configuracoes.config_gerais import configuracoes
 
+# arquivos da matriz vetorial (ver InterfaceMatrizVetorial e api.dados.exportar_matriz_vetorial)
+NOME_ARQUIVO_MATRIZ = 'embeddings.npy'
+NOME_ARQUIVO_METADADOS_MATRIZ = 'metadados.json'
 
 
 class FuncaoEmbeddings(EmbeddingFunction):
@@ -18,7 +27,7 @@ class FuncaoEmbeddings(EmbeddingFunction):
         instrucao (str): instrução a ser utilizada em modelos do tipo instructor
     '''
 
-    def __init__(self, nome_modelo: str, tipo_modelo=SentenceTransformer, device: str=None, instrucao: str=None):
+    def __init__(self, nome_modelo: str, tipo_modelo=SentenceTransformer, device: str=None, instrucao: str=None, cache: CacheLRU=None, tamanho_lote: int=32):
         '''
         Inicializa a função
 
@@ -27,6 +36,8 @@ class FuncaoEmbeddings(EmbeddingFunction):
             tipo_modelo (type): classe que encapsula o modelo utilizado
             device (str): parâmetro opcional, tipo de dispositivo em que será executada a aplicação ['cuda', 'cpu']
             instrucao (str): parâmetro opcional, instrução a ser utilizada em modelos do tipo instructor
+            cache (CacheLRU): parâmetro opcional, cache de embeddings já calculados (ex.: perguntas repetidas)
+            tamanho_lote (int): parâmetro opcional, quantidade de textos processados por vez pelo modelo
         '''
 
         # Caso não seja informado o dispositivo/device, utiliza 'cuda'/'cpu' de acordo com o que está disponível
@@ -39,6 +50,8 @@ class FuncaoEmbeddings(EmbeddingFunction):
         self.modelo = tipo_modelo(nome_modelo, device=self.device, cache_folder=configuracoes.url_cache_modelos, trust_remote_code=True)
         self.modelo.to(self.device)
         self.instrucao = instrucao
+        self.cache = cache
+        self.tamanho_lote = tamanho_lote
 
     def __call__(self, input: Documents) -> Embeddings:
         '''
@@ -51,13 +64,42 @@ class FuncaoEmbeddings(EmbeddingFunction):
             (chroma.Embeddings): uma lista de representações de Embeddings (List[ndarray[Any, dtype[signedinteger[_32Bit] | floating[_32Bit]]]])
         '''
 
+        if self.cache is None:
+            return self.gerar_embeddings(input)
+
+        # Somente os textos ausentes do cache passam pelo modelo
+        embeddings = [self.cache.obter(texto) for texto in input]
+        indices_ausentes = [idx for idx, embedding in enumerate(embeddings) if embedding is None]
+        if indices_ausentes:
+            novos_embeddings = self.gerar_embeddings([input[idx] for idx in indices_ausentes])
+            for idx, embedding in zip(indices_ausentes, novos_embeddings):
+                self.cache.armazenar(input[idx], embedding)
+                embeddings[idx] = embedding
+        return embeddings
+
+    def gerar_embeddings(self, input: Documents) -> Embeddings:
         # Generate embeddings for input text
         if self.instrucao:
             input_instrucao = [(self.instrucao, doc) for doc in input]
-            embeddings = self.modelo.encode(input_instrucao, convert_to_numpy=True, device=self.device)
+            embeddings = self.modelo.encode(input_instrucao, convert_to_numpy=True, device=self.device, batch_size=self.tamanho_lote)
         else:
-            embeddings = self.modelo.encode(input, convert_to_numpy=True, device=self.device)
+            embeddings = self.modelo.encode(input, convert_to_numpy=True, device=self.device, batch_size=self.tamanho_lote)
         return embeddings.tolist()
+
+    def encode(self, textos: List[str], **kwargs):
+        '''
+        Gera embeddings utilizando diretamente o modelo carregado. Permite que outros componentes (ex.: o
+        classificador de intenção) compartilhem a mesma instância do modelo, em vez de carregar outra cópia
+
+        Parâmetros:
+            textos (List[str]): textos a serem representados por embeddings
+            **kwargs: parâmetros repassados ao método encode do modelo
+
+        Retorna:
+            (ndarray): embeddings dos textos
+        '''
+        kwargs.setdefault('device', self.device)
+        return self.modelo.encode(textos, **kwargs)
     
 class FuncaoEmbeddingsAPI(EmbeddingFunction):
     # Custom embedding function using API calls
@@ -97,15 +139,35 @@ class FuncaoEmbeddingsAPI(EmbeddingFunction):
 class FuncaoEmbeddingsOllama(FuncaoEmbeddingsAPI):
     '''
     Especialização de FuncaoEmbeddingsAPI voltada para uso com o Ollama
+
+    Atributos:
+        cliente_http (httpx.Client): cliente HTTP síncrono com pool de conexões, reaproveitado em todas as chamadas
+        vagas_conexoes (threading.BoundedSemaphore): limita as chamadas simultâneas à quantidade de conexões do pool
     '''
 
     def __init__(self, url_api, nome_modelo):
         super().__init__(url_api, nome_modelo)
+        # O ChromaDB invoca a função de forma síncrona (fora de um event loop, ou em threads do pool de etapas), por isso
+        # o cliente é síncrono: um cliente assíncrono ficaria preso ao event loop em que foi criado
+        self.cliente_http = httpx.Client(
+            base_url=url_api,
+            limits=httpx.Limits(
+                max_connections=configuracoes.ollama_max_conexoes,
+                max_keepalive_connections=configuracoes.ollama_max_conexoes_keepalive,
+                keepalive_expiry=configuracoes.ollama_tempo_keepalive),
+            timeout=httpx.Timeout(configuracoes.ollama_timeout_leitura, connect=configuracoes.ollama_timeout_conexao))
+        # as threads excedentes aguardam aqui, e não dentro do pool de conexões do httpx
+        self.vagas_conexoes = threading.BoundedSemaphore(configuracoes.ollama_max_conexoes)
     
     def __call__(self, input: Documents) -> Embeddings:
-        llm = ClienteOllama(nome_modelo=self.nome_modelo, url_llm=self.url_api)
-        embeddings = llm.gerar_embeddings(input)
-        return embeddings
+        with self.vagas_conexoes:
+            resposta = self.cliente_http.post('/api/embed', json={'model': self.nome_modelo, 'input': input})
+        resposta.raise_for_status()
+        return resposta.json()['embeddings']
+
+    def encerrar(self):
+        '''Fecha o cliente HTTP e as conexões mantidas no pool'''
+        self.cliente_http.close()
     
 class FuncaoEmbeddingsGeneric(EmbeddingFunction):
     '''
@@ -136,17 +198,67 @@ class FuncaoEmbeddingsGeneric(EmbeddingFunction):
             (chroma.Embeddings): uma lista de representações de Embeddings (List[ndarray[Any, dtype[signedinteger[_32Bit] | floating[_32Bit]]]])
         '''
         return self.funcao(input)
-        
-    
+
+
+# campos dos metadados dos fragmentos que podem ser usados nos filtros das consultas (ver normalizar_filtros)
+CAMPOS_FILTRO_METADADOS = ('titulo', 'subtitulo', 'autor', 'fonte', 'tag_fragmento', 'documento')
+
+def normalizar_filtros(filtros: dict) -> dict:
+    '''
+    Valida os filtros de metadados e os converte para o formato campo -> lista de valores aceitos. Um valor único é
+    convertido em lista, e campos sem valores são descartados (não restringem a consulta). Somente campos de
+    CAMPOS_FILTRO_METADADOS e valores de texto são aceitos (operadores do ChromaDB, como {'$ne': ...}, são rejeitados).
+    Ex.: {'titulo': 'Regimento Interno - ALRN', 'fonte': []} -> {'titulo': ['Regimento Interno - ALRN']}
+
+    Retorna:
+        (dict): filtros normalizados, ou None se não restam filtros
+    '''
+    if not filtros:
+        return None
+    filtros_normalizados = {}
+    for campo, valores in filtros.items():
+        if campo not in CAMPOS_FILTRO_METADADOS:
+            raise ValueError(f'Campo de filtro não suportado: {campo} ({", ".join(CAMPOS_FILTRO_METADADOS)})')
+        valores = [valores] if isinstance(valores, str) else valores
+        if not isinstance(valores, (list, tuple, set)) or not all(isinstance(valor, str) for valor in valores):
+            raise ValueError(f'Valores do filtro {campo} devem ser textos ou listas de textos')
+        if valores:
+            filtros_normalizados[campo] = list(dict.fromkeys(valores))
+    return filtros_normalizados or None
+
+def montar_filtro_chroma(filtros: dict) -> dict:
+    '''Converte os filtros (normalizados com normalizar_filtros()) para o parâmetro `where` das consultas do ChromaDB'''
+    condicoes = [{campo: valores[0]} if len(valores) == 1 else {campo: {'$in': valores}} for campo, valores in filtros.items()]
+    return condicoes[0] if len(condicoes) == 1 else {'$and': condicoes}
+
 class InterfaceBancoVetorial:
     # Base class for interfacing with vector stores
     '''
     Classe base a ser utilizada em interações vector stores/bancos vetoriais
     '''
 
-    def consultar_documentos(self, termos_de_consulta: str, num_resultados=configuracoes.num_documentos_retornados) -> chromadb.QueryResult:
+    def consultar_documentos(self, termos_de_consulta: str, num_resultados=configuracoes.num_documentos_retornados, embeddings_consulta: List[float]=None, filtros: dict=None) -> chromadb.QueryResult:
         raise NotImplementedError('Método consultar_documentos() não foi implantado para esta classe') 
 
+    def obter_documentos(self, ids: List[str], embeddings_consulta: List[float]=None) -> dict:
+        '''
+        Obtém conteúdo e metadados de documentos a partir dos ids e, se informados os embeddings de uma consulta,
+        a distância do cosseno entre cada documento e a consulta
+
+        Retorna:
+            (dict): 'ids', 'documents', 'metadatas' e 'distances' (None sem embeddings_consulta), na ordem de `ids`
+        '''
+        raise NotImplementedError('Método obter_documentos() não foi implantado para esta classe')
+
+    def obter_ids(self, filtros: dict) -> List[str]:
+        '''
+        Obtém os ids dos documentos que atendem aos filtros de metadados (ver normalizar_filtros)
+
+        Retorna:
+            (List[str]): ids dos documentos
+        '''
+        raise NotImplementedError('Método obter_ids() não foi implantado para esta classe')
+
 class InterfaceChroma(InterfaceBancoVetorial):
     # Interface for interacting with a ChromaDB-based vector database
     '''
@@ -174,5 +286,320 @@ class InterfaceChroma(InterfaceBancoVetorial):
         if fazer_log: print(f'--- definindo a coleção a ser usada ({colecao_de_documentos})...')
         self.colecao_documentos = self.banco_de_vetores.get_collection(name=colecao_de_documentos, embedding_function=funcao_de_embeddings)
     
-    def consultar_documentos(self, termos_de_consulta: str, num_resultados=configuracoes.num_documentos_retornados) -> chromadb.QueryResult:
-        return self.colecao_documentos.query(query_texts=[termos_de_consulta], n_results=num_resultados)
\ No newline at end of file
+    def consultar_documentos(self, termos_de_consulta: str, num_resultados=configuracoes.num_documentos_retornados, embeddings_consulta: List[float]=None, filtros: dict=None) -> chromadb.QueryResult:
+        '''
+        Recupera os documentos mais similares aos termos de consulta
+
+        Parâmetros:
+            termos_de_consulta (str): texto da consulta
+            num_resultados (int): quantidade de documentos a serem recuperados
+            embeddings_consulta (List[float]): parâmetro opcional, embeddings já calculados para os termos de consulta.
+                                               Quando fornecido, evita que a função de embeddings seja executada novamente
+            filtros (dict): parâmetro opcional, valores aceitos de campos dos metadados (ex.: {'titulo': [...]}), conforme
+                            normalizar_filtros(); apenas documentos que atendem aos filtros são recuperados
+
+        Retorna:
+            (chromadb.QueryResult): resultado da consulta
+        '''
+        filtros = normalizar_filtros(filtros)
+        where = montar_filtro_chroma(filtros) if filtros else None
+        if embeddings_consulta is not None:
+            return self.colecao_documentos.query(query_embeddings=[embeddings_consulta], n_results=num_resultados, where=where)
+        return self.colecao_documentos.query(query_texts=[termos_de_consulta], n_results=num_resultados, where=where)
+
+    def obter_documentos(self, ids: List[str], embeddings_consulta: List[float]=None) -> dict:
+        incluir = ['documents', 'metadatas'] + (['embeddings'] if embeddings_consulta is not None else [])
+        resultado = self.colecao_documentos.get(ids=ids, include=incluir)
+        # o get() não garante a ordem dos ids solicitados
+        posicoes = {id_doc: idx for idx, id_doc in enumerate(resultado['ids'])}
+        indices = [posicoes[id_doc] for id_doc in ids if id_doc in posicoes]
+        distancias = None
+        if embeddings_consulta is not None:
+            consulta = np.asarray(embeddings_consulta, dtype=np.float32)
+            embeddings = np.asarray(resultado['embeddings'], dtype=np.float32).reshape(len(resultado['ids']), -1)[indices]
+            normas = np.linalg.norm(embeddings, axis=1) * np.linalg.norm(consulta)
+            normas[normas == 0] = 1
+            distancias = (1 - embeddings @ consulta / normas).tolist()
+        return {
+            'ids': [resultado['ids'][idx] for idx in indices],
+            'documents': [resultado['documents'][idx] for idx in indices],
+            'metadatas': [resultado['metadatas'][idx] for idx in indices],
+            'distances': distancias
+        }
+
+    def obter_ids(self, filtros: dict) -> List[str]:
+        filtros = normalizar_filtros(filtros)
+        return self.colecao_documentos.get(where=montar_filtro_chroma(filtros) if filtros else None, include=[])['ids']
+
+class InterfaceMatrizVetorial(InterfaceBancoVetorial):
+    '''
+    Especialização de InterfaceBancoVetorial com busca exata em uma matriz de embeddings mantida pelo próprio processo,
+    sem o ChromaDB. A matriz (embeddings normalizados, float32 ou float16, em arquivo .npy mapeado em memória) e os
+    ids, conteúdos e metadados dos documentos (arquivo JSON) são exportados de uma coleção do ChromaDB com
+    api.dados.exportar_matriz_vetorial. Como os embeddings são normalizados, a similaridade do cosseno é obtida com um
+    único produto matriz-vetor, e os documentos mais similares são selecionados com argpartition.
+
+    O resultado tem o formato do QueryResult do ChromaDB, com a distância do cosseno (1 - similaridade) em 'distances',
+    como em uma coleção com 'hnsw:space' = 'cosine'.
+
+    Com `quantizacao` ('int8' ou 'binario', ver api.utils.quantizacao_vetores), cada consulta percorre apenas a matriz
+    quantizada, que seleciona `num_resultados * fator_candidatos` candidatos; somente as linhas desses candidatos são
+    lidas da matriz completa (mapeada em memória) para o cálculo da similaridade exata, que define o resultado.
+
+    Consultas com filtros percorrem apenas a partição da matriz com os documentos que atendem aos filtros (busca exata,
+    sem a matriz quantizada). As partições (linhas de cada valor de um campo dos metadados) são montadas na carga para
+    o campo 'titulo' e, para outros campos, na primeira consulta que os utiliza. Como a exportação agrupa as linhas por
+    título, a partição de cada documento é um intervalo contínuo da matriz, percorrido sem cópia.
+
+    Atributos:
+        matriz (np.ndarray): embeddings normalizados dos documentos (uma linha por documento)
+        ids (List[str]): ids dos documentos, na ordem das linhas da matriz
+        documentos (List[str]): conteúdo dos documentos
+        metadados (List[dict]): metadados dos documentos
+        funcao_de_embeddings (EmbeddingFunction): função usada quando a consulta é feita sem embeddings
+        quantizador (QuantizadorInt8 | QuantizadorBinario): matriz quantizada usada na seleção de candidatos (None: busca exata)
+        fator_candidatos (int): quantidade de candidatos por documento retornado, na busca com quantização
+        particoes (dict): campo dos metadados -> valor -> linhas (np.ndarray) dos documentos com aquele valor
+    '''
+    def __init__(self,
+                 url_matriz_vetorial=configuracoes.url_matriz_vetorial,
+                 funcao_de_embeddings=None,
+                 quantizacao: str=configuracoes.quantizacao_matriz_vetorial,
+                 fator_candidatos: int=configuracoes.fator_candidatos_quantizacao,
+                 fazer_log=True):
+
+        if fazer_log: print(f'--- carregando matriz vetorial (usando "{url_matriz_vetorial}")...')
+        with open(os.path.join(url_matriz_vetorial, NOME_ARQUIVO_METADADOS_MATRIZ), 'r', encoding='utf-8') as arq:
+            descritor = json.load(arq)
+        self.ids = descritor['ids']
+        self.documentos = descritor['documentos']
+        self.metadados = descritor['metadados']
+        self.info_matriz = {chave: valor for chave, valor in descritor.items() if chave not in ('ids', 'documentos', 'metadados')}
+
+        # o arquivo é mapeado em memória: as páginas são carregadas sob demanda e compartilhadas entre processos (workers)
+        matriz = np.load(os.path.join(url_matriz_vetorial, NOME_ARQUIVO_MATRIZ), mmap_mode='r')
+        if matriz.shape[0] != len(self.ids):
+            raise ValueError(f'Matriz vetorial inconsistente: {matriz.shape[0]} embeddings e {len(self.ids)} documentos')
+        self.quantizador = None
+        self.fator_candidatos = fator_candidatos
+        if quantizacao:
+            # a matriz completa é mantida no formato armazenado: apenas as linhas dos candidatos são convertidas
+            self.matriz = matriz
+            if quantizacao not in QUANTIZADORES:
+                raise ValueError(f'Quantização {quantizacao} não suportada ({", ".join(QUANTIZADORES)})')
+            try:
+                self.quantizador = QUANTIZADORES[quantizacao].carregar(url_matriz_vetorial)
+            except FileNotFoundError:
+                if fazer_log: print(f'--- matriz quantizada ({quantizacao}) não exportada: quantizando na inicialização...')
+                self.quantizador = QUANTIZADORES[quantizacao].calibrar(matriz)
+            # os índices dos candidatos são linhas da matriz: uma quantização de outra exportação não pode ser usada
+            if not self.quantizador.compativel(matriz.shape[0], matriz.shape[1]):
+                if fazer_log: print(f'--- matriz quantizada ({quantizacao}) não corresponde à matriz vetorial: quantizando na inicialização...')
+                self.quantizador = QUANTIZADORES[quantizacao].calibrar(matriz)
+        else:
+            # o NumPy não usa BLAS em float16: a matriz armazenada em float16 é convertida para float32 na carga
+            self.matriz = matriz if matriz.dtype == np.float32 else np.asarray(matriz, dtype=np.float32)
+        self.posicoes = {id_doc: idx for idx, id_doc in enumerate(self.ids)}
+        self.particoes = {}
+        self.__obter_particoes('titulo')
+        self.funcao_de_embeddings = funcao_de_embeddings
+        if fazer_log: print(f'--- matriz vetorial com {matriz.shape[0]} documentos e {matriz.shape[1]} dimensões ({matriz.dtype}{", quantização " + quantizacao if quantizacao else ""})')
+
+    def consultar_documentos(self, termos_de_consulta: str, num_resultados=configuracoes.num_documentos_retornados, embeddings_consulta: List[float]=None, filtros: dict=None) -> chromadb.QueryResult:
+        '''
+        Recupera os documentos mais similares aos termos de consulta
+
+        Parâmetros:
+            termos_de_consulta (str): texto da consulta
+            num_resultados (int): quantidade de documentos a serem recuperados
+            embeddings_consulta (List[float]): parâmetro opcional, embeddings já calculados para os termos de consulta.
+                                               Quando fornecido, evita que a função de embeddings seja executada novamente
+            filtros (dict): parâmetro opcional, valores aceitos de campos dos metadados (ex.: {'titulo': [...]}), conforme
+                            normalizar_filtros(); apenas documentos que atendem aos filtros são recuperados
+
+        Retorna:
+            (chromadb.QueryResult): resultado da consulta
+        '''
+        filtros = normalizar_filtros(filtros)
+        if embeddings_consulta is None:
+            embeddings_consulta = self.funcao_de_embeddings([termos_de_consulta])[0]
+        consulta = self.__normalizar(embeddings_consulta)
+        num_resultados = max(min(num_resultados, len(self.ids)), 0)
+
+        if filtros:
+            candidatos = self.__obter_linhas_filtro(filtros)
+            num_resultados = min(num_resultados, len(candidatos))
+            if len(candidatos) and candidatos[-1] - candidatos[0] + 1 == len(candidatos):
+                # partição contínua (um documento, na matriz exportada agrupada por título): fatia da matriz, sem cópia
+                linhas = self.matriz[candidatos[0]:candidatos[-1] + 1]
+            else:
+                linhas = self.matriz[candidatos]
+            similaridades = linhas.astype(np.float32, copy=False) @ consulta
+        elif self.quantizador is not None and num_resultados:
+            # leitura das linhas em ordem crescente, para aproveitar a localidade do mapeamento em memória
+            candidatos = np.sort(self.quantizador.candidatos(consulta, num_resultados * self.fator_candidatos))
+            similaridades = self.matriz[candidatos].astype(np.float32) @ consulta
+        else:
+            candidatos = None
+            similaridades = self.matriz @ consulta
+
+        posicoes = self.__selecionar_maiores(similaridades, num_resultados)
+        indices = posicoes if candidatos is None else candidatos[posicoes]
+
+        return {
+            'ids': [[self.ids[idx] for idx in indices]],
+            'documents': [[self.documentos[idx] for idx in indices]],
+            'metadatas': [[self.metadados[idx] for idx in indices]],
+            'distances': [[float(1 - similaridades[posicao]) for posicao in posicoes]],
+            'embeddings': None,
+            'uris': None,
+            'data': None,
+            'included': ['documents', 'metadatas', 'distances']
+        }
+
+    def obter_documentos(self, ids: List[str], embeddings_consulta: List[float]=None) -> dict:
+        indices = [self.posicoes[id_doc] for id_doc in ids if id_doc in self.posicoes]
+        distancias = None
+        if embeddings_consulta is not None:
+            distancias = (1 - self.matriz[indices].astype(np.float32) @ self.__normalizar(embeddings_consulta)).tolist()
+        return {
+            'ids': [self.ids[idx] for idx in indices],
+            'documents': [self.documentos[idx] for idx in indices],
+            'metadatas': [self.metadados[idx] for idx in indices],
+            'distances': distancias
+        }
+
+    def obter_ids(self, filtros: dict) -> List[str]:
+        return [self.ids[linha] for linha in self.__obter_linhas_filtro(normalizar_filtros(filtros) or {}).tolist()]
+
+    def __obter_particoes(self, campo: str) -> dict:
+        '''Linhas da matriz de cada valor do campo dos metadados (montadas uma vez por campo)'''
+        if campo not in self.particoes:
+            linhas_por_valor = {}
+            for idx, metadados in enumerate(self.metadados):
+                valor = (metadados or {}).get(campo)
+                if valor is not None:
+                    linhas_por_valor.setdefault(valor, []).append(idx)
+            self.particoes[campo] = {valor: np.array(linhas, dtype=np.int64) for valor, linhas in linhas_por_valor.items()}
+        return self.particoes[campo]
+
+    def __obter_linhas_filtro(self, filtros: dict) -> np.ndarray:
+        '''Linhas (em ordem crescente) dos documentos que atendem aos filtros'''
+        linhas = None
+        for campo, valores in filtros.items():
+            particoes = self.__obter_particoes(campo)
+            linhas_campo = [particoes[valor] for valor in valores if valor in particoes]
+            linhas_campo = np.unique(np.concatenate(linhas_campo)) if linhas_campo else np.empty(0, dtype=np.int64)
+            linhas = linhas_campo if linhas is None else np.intersect1d(linhas, linhas_campo, assume_unique=True)
+        return linhas if linhas is not None else np.arange(len(self.ids))
+
+    def __normalizar(self, embeddings: List[float]) -> np.ndarray:
+        vetor = np.asarray(embeddings, dtype=np.float32)
+        norma = np.linalg.norm(vetor)
+        return vetor / norma if norma > 0 else vetor
+
+    def __selecionar_maiores(self, valores: np.ndarray, num_resultados: int) -> np.ndarray:
+        '''Posições dos `num_resultados` maiores valores, em ordem decrescente'''
+        if num_resultados <= 0:
+            return np.empty(0, dtype=np.int64)
+        if num_resultados < len(valores):
+            # seleção dos k maiores em O(n); somente eles são ordenados
+            posicoes = np.argpartition(-valores, num_resultados - 1)[:num_resultados]
+            return posicoes[np.argsort(-valores[posicoes], kind='stable')]
+        return np.argsort(-valores, kind='stable')
+
+class InterfaceHibrida(InterfaceBancoVetorial):
+    '''
+    Especialização de InterfaceBancoVetorial que combina a busca densa (embeddings) de outra interface com a busca
+    léxica (BM25) sobre os mesmos documentos, fundindo as duas listas pela Reciprocal Rank Fusion (RRF): cada documento
+    recebe, em cada lista em que aparece, 1 / (k + posição), e os documentos são ordenados pela soma. Termos exatos
+    (ex.: 'Art. 57', 'licença-prêmio') recuperados pelo BM25 entram no resultado mesmo quando a busca densa os
+    classifica mal.
+
+    'distances' mantém a distância do cosseno entre a consulta e cada documento (calculada também para os documentos
+    encontrados apenas pelo BM25), de modo que os scores de distância continuam comparáveis; a ordem é a da fusão.
+    Com filtros, a busca densa os aplica diretamente, e a pontuação do BM25 é restrita aos documentos que os atendem
+    (ids obtidos da interface densa), de modo que filtros restritivos não esvaziam a lista de candidatos léxicos.
+
+    Atributos:
+        interface_densa (InterfaceBancoVetorial): interface usada na busca densa (ex.: InterfaceChroma)
+        indice_lexico (IndiceBM25): índice BM25 dos documentos da coleção
+        num_candidatos (int): quantidade de documentos recuperados de cada busca antes da fusão
+        k_rrf (int): constante k da RRF (valores maiores reduzem o peso das primeiras posições)
+        funcao_de_embeddings (EmbeddingFunction): função usada quando a consulta é feita sem embeddings
+    '''
+    def __init__(self,
+                 interface_densa: InterfaceBancoVetorial,
+                 indice_lexico,
+                 num_candidatos: int=configuracoes.busca_hibrida_num_candidatos,
+                 k_rrf: int=configuracoes.busca_hibrida_k_rrf,
+                 funcao_de_embeddings=None):
+        self.interface_densa = interface_densa
+        self.indice_lexico = indice_lexico
+        self.num_candidatos = num_candidatos
+        self.k_rrf = k_rrf
+        self.funcao_de_embeddings = funcao_de_embeddings
+
+    def consultar_documentos(self, termos_de_consulta: str, num_resultados=configuracoes.num_documentos_retornados, embeddings_consulta: List[float]=None, filtros: dict=None) -> chromadb.QueryResult:
+        '''
+        Recupera os documentos mais relevantes para a consulta, combinando as buscas densa e léxica
+
+        Parâmetros:
+            termos_de_consulta (str): texto da consulta
+            num_resultados (int): quantidade de documentos a serem recuperados
+            embeddings_consulta (List[float]): parâmetro opcional, embeddings já calculados para os termos de consulta.
+                                               Quando fornecido, evita que a função de embeddings seja executada novamente
+            filtros (dict): parâmetro opcional, valores aceitos de campos dos metadados (ex.: {'titulo': [...]}), conforme
+                            normalizar_filtros(); apenas documentos que atendem aos filtros são recuperados
+
+        Retorna:
+            (chromadb.QueryResult): resultado da consulta
+        '''
+        filtros = normalizar_filtros(filtros)
+        if embeddings_consulta is None and self.funcao_de_embeddings is not None:
+            embeddings_consulta = self.funcao_de_embeddings([termos_de_consulta])[0]
+        num_candidatos = max(num_resultados, self.num_candidatos)
+
+        resultado_denso = self.interface_densa.consultar_documentos(termos_de_consulta, num_candidatos, embeddings_consulta=embeddings_consulta, filtros=filtros)
+        ids_densos = resultado_denso['ids'][0]
+        # o índice BM25 não tem metadados: com filtros, a pontuação é restrita aos ids que os atendem
+        ids_permitidos = self.interface_densa.obter_ids(filtros) if filtros else None
+        ids_lexicos = [id_doc for id_doc, _ in self.indice_lexico.consultar(termos_de_consulta, num_candidatos, ids_permitidos=ids_permitidos)]
+        documentos = {
+            id_doc: (conteudo, metadados, distancia)
+            for id_doc, conteudo, metadados, distancia in zip(ids_densos, resultado_denso['documents'][0], resultado_denso['metadatas'][0], resultado_denso['distances'][0])
+        }
+
+        scores = {}
+        for ids in (ids_densos, ids_lexicos):
+            for posicao, id_doc in enumerate(ids, start=1):
+                scores[id_doc] = scores.get(id_doc, 0) + 1 / (self.k_rrf + posicao)
+        # em caso de empate, prevalece a ordem da busca densa (ordenação estável)
+        ids_fundidos = sorted(scores, key=scores.get, reverse=True)[:num_resultados]
+
+        ids_ausentes = [id_doc for id_doc in ids_fundidos if id_doc not in documentos]
+        if ids_ausentes:
+            self.__carregar_documentos(ids_ausentes, documentos, embeddings_consulta)
+            ids_fundidos = [id_doc for id_doc in ids_fundidos if id_doc in documentos]
+
+        return {
+            'ids': [ids_fundidos],
+            'documents': [[documentos[id_doc][0] for id_doc in ids_fundidos]],
+            'metadatas': [[documentos[id_doc][1] for id_doc in ids_fundidos]],
+            'distances': [[documentos[id_doc][2] for id_doc in ids_fundidos]],
+            'scores_rrf': [[scores[id_doc] for id_doc in ids_fundidos]],
+            'embeddings': None,
+            'uris': None,
+            'data': None,
+            'included': ['documents', 'metadatas', 'distances']
+        }
+
+    def __carregar_documentos(self, ids: List[str], documentos: dict, embeddings_consulta: List[float]):
+        '''Inclui em `documentos` conteúdo, metadados e distância dos documentos encontrados apenas pelo BM25'''
+        if not ids:
+            return
+        # sem embeddings da consulta, a distância é a máxima (similaridade 0)
+        resultado_lexico = self.interface_densa.obter_documentos(ids, embeddings_consulta=embeddings_consulta)
+        distancias = resultado_lexico['distances'] or [1.0] * len(resultado_lexico['ids'])
+        for id_doc, conteudo, metadados, distancia in zip(resultado_lexico['ids'], resultado_lexico['documents'], resultado_lexico['metadatas'], distancias):
+            documentos[id_doc] = (conteudo, metadados, distancia)
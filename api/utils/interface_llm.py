@@ -1,9 +1,9 @@
-import requests
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 
 import httpx
-import json
 from api.configuracoes.config_gerais import configuracoes
+from api.utils.decodificador_ndjson import DecodificadorNDJSON
+from api.utils.interface_banco_vetores import CAMPOS_FILTRO_METADADOS
 from typing import Dict, List, Optional, Tuple
 
 # Data model for chat interactions
@@ -17,6 +17,8 @@ class DadosChat(BaseModel):
         id_sessao (str): identificador da sessão, servindo para agrupar interações por sessão
         id_cliente(str): identificador do cliente inicializador da sessão
         intencao(str): identificador da intenção da pergunta, atribuída por um classificador
+        filtros(dict): filtros de metadados da consulta ao banco vetorial, campo -> valores aceitos (ex.: {'titulo': [...]}),
+                       com os campos de CAMPOS_FILTRO_METADADOS; quando ausentes, podem ser atribuídos pelo roteador de documentos
     '''
 
     pergunta: str
@@ -24,6 +26,18 @@ class DadosChat(BaseModel):
     id_sessao: str
     id_cliente: str
     intencao: Optional[str] = None
+    filtros: Optional[Dict[str, List[str]]] = None
+
+    @field_validator('filtros')
+    @classmethod
+    def validar_filtros(cls, filtros):
+        if filtros is None:
+            return None
+        campos_invalidos = [campo for campo in filtros if campo not in CAMPOS_FILTRO_METADADOS]
+        if campos_invalidos:
+            raise ValueError(f'Campos de filtro não suportados: {", ".join(campos_invalidos)} ({", ".join(CAMPOS_FILTRO_METADADOS)})')
+        # campos sem valores não restringem a consulta
+        return {campo: valores for campo, valores in filtros.items() if valores} or None
 
 class ClienteLLM:
     # Base client class for LLM interactions
@@ -54,15 +68,23 @@ class ClienteLLM:
     async def gerar_resposta_stream(self, mensagens: List[dict]):
         raise NotImplementedError('Método stream() não foi implantado para esta classe')
     
-    def health(self) -> int:
+    async def health(self) -> int:
         '''
         Teste simples de verificação se a API está ativa
 
-        Retorna o Status_code da requests.Response resultante da chamada À API
+        Retorna o Status_code da httpx.Response resultante da chamada À API
         '''
         raise NotImplementedError('Método health() não foi implantado para esta classe')
 
-    def gerar_embeddings(self, texto: str):
+    async def iniciar(self):
+        '''Prepara os recursos de comunicação com a API (conexões)'''
+        pass
+
+    async def encerrar(self):
+        '''Libera os recursos de comunicação com a API (conexões abertas)'''
+        pass
+
+    async def gerar_embeddings(self, texto: str):
         '''
         Utiliza o modelo do cliente para gerar embeddings do texto fornecido
 
@@ -82,7 +104,18 @@ class ClienteOllama(ClienteLLM):
     Consultar documentação para detalhes sobre os parâmetros: https://ollama.readthedocs.io/en/modelfile/#valid-parameters-and-values
     '''
 
-    def __init__(self, nome_modelo: str, url_llm: str, temperature: float=configuracoes.temperature, top_k: int=configuracoes.top_k, top_p: float=configuracoes.top_p, usar_raciocinio: bool=configuracoes.usar_raciocinio):
+    def __init__(self,
+                 nome_modelo: str,
+                 url_llm: str,
+                 temperature: float=configuracoes.temperature,
+                 top_k: int=configuracoes.top_k,
+                 top_p: float=configuracoes.top_p,
+                 usar_raciocinio: bool=configuracoes.usar_raciocinio,
+                 max_conexoes: int=configuracoes.ollama_max_conexoes,
+                 max_conexoes_keepalive: int=configuracoes.ollama_max_conexoes_keepalive,
+                 tempo_keepalive: float=configuracoes.ollama_tempo_keepalive,
+                 timeout_conexao: float=configuracoes.ollama_timeout_conexao,
+                 timeout_leitura: float=configuracoes.ollama_timeout_leitura):
         super().__init__(
             nome_modelo=nome_modelo,
             url_llm=url_llm,
@@ -95,16 +128,44 @@ class ClienteOllama(ClienteLLM):
         #   temperature = 0.8
         #   top_k = 40
         #   top_p = 0.9
+
+        # Um único cliente HTTP (com pool de conexões e keep-alive) é reaproveitado em todas as chamadas
+        self.limites_conexoes = httpx.Limits(
+            max_connections=max_conexoes,
+            max_keepalive_connections=max_conexoes_keepalive,
+            keepalive_expiry=tempo_keepalive)
+        self.timeout = httpx.Timeout(timeout_leitura, connect=timeout_conexao)
+        self.cliente_http = None
+
+    def obter_cliente_http(self) -> httpx.AsyncClient:
+        '''
+        Recupera o cliente HTTP compartilhado, criando-o caso ainda não exista
+
+        Retorna:
+            (httpx.AsyncClient): cliente assíncrono com pool de conexões
+        '''
+        if self.cliente_http is None or self.cliente_http.is_closed:
+            self.cliente_http = httpx.AsyncClient(base_url=self.url_llm, limits=self.limites_conexoes, timeout=self.timeout)
+        return self.cliente_http
+
+    async def iniciar(self):
+        '''Cria o cliente HTTP compartilhado'''
+        self.obter_cliente_http()
+
+    async def encerrar(self):
+        '''Fecha o cliente HTTP compartilhado e as conexões mantidas no pool'''
+        if self.cliente_http is not None:
+            await self.cliente_http.aclose()
+            self.cliente_http = None
         
-    def health(self) -> int:
+    async def health(self) -> int:
         # Teste simples de verificação se a API está ativa
         '''
         Teste simples de verificação se a API está ativa
 
-        Retorna o Status_code da requests.Response resultante da chamada À API
+        Retorna o Status_code da httpx.Response resultante da chamada À API
         '''
-        url_llm = f"{self.url_llm}/"
-        response_llm = requests.get(url_llm)
+        response_llm = await self.obter_cliente_http().get('/')
         return response_llm.status_code
 
     async def gerar_resposta_stream(self, mensagens: List[dict]):
@@ -120,7 +181,7 @@ class ClienteOllama(ClienteLLM):
         '''
 
         # Envia solicitação ao endpoint de geração de texto usando a opção de 'stream'
-        url = f"{self.url_llm}/api/chat"        
+        url = '/api/chat'
         payload = {
             "model": self.modelo,
             "messages": mensagens,
@@ -131,15 +192,15 @@ class ClienteOllama(ClienteLLM):
             "stream": True,
             # "max_new_tokens": 4096 # AFAZER: Considerar remover este atributo
         }
-        async with httpx.AsyncClient() as client:
-            async with client.stream("POST", url, json=payload, timeout=120) as resposta:
-                resposta.raise_for_status()
-                async for fragmento in resposta.aiter_bytes():
-                    if fragmento:
-                        try:
-                            yield json.loads(fragmento.decode())
-                        except:
-                            print('ERRO: falha na serialização do fragmento\n' + fragmento.decode())
+        decodificador = DecodificadorNDJSON()
+        async with self.obter_cliente_http().stream("POST", url, json=payload) as resposta:
+            resposta.raise_for_status()
+            async for fragmento in resposta.aiter_bytes():
+                # cada fragmento pode conter várias linhas NDJSON, ou só parte de uma
+                for objeto in decodificador.alimentar(fragmento):
+                    yield objeto
+            for objeto in decodificador.finalizar():
+                yield objeto
     
     async def gerar_resposta(self, mensagens: List[dict]):
         '''
@@ -154,7 +215,7 @@ class ClienteOllama(ClienteLLM):
         '''
 
         # Envia solicitação ao endpoint de geração de texto sem utilizar stream
-        url = f"{self.url_llm}/api/chat"        
+        url = '/api/chat'
         payload = {
             "model": self.modelo,
             "messages": mensagens,
@@ -165,10 +226,9 @@ class ClienteOllama(ClienteLLM):
             "stream": False
         }
 
-        async with httpx.AsyncClient(timeout=120) as client:
-            response = await client.post(url, json=payload)
-            response.raise_for_status()
-            return response.json()
+        response = await self.obter_cliente_http().post(url, json=payload)
+        response.raise_for_status()
+        return response.json()
     
     async def gerar_resposta_llm_json(self, mensagens: List[dict], formato:dict) -> str:
         '''
@@ -205,7 +265,7 @@ class ClienteOllama(ClienteLLM):
         '''
 
         # Envia solicitação ao endpoint de geração de texto utilizando o formato especificado de resposta
-        url = f"{self.url_llm}/api/chat"        
+        url = '/api/chat'
         payload = {
             "model": self.modelo,
             "messages": mensagens,
@@ -217,20 +277,20 @@ class ClienteOllama(ClienteLLM):
             "stream": False
         }
 
-        async with httpx.AsyncClient(timeout=120) as client:
-            response = await client.post(url, json=payload)
-            response.raise_for_status()
-            return response.json()
+        response = await self.obter_cliente_http().post(url, json=payload)
+        response.raise_for_status()
+        return response.json()
 
-    def gerar_embeddings(self, texto: str):
-        url_llm = f"{self.url_llm}/api/embed"
+    async def gerar_embeddings(self, texto: str):
+        url = '/api/embed'
         data = {
             "model": self.modelo,
             "input": texto
         }
 
-        resposta = requests.post(url_llm, json=data)
-        embeddings = json.loads(resposta.content)['embeddings']
+        resposta = await self.obter_cliente_http().post(url, json=data)
+        resposta.raise_for_status()
+        embeddings = resposta.json()['embeddings']
         return embeddings
 
 class ClienteOpenAi(ClienteLLM):
@@ -265,16 +325,16 @@ class ClienteOpenAi(ClienteLLM):
             "stream": True
         }
         
+        decodificador = DecodificadorNDJSON()
         async with httpx.AsyncClient() as client:
             async with client.stream("POST", url, json=payload, timeout=120) as resposta:
                 resposta.raise_for_status()
 
                 async for fragmento in resposta.aiter_bytes():
-                    if fragmento:
-                        try:
-                            yield json.loads(fragmento.decode())
-                        except:
-                            print('ERROR: Failed to deserialize fragment\n' + fragmento.decode())
+                    for objeto in decodificador.alimentar(fragmento):
+                        yield objeto
+                for objeto in decodificador.finalizar():
+                    yield objeto
     
 class InterfaceLLM:
     # Base interface class for LLM interactions
@@ -295,9 +355,17 @@ class InterfaceLLM:
         '''Inicializa interface LLM utilizando configurações definidas no arquivo de configurações'''
         self.definicoes_sistema = definicoes_sistema
         
-    def health(self) -> int:
+    async def health(self) -> int:
         raise NotImplementedError('Método health() não foi implantado para esta classe')
 
+    async def iniciar(self):
+        '''Prepara os recursos do cliente LLM'''
+        pass
+
+    async def encerrar(self):
+        '''Libera os recursos do cliente LLM'''
+        pass
+
     def formatar_mensagens_chat(self, prompt_usuario: str, historico: List[Tuple[str, str]]) -> List[Dict[str, str]]:
         # Formats chat messages with system instructions and history
         '''
@@ -356,9 +424,17 @@ class InterfaceOllama(InterfaceLLM):
         super().__init__(definicoes_sistema=definicoes_sistema)
         self.cliente_ollama = ClienteOllama(url_llm=url_ollama, nome_modelo=nome_modelo, temperature=temperature, top_k=top_k, top_p=top_p)
         
-    def health(self) -> int:
+    async def health(self) -> int:
         '''Teste simples de verificação se a API está ativa'''
-        return self.cliente_ollama.health()
+        return await self.cliente_ollama.health()
+
+    async def iniciar(self):
+        '''Cria o cliente HTTP do Ollama, reaproveitado durante todo o ciclo de vida da aplicação'''
+        await self.cliente_ollama.iniciar()
+
+    async def encerrar(self):
+        '''Fecha as conexões mantidas pelo cliente Ollama'''
+        await self.cliente_ollama.encerrar()
         
     async def gerar_resposta_llm_stream(self, prompt_usuario: str, historico: List[Tuple[str, str]]):
         '''
@@ -0,0 +1,147 @@
+import os
+
+import numpy as np
+
+# arquivos gravados na pasta da matriz vetorial (ver api.dados.exportar_matriz_vetorial)
+NOME_ARQUIVO_INT8 = 'embeddings_int8.npy'
+NOME_ARQUIVO_CALIBRACAO_INT8 = 'calibracao_int8.npz'
+NOME_ARQUIVO_BINARIO = 'embeddings_binario.npy'
+
+# quantidade de bits 1 em cada byte, para o cálculo da distância de Hamming
+BITS_POR_BYTE = np.array([bin(valor).count('1') for valor in range(256)], dtype=np.uint16)
+
+
+class QuantizadorInt8:
+    '''
+    Quantização escalar dos embeddings em int8, com calibração por dimensão: cada dimensão d é mapeada linearmente
+    do intervalo [minimo[d], maximo[d]] observado nos documentos (limitado aos percentis informados, para que valores
+    extremos não reduzam a resolução) para os 256 valores do int8. A matriz ocupa 1/4 da matriz em float32.
+
+    A similaridade aproximada entre a consulta q e um documento é Σ q[d] * (minimo[d] + escala[d] * (codigo[d] + 128)).
+    Os termos que não dependem do documento são iguais para todos, de modo que a ordenação é dada por codigos @ (q * escala).
+
+    Atributos:
+        ARQUIVOS (tuple): arquivos gravados na pasta da matriz vetorial
+        codigos (np.ndarray): matriz quantizada (int8)
+        minimo (np.ndarray): menor valor de cada dimensão
+        escala (np.ndarray): largura do intervalo de cada código, por dimensão
+        tamanho_bloco (int): quantidade de linhas convertidas para float32 por vez na consulta
+    '''
+
+    ARQUIVOS = (NOME_ARQUIVO_INT8, NOME_ARQUIVO_CALIBRACAO_INT8)
+
+    def __init__(self, codigos: np.ndarray, minimo: np.ndarray, escala: np.ndarray, tamanho_bloco: int=8192):
+        self.codigos = codigos
+        self.minimo = minimo
+        self.escala = escala
+        self.tamanho_bloco = tamanho_bloco
+
+    @classmethod
+    def calibrar(cls, matriz: np.ndarray, percentil: float=99.9, tamanho_bloco: int=8192) -> 'QuantizadorInt8':
+        '''
+        Calibra o intervalo de cada dimensão e quantiza a matriz
+
+        Parâmetros:
+            matriz (np.ndarray): embeddings normalizados (uma linha por documento)
+            percentil (float): percentil superior (e o inferior correspondente) usado como limite de cada dimensão
+        '''
+
+        matriz = np.asarray(matriz, dtype=np.float32)
+        if len(matriz):
+            minimo = np.percentile(matriz, 100 - percentil, axis=0).astype(np.float32)
+            maximo = np.percentile(matriz, percentil, axis=0).astype(np.float32)
+        else:
+            minimo = maximo = np.zeros(matriz.shape[1], dtype=np.float32)
+        escala = (maximo - minimo) / 255
+        escala[escala == 0] = 1e-8
+        codigos = np.clip(np.rint((matriz - minimo) / escala), 0, 255) - 128
+        return cls(codigos.astype(np.int8), minimo, escala.astype(np.float32), tamanho_bloco=tamanho_bloco)
+
+    def similaridades(self, consulta: np.ndarray) -> np.ndarray:
+        '''Similaridade aproximada (a menos de uma constante) entre a consulta e cada documento'''
+        pesos = consulta * self.escala
+        resultado = np.empty(len(self.codigos), dtype=np.float32)
+        # conversão para float32 em blocos, para que a cópia temporária não tenha o tamanho da matriz inteira
+        for inicio in range(0, len(self.codigos), self.tamanho_bloco):
+            bloco = self.codigos[inicio:inicio + self.tamanho_bloco]
+            resultado[inicio:inicio + len(bloco)] = bloco.astype(np.float32) @ pesos
+        return resultado
+
+    def candidatos(self, consulta: np.ndarray, num_candidatos: int) -> np.ndarray:
+        similaridades = self.similaridades(consulta)
+        if num_candidatos >= len(similaridades):
+            return np.arange(len(similaridades))
+        return np.argpartition(-similaridades, num_candidatos - 1)[:num_candidatos]
+
+    def salvar(self, url_pasta: str, sufixo: str=''):
+        '''Grava os arquivos da quantização, com `sufixo` ao final dos nomes (ex.: '.tmp', para gravação atômica)'''
+        with open(os.path.join(url_pasta, NOME_ARQUIVO_INT8 + sufixo), 'wb') as arq:
+            np.save(arq, self.codigos)
+        with open(os.path.join(url_pasta, NOME_ARQUIVO_CALIBRACAO_INT8 + sufixo), 'wb') as arq:
+            np.savez(arq, minimo=self.minimo, escala=self.escala)
+
+    @classmethod
+    def carregar(cls, url_pasta: str) -> 'QuantizadorInt8':
+        with np.load(os.path.join(url_pasta, NOME_ARQUIVO_CALIBRACAO_INT8), allow_pickle=False) as calibracao:
+            minimo, escala = calibracao['minimo'], calibracao['escala']
+        return cls(np.load(os.path.join(url_pasta, NOME_ARQUIVO_INT8)), minimo, escala)
+
+    def num_bytes(self) -> int:
+        return self.codigos.nbytes + self.minimo.nbytes + self.escala.nbytes
+
+    def compativel(self, num_documentos: int, num_dimensoes: int) -> bool:
+        '''Verifica se a quantização corresponde a uma matriz com as dimensões informadas'''
+        return self.codigos.shape == (num_documentos, num_dimensoes) \
+               and self.minimo.shape == (num_dimensoes,) and self.escala.shape == (num_dimensoes,)
+
+class QuantizadorBinario:
+    '''
+    Quantização binária dos embeddings pelo sinal de cada dimensão (1 bit por dimensão, 1/32 da matriz em float32).
+    Os candidatos são os documentos com menor distância de Hamming entre os bits do documento e os da consulta, que
+    aproxima a distância angular entre os vetores.
+
+    Atributos:
+        ARQUIVOS (tuple): arquivos gravados na pasta da matriz vetorial
+        bits (np.ndarray): sinais das dimensões, agrupados em bytes (np.packbits)
+    '''
+
+    ARQUIVOS = (NOME_ARQUIVO_BINARIO,)
+
+    def __init__(self, bits: np.ndarray):
+        self.bits = bits
+
+    @classmethod
+    def calibrar(cls, matriz: np.ndarray, **kwargs) -> 'QuantizadorBinario':
+        return cls(np.packbits(np.asarray(matriz) > 0, axis=1))
+
+    def distancias(self, consulta: np.ndarray) -> np.ndarray:
+        '''Distância de Hamming entre a consulta e cada documento'''
+        bits_consulta = np.packbits(consulta > 0)
+        return BITS_POR_BYTE[np.bitwise_xor(self.bits, bits_consulta)].sum(axis=1)
+
+    def candidatos(self, consulta: np.ndarray, num_candidatos: int) -> np.ndarray:
+        distancias = self.distancias(consulta)
+        if num_candidatos >= len(distancias):
+            return np.arange(len(distancias))
+        return np.argpartition(distancias, num_candidatos - 1)[:num_candidatos]
+
+    def salvar(self, url_pasta: str, sufixo: str=''):
+        '''Grava os arquivos da quantização, com `sufixo` ao final dos nomes (ex.: '.tmp', para gravação atômica)'''
+        with open(os.path.join(url_pasta, NOME_ARQUIVO_BINARIO + sufixo), 'wb') as arq:
+            np.save(arq, self.bits)
+
+    @classmethod
+    def carregar(cls, url_pasta: str) -> 'QuantizadorBinario':
+        return cls(np.load(os.path.join(url_pasta, NOME_ARQUIVO_BINARIO)))
+
+    def num_bytes(self) -> int:
+        return self.bits.nbytes
+
+    def compativel(self, num_documentos: int, num_dimensoes: int) -> bool:
+        '''Verifica se a quantização corresponde a uma matriz com as dimensões informadas'''
+        return self.bits.shape == (num_documentos, (num_dimensoes + 7) // 8)
+
+QUANTIZADORES = {
+    'int8': QuantizadorInt8,
+    'binario': QuantizadorBinario
+}
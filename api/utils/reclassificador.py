@@ -1,86 +1,194 @@
+from hashlib import sha256
+from typing import List
 from transformers import BertTokenizer, BertForQuestionAnswering
 import torch
 
 from api.configuracoes.config_gerais import configuracoes
+from api.utils.cache import CacheLRU, CacheSQLite
 
 class Reclassificador:
     '''
     Classe que pode ser utilizada para realização de reestimação
+
+    Os resultados podem ser memorizados em um cache em memória (`cache`) e, opcionalmente, em disco
+    (`cache_disco`), indexados pelo hash da pergunta, pelo id do fragmento e pelo nome do modelo. As subclasses
+    implementam apenas calcular_reclassificacoes(), chamado para os pares ainda não presentes no cache.
     '''
-    def __init__(self, modelo, tokenizador, device=configuracoes.device, fazer_log=True):
+    nome_modelo = None
+    cache = None
+    cache_disco = None
+
+    def __init__(self, modelo, tokenizador, device=configuracoes.device, fazer_log=True, cache: CacheLRU=None, cache_disco: CacheSQLite=None):
         self.device = device
         self.modelo = modelo
         self.tokenizador = tokenizador
+        self.cache = cache
+        self.cache_disco = cache_disco
     
-    def reclassificar_documento(self, pergunta, texto_documento: str):
-        raise NotImplementedError('Método estimar_resposta() não foi implantado para esta classe') 
+    def reclassificar_documento(self, pergunta, texto_documento: str, id_documento: str=None):
+        ids_documentos = [id_documento] if id_documento else None
+        return self.reclassificar_documentos(pergunta=pergunta, textos_documentos=[texto_documento], ids_documentos=ids_documentos)[0]
+
+    def reclassificar_documentos(self, pergunta, textos_documentos: List[str], ids_documentos: List[str]=None) -> List[dict]:
+        '''
+        Reclassifica um conjunto de documentos em relação a uma pergunta, reaproveitando os resultados já calculados
+
+        Parâmetros:
+            pergunta (str): pergunta feita pelo usuário
+            textos_documentos (List[str]): textos dos documentos a serem reclassificados
+            ids_documentos (List[str]): parâmetro opcional, ids dos documentos (na mesma ordem dos textos), usados como
+                                        chave do cache. Quando não informados, é utilizado o hash do texto do documento
+
+        Retorna:
+            (List[dict]): para cada documento, na mesma ordem recebida, um dicionário com as chaves
+                          'resposta', 'score' e 'score_ponderado'
+        '''
+
+        if self.cache is None and self.cache_disco is None:
+            return self.calcular_reclassificacoes(pergunta, textos_documentos)
+
+        if ids_documentos is None:
+            ids_documentos = [sha256(texto.encode('utf-8')).hexdigest() for texto in textos_documentos]
+        hash_pergunta = sha256(pergunta.encode('utf-8')).hexdigest()
+        chaves = [f'{self.nome_modelo}|{hash_pergunta}|{id_documento}' for id_documento in ids_documentos]
+
+        resultados = [self.__obter_do_cache(chave) for chave in chaves]
+        indices_ausentes = [idx for idx, resultado in enumerate(resultados) if resultado is None]
+        if indices_ausentes:
+            novos_resultados = self.calcular_reclassificacoes(pergunta, [textos_documentos[idx] for idx in indices_ausentes])
+            for idx, resultado in zip(indices_ausentes, novos_resultados):
+                resultados[idx] = resultado
+                if self.cache is not None:
+                    self.cache.armazenar(chaves[idx], resultado)
+            if self.cache_disco is not None:
+                self.cache_disco.armazenar_varios([(chaves[idx], resultados[idx]) for idx in indices_ausentes])
+
+        # cópias, para que alterações feitas por quem chamou não afetem os valores em cache
+        return [dict(resultado) for resultado in resultados]
+
+    def __obter_do_cache(self, chave: str) -> dict:
+        if self.cache is not None:
+            resultado = self.cache.obter(chave)
+            if resultado is not None:
+                return resultado
+        if self.cache_disco is not None:
+            resultado = self.cache_disco.obter(chave)
+            if resultado is not None:
+                # JSON não preserva tuplas
+                resultado['score'] = tuple(resultado['score'])
+                if self.cache is not None:
+                    self.cache.armazenar(chave, resultado)
+                return resultado
+        return None
+
+    def calcular_reclassificacoes(self, pergunta, textos_documentos: List[str]) -> List[dict]:
+        raise NotImplementedError('Método calcular_reclassificacoes() não foi implantado para esta classe')
 
 class ReclassificadorBert(Reclassificador):
-    def __init__(self, device=configuracoes.device, fazer_log=True):
+    def __init__(self, device=configuracoes.device, fazer_log=True, tamanho_lote: int=configuracoes.tamanho_lote_reclassificacao, cache: CacheLRU=None, cache_disco: CacheSQLite=None):
         # Carregando modelo e tokenizador pre-treinados
         # optou-se por não usar pipeline, por ser mais lento que usar o modelo diretamente
         if fazer_log: print(f'--- preparando modelo e tokenizador do Bert (usando {configuracoes.embedding_squad_portuguese})...')
         self.device = device
+        self.tamanho_lote = tamanho_lote
+        self.nome_modelo = configuracoes.embedding_squad_portuguese
+        self.cache = cache
+        self.cache_disco = cache_disco
         self.modelo_bert_qa = BertForQuestionAnswering.from_pretrained(configuracoes.embedding_squad_portuguese, cache_dir=configuracoes.url_cache_modelos).to(self.device)
         self.tokenizador_bert = BertTokenizer.from_pretrained(configuracoes.embedding_squad_portuguese, device=self.device, cache_dir=configuracoes.url_cache_modelos)
     
-    def reclassificar_documento(self, pergunta, texto_documento: str):
-        inputs = self.tokenizador_bert.encode_plus(
-            pergunta,
-            texto_documento,
+    def calcular_reclassificacoes(self, pergunta, textos_documentos: List[str]) -> List[dict]:
+        '''
+        Reclassifica um conjunto de documentos em relação a uma pergunta, aplicando o Bert em lote
+        (uma única passagem pelo modelo para cada lote de até `tamanho_lote` documentos)
+
+        Parâmetros:
+            pergunta (str): pergunta feita pelo usuário
+            textos_documentos (List[str]): textos dos documentos a serem reclassificados
+
+        Retorna:
+            (List[dict]): para cada documento, na mesma ordem recebida, um dicionário com as chaves
+                          'resposta', 'score' e 'score_ponderado'
+        '''
+
+        resultados = []
+        tamanho_lote = self.tamanho_lote if self.tamanho_lote else max(len(textos_documentos), 1)
+        for inicio in range(0, len(textos_documentos), tamanho_lote):
+            resultados += self.__reclassificar_lote(pergunta, textos_documentos[inicio:inicio + tamanho_lote])
+        return resultados
+
+    def __reclassificar_lote(self, pergunta, textos_documentos: List[str]) -> List[dict]:
+        inputs = self.tokenizador_bert(
+            [pergunta] * len(textos_documentos),
+            textos_documentos,
             return_tensors="pt",
+            padding=True,
             truncation=True,
             max_length=512
         )
 
         inputs = {key: value.to(self.device) for key, value in inputs.items()}
-        
+
         with torch.no_grad():
             outputs = self.modelo_bert_qa(**inputs)
 
         # AFAZER: Avaliar se score ponderado faz sentido
-        # Extraindo os logits como tensores
-        logits_inicio = outputs.start_logits
-        logits_fim = outputs.end_logits
-
-        # Obtenção dos logits positivos
-        logits_inicio_positivos = logits_inicio[0][logits_inicio[0] > 0]
-        logits_fim_positivos = logits_fim[0][logits_fim[0] > 0]
+        # Extraindo os logits como tensores. As posições de padding são mascaradas,
+        # para que o resultado de cada documento seja idêntico ao obtido individualmente
+        mascara = inputs['attention_mask'].bool()
+        logits_inicio = outputs.start_logits.masked_fill(~mascara, float('-inf'))
+        logits_fim = outputs.end_logits.masked_fill(~mascara, float('-inf'))
 
-        # Média dos logits positivos
-        media_logits_inicio_positivos = logits_inicio_positivos.mean().item() if logits_inicio_positivos.numel() > 0 else 0
-        media_logits_fim_positivos = logits_fim_positivos.mean().item() if logits_fim_positivos.numel() > 0 else 0
+        # Média dos logits positivos (fora do padding)
+        mascara_inicio_positivos = logits_inicio > 0
+        mascara_fim_positivos = logits_fim > 0
+        qtd_inicio_positivos = mascara_inicio_positivos.sum(dim=-1)
+        qtd_fim_positivos = mascara_fim_positivos.sum(dim=-1)
+        media_logits_inicio_positivos = torch.where(
+            qtd_inicio_positivos > 0,
+            torch.where(mascara_inicio_positivos, logits_inicio, torch.zeros_like(logits_inicio)).sum(dim=-1) / qtd_inicio_positivos.clamp(min=1),
+            torch.zeros_like(qtd_inicio_positivos, dtype=logits_inicio.dtype))
+        media_logits_fim_positivos = torch.where(
+            qtd_fim_positivos > 0,
+            torch.where(mascara_fim_positivos, logits_fim, torch.zeros_like(logits_fim)).sum(dim=-1) / qtd_fim_positivos.clamp(min=1),
+            torch.zeros_like(qtd_fim_positivos, dtype=logits_fim.dtype))
 
         # Obtendo os índices e valores dos melhores logits
-        indice_melhor_logit_inicio = logits_inicio[0].argmax().item()
-        melhor_logit_inicio = logits_inicio[0][indice_melhor_logit_inicio].item()
-
-        indice_melhor_logit_fim = logits_fim[0].argmax().item()
-        melhor_logit_fim = logits_fim[0][indice_melhor_logit_fim].item()
+        melhores_logits_inicio, indices_melhor_logit_inicio = logits_inicio.max(dim=-1)
+        melhores_logits_fim, indices_melhor_logit_fim = logits_fim.max(dim=-1)
 
         # Calcula media_logits_positivos
         media_logits_positivos = (media_logits_inicio_positivos + media_logits_fim_positivos) / 2
 
-        # scores em formato float para serialização com JSON
-        score_soma_logits = float(melhor_logit_inicio + melhor_logit_fim)
-        score_ponderado = float(score_soma_logits * media_logits_positivos)
+        scores_soma_logits = melhores_logits_inicio + melhores_logits_fim
+        scores_ponderados = scores_soma_logits * media_logits_positivos
 
         # calculando score estimado
         start_logits_softmax = torch.softmax(logits_inicio, dim=-1)
         end_logits_softmax = torch.softmax(logits_fim, dim=-1)
-        score_estimado = float(torch.max(start_logits_softmax).item() * torch.max(end_logits_softmax).item())
+        scores_estimados = start_logits_softmax.max(dim=-1).values * end_logits_softmax.max(dim=-1).values
 
         # score: soma do melhor Logit inicial com o melhor logit final
         # score_estimado: multiplicação do softmax dos logits de inicio pelo dos logits de fim
         # -- (manter somente se a performance do score do Bert pelo pipeline ficar lenta)
-        # score_ponderado: score ponderado pela média dos logits de inicio e fim, só quando positivos 
+        # score_ponderado: score ponderado pela média dos logits de inicio e fim, só quando positivos
         # -- (quanto mais logits positivos, mais o documento tem melhor avaliação)
 
-        tokens_resposta = inputs['input_ids'][0][indice_melhor_logit_inicio:indice_melhor_logit_fim + 1]
-        resposta = self.tokenizador_bert.decode(tokens_resposta, skip_special_tokens=True)
-        
-        return {
-            'resposta': resposta,
-            'score': (score_estimado, score_soma_logits),
-            'score_ponderado': score_ponderado
-        }
\ No newline at end of file
+        # scores em formato float para serialização com JSON
+        scores_estimados = scores_estimados.tolist()
+        scores_soma_logits = scores_soma_logits.tolist()
+        scores_ponderados = scores_ponderados.tolist()
+        indices_melhor_logit_inicio = indices_melhor_logit_inicio.tolist()
+        indices_melhor_logit_fim = indices_melhor_logit_fim.tolist()
+
+        resultados = []
+        for idx in range(len(textos_documentos)):
+            tokens_resposta = inputs['input_ids'][idx][indices_melhor_logit_inicio[idx]:indices_melhor_logit_fim[idx] + 1]
+            resposta = self.tokenizador_bert.decode(tokens_resposta, skip_special_tokens=True)
+            resultados.append({
+                'resposta': resposta,
+                'score': (float(scores_estimados[idx]), float(scores_soma_logits[idx])),
+                'score_ponderado': float(scores_ponderados[idx])
+            })
+
+        return resultados
@@ -0,0 +1,59 @@
+import re
+from typing import Dict
+
+from api.utils.texto import normalizar_string
+
+
+def normalizar_termos(texto: str) -> str:
+    '''Texto sem acentos, em minúsculas, reduzido a palavras separadas por um espaço. Ex.: 'Auxílio-Saúde?' -> 'auxilio saude' '''
+    return normalizar_string(texto).replace('_', ' ')
+
+class RoteadorDocumentos:
+    '''
+    Roteador de perguntas por palavras-chave: quando a pergunta cita expressões associadas a documentos específicos
+    (ex.: 'regimento interno', 'auxílio saúde'), monta o filtro de metadados que restringe a consulta ao banco vetorial
+    a esses documentos (ver InterfaceBancoVetorial.consultar_documentos).
+
+    As expressões de cada documento são as da chave 'palavras_chave' do índice de documentos. A comparação desconsidera
+    acentos, caixa e pontuação, e as expressões devem ocorrer como palavras inteiras. Todas as expressões são reunidas em
+    uma única expressão regular, de modo que a pergunta é percorrida uma só vez.
+
+    Atributos:
+        campo_filtro (str): campo dos metadados usado no filtro
+        valores_por_expressao (Dict[str, List[str]]): expressão normalizada -> valores do campo dos documentos associados
+        padrao (re.Pattern): expressão regular com todas as expressões (None se nenhum documento tem palavras-chave)
+    '''
+
+    def __init__(self, indice_documentos: Dict[str, dict], campo_filtro: str='titulo'):
+        '''
+        Parâmetros:
+            indice_documentos (Dict[str, dict]): índice de documentos (rótulo -> informações, como em index.json)
+            campo_filtro (str): campo dos metadados dos fragmentos usado no filtro ('titulo' ou 'documento', com o rótulo)
+        '''
+
+        self.campo_filtro = campo_filtro
+        self.valores_por_expressao = {}
+        for rotulo, info in indice_documentos.items():
+            valor = rotulo if campo_filtro == 'documento' else info.get(campo_filtro)
+            for expressao in info.get('palavras_chave', []):
+                expressao = normalizar_termos(expressao)
+                if expressao and valor not in self.valores_por_expressao.setdefault(expressao, []):
+                    self.valores_por_expressao[expressao].append(valor)
+
+        # expressões mais longas primeiro, para que prevaleçam sobre expressões contidas nelas
+        expressoes = sorted(self.valores_por_expressao, key=len, reverse=True)
+        self.padrao = re.compile(r'\b(' + '|'.join(re.escape(expressao) for expressao in expressoes) + r')\b') if expressoes else None
+
+    def obter_filtros(self, pergunta: str) -> dict:
+        '''
+        Monta o filtro de metadados para a pergunta
+
+        Retorna:
+            (dict): {campo_filtro: [valores]} com os documentos citados na pergunta, ou None se nenhum é citado
+        '''
+        if self.padrao is None:
+            return None
+        valores = []
+        for expressao in self.padrao.findall(normalizar_termos(pergunta)):
+            valores += [valor for valor in self.valores_por_expressao[expressao] if valor not in valores]
+        return {self.campo_filtro: valores} if valores else None
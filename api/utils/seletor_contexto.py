@@ -0,0 +1,153 @@
+from math import ceil
+from typing import Callable, List
+
+from api.configuracoes.config_gerais import configuracoes
+
+
+def criar_contador_tokens(nome_tokenizador: str=None, caracteres_por_token: float=3.5) -> Callable[[str], int]:
+    '''
+    Cria uma função que conta os tokens de um texto
+
+    Parâmetros:
+        nome_tokenizador (str): parâmetro opcional, nome do tokenizador (Hugging Face) correspondente ao LLM.
+                                Quando não informado, a quantidade de tokens é estimada pela quantidade de caracteres
+        caracteres_por_token (float): média de caracteres por token usada na estimativa
+
+    Retorna:
+        (Callable[[str], int]): função que recebe um texto e retorna a quantidade de tokens
+    '''
+
+    if nome_tokenizador:
+        from transformers import AutoTokenizer
+        tokenizador = AutoTokenizer.from_pretrained(nome_tokenizador, cache_dir=configuracoes.url_cache_modelos)
+        return lambda texto: len(tokenizador.encode(texto, add_special_tokens=False))
+    return lambda texto: ceil(len(texto) / caracteres_por_token)
+
+class SeletorContexto:
+    '''
+    Seleciona, entre os documentos recuperados (e reclassificados), os que serão incluídos no prompt do LLM:
+        1. descarta os documentos com score abaixo dos limiares configurados;
+        2. agrupa fragmentos de um mesmo artigo, que repetem o caput, incluindo o caput uma única vez;
+        3. limita a quantidade total de tokens do contexto.
+
+    A ordem dos documentos recebidos é mantida, e o primeiro bloco é sempre incluído, mesmo que exceda o limite.
+
+    Atributos:
+        orcamento_tokens (int): quantidade máxima de tokens do contexto (None: sem limite)
+        score_minimo_bert (float): valor mínimo do score estimado pelo Bert (None: não aplica o filtro)
+        score_minimo_distancia (float): valor mínimo da similaridade do cosseno (None: não aplica o filtro)
+        contador_tokens (Callable[[str], int]): função que conta os tokens de um texto
+        min_palavras_caput (int): quantidade mínima de palavras iniciais em comum para que dois fragmentos de uma
+                                  mesma fonte sejam considerados partes do mesmo artigo
+    '''
+
+    def __init__(self,
+                 orcamento_tokens: int=configuracoes.selecao_contexto_orcamento_tokens,
+                 score_minimo_bert: float=configuracoes.selecao_contexto_score_minimo_bert,
+                 score_minimo_distancia: float=configuracoes.selecao_contexto_score_minimo_distancia,
+                 contador_tokens: Callable[[str], int]=None,
+                 min_palavras_caput: int=5):
+        self.orcamento_tokens = orcamento_tokens
+        self.score_minimo_bert = score_minimo_bert
+        self.score_minimo_distancia = score_minimo_distancia
+        self.contador_tokens = contador_tokens if contador_tokens else criar_contador_tokens()
+        self.min_palavras_caput = min_palavras_caput
+
+    def selecionar(self, documentos: List[dict]) -> List[dict]:
+        '''
+        Seleciona os documentos a serem incluídos no prompt
+
+        Parâmetros:
+            documentos (List[dict]): documentos no formato de GeradorDeRespostas.formatar_lista_documentos, já ordenados.
+                                     O filtro do Bert só é aplicado aos documentos que possuem 'score_bert'
+
+        Retorna:
+            (List[dict]): blocos de contexto, com as chaves 'ids' (ids dos documentos agrupados no bloco),
+                          'titulo' e 'conteudo'
+        '''
+
+        documentos_filtrados = [documento for documento in documentos if self.__atende_limiares(documento)]
+        # nenhum documento atende aos limiares: mantém o mais bem classificado
+        if not documentos_filtrados and documentos:
+            documentos_filtrados = documentos[:1]
+
+        blocos = self.__agrupar_fragmentos(documentos_filtrados)
+
+        selecionados = []
+        total_tokens = 0
+        for bloco in blocos:
+            num_tokens = self.contador_tokens(self.formatar_bloco(bloco))
+            if selecionados and self.orcamento_tokens and total_tokens + num_tokens > self.orcamento_tokens:
+                break
+            selecionados.append(bloco)
+            total_tokens += num_tokens
+        return selecionados
+
+    def formatar_bloco(self, bloco: dict) -> str:
+        return f"{bloco['titulo']} - {bloco['conteudo']}"
+
+    def __atende_limiares(self, documento: dict) -> bool:
+        if self.score_minimo_distancia is not None and documento['score_distancia'] < self.score_minimo_distancia:
+            return False
+        if self.score_minimo_bert is not None and 'score_bert' in documento and documento['score_bert'][0] < self.score_minimo_bert:
+            return False
+        return True
+
+    def __agrupar_fragmentos(self, documentos: List[dict]) -> List[dict]:
+        blocos = []
+        for documento in documentos:
+            palavras = documento['conteudo'].split(' ')
+            bloco_artigo = None
+            for bloco in blocos:
+                if bloco['fonte'] == documento['metadados'].get('fonte') and \
+                   self.__num_palavras_em_comum(bloco['fragmentos'][0], palavras) >= self.min_palavras_caput:
+                    bloco_artigo = bloco
+                    break
+
+            if bloco_artigo is None:
+                blocos.append({
+                    'ids': [documento['id']],
+                    'titulo': documento['metadados']['titulo'],
+                    'fonte': documento['metadados'].get('fonte'),
+                    'fragmentos': [palavras]
+                })
+            else:
+                bloco_artigo['ids'].append(documento['id'])
+                bloco_artigo['fragmentos'].append(palavras)
+
+        return [
+            {'ids': bloco['ids'], 'titulo': bloco['titulo'], 'conteudo': self.__unir_fragmentos(bloco['fragmentos'])}
+            for bloco in blocos
+        ]
+
+    def __unir_fragmentos(self, fragmentos: List[List[str]]) -> str:
+        '''Une fragmentos de um mesmo artigo, incluindo o caput (início comum a todos eles) uma única vez'''
+        if len(fragmentos) == 1:
+            return ' '.join(fragmentos[0])
+
+        num_caput = min(self.__num_palavras_em_comum(fragmentos[0], fragmento) for fragmento in fragmentos[1:])
+        # o início comum pode avançar sobre marcadores do dispositivo seguinte (ex.: '§'): recua até o fim de uma frase
+        # ou, se o caput ficar curto demais, até a última palavra com letras
+        num_fim_frase = num_caput
+        while num_fim_frase > 0 and fragmentos[0][num_fim_frase - 1][-1:] not in ('.', ':', ';'):
+            num_fim_frase -= 1
+        if num_fim_frase >= self.min_palavras_caput:
+            num_caput = num_fim_frase
+        else:
+            while num_caput > 0 and not any(c.isalpha() for c in fragmentos[0][num_caput - 1]):
+                num_caput -= 1
+
+        partes = [' '.join(fragmentos[0])]
+        for fragmento in fragmentos[1:]:
+            restante = ' '.join(fragmento[num_caput:])
+            if restante and restante not in partes[0] and restante not in partes:
+                partes.append(restante)
+        return ' '.join(partes)
+
+    def __num_palavras_em_comum(self, palavras_a: List[str], palavras_b: List[str]) -> int:
+        num = 0
+        for palavra_a, palavra_b in zip(palavras_a, palavras_b):
+            if palavra_a != palavra_b:
+                break
+            num += 1
+        return num
@@ -0,0 +1,24 @@
+import re
+import unicodedata
+
+
+def remover_acentos(s: str) -> str:
+    '''Normaliza o texto (NFD) e remove os acentos (diacríticos)'''
+    s = unicodedata.normalize('NFD', s)
+    return ''.join(c for c in s if unicodedata.category(c) != 'Mn')
+
+def normalizar_string(s: str) -> str:
+    '''
+    Normaliza um texto para uso como identificador ou chave: remove acentos, converte para minúsculas
+    e substitui sequências de caracteres não alfanuméricos (inclusive espaços) por um único underscore
+
+    Ex.: 'Como funciona a  venda de Férias?' -> 'como_funciona_a_venda_de_ferias'
+    '''
+    s = remover_acentos(s)
+    # Converte para letras minúsculas
+    s = s.lower()
+    # Substitui caracteres não alfanuméricos por underscores (_)
+    s = re.sub(r'[^a-z0-9]+', '_', s)
+    # Remove underscores duplicados e também os do início e do fim
+    s = re.sub(r'_+', '_', s).strip('_')
+    return s